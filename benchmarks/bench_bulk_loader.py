@@ -0,0 +1,155 @@
+"""Customer load throughput: the old json.load + per-document upsert loop vs utils.bulk_loader.
+
+Writes synthetic customers shaped like src/resources/customers.json to a
+JSON array and a JSONL file, then measures in separate subprocesses:
+  parse   - documents/s and peak RSS of json.load vs streaming iter_documents
+  load    - documents/s into a collection, per-document upsert vs BulkLoader
+
+Without --couchbase the collection is an in-process stub that sleeps --rtt-ms
+per call (one round-trip per upsert, one per upsert_multi batch plus a small
+per-document cost), so it models the round-trip savings, not server limits.
+The per-document loop is timed on the first --legacy-sample documents and
+extrapolated.
+
+Usage: python benchmarks/bench_bulk_loader.py [--count 1000000] [--rtt-ms 0.5]
+       [--couchbase couchbase://localhost --bucket customer_data]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.bulk_loader import BulkLoader, iter_documents  # noqa: E402
+
+STYLES = ["BL029", "SET351", "AN201", "CH110", "PH445"]
+CATEGORIES = ["Accessories", "Mobile Phones", "Data Plans"]
+
+
+def synthetic_customer(i, rng):
+    return {
+        "customer_id": f"BENCH{i:08d}",
+        "name": f"Customer {i}",
+        "email": f"customer{i}@example.com",
+        "age": rng.randint(18, 80),
+        "location": "New York, USA",
+        "subscription_date": "2024-10-16",
+        "purchase_history": [
+            {"style": rng.choice(STYLES), "purchase_date": "2024-09-25", "quantity": 1,
+             "amount": round(rng.uniform(10, 200), 2), "status": "Shipped"}
+            for _ in range(3)
+        ],
+        "preferred_category": rng.choice(CATEGORIES),
+        "loyalty_level": rng.choice(["Bronze", "Silver", "Gold", "Platinum"]),
+    }
+
+
+def write_files(directory, count):
+    rng = random.Random(0)
+    array_path, jsonl_path = os.path.join(directory, "customers.json"), os.path.join(directory, "customers.jsonl")
+    with open(array_path, "w") as array, open(jsonl_path, "w") as jsonl:
+        array.write("[\n")
+        for i in range(count):
+            line = json.dumps(synthetic_customer(i, rng))
+            array.write(("" if i == 0 else ",\n") + line)
+            jsonl.write(line + "\n")
+        array.write("\n]\n")
+    return array_path, jsonl_path
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+class StubCollection:
+    def __init__(self, rtt):
+        self.rtt = rtt
+
+    def upsert(self, key, doc):
+        time.sleep(self.rtt)
+
+    def upsert_multi(self, docs):
+        time.sleep(self.rtt + len(docs) * self.rtt / 100)
+        return SimpleNamespace(exceptions={})
+
+
+def open_collection(args):
+    if not args.couchbase:
+        return StubCollection(args.rtt_ms / 1000)
+    from couchbase.cluster import Cluster
+    from couchbase.auth import PasswordAuthenticator
+    from couchbase.options import ClusterOptions
+    cluster = Cluster(args.couchbase, ClusterOptions(PasswordAuthenticator(args.username, args.password)))
+    return cluster.bucket(args.bucket).default_collection()
+
+
+def measure(args):
+    start = time.perf_counter()
+    if args.mode == "parse-json.load":
+        with open(args.path) as f:
+            count = len(json.load(f))
+    elif args.mode == "parse-stream":
+        count = sum(1 for _ in iter_documents(args.path))
+    elif args.mode == "load-legacy":
+        collection = open_collection(args)
+        count = 0
+        for doc in iter_documents(args.path):
+            if count >= args.legacy_sample:
+                break
+            collection.upsert(doc["customer_id"], doc)
+            count += 1
+    else:
+        stats = BulkLoader(open_collection(args), "customer_id", args.batch_size, args.concurrency,
+                           progress_interval=1e9).load(args.path)
+        count = stats.documents
+    return {"documents": count, "seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--rtt-ms", type=float, default=0.5)
+    parser.add_argument("--legacy-sample", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--couchbase")
+    parser.add_argument("--bucket", default="customer_data")
+    parser.add_argument("--username", default="Administrator")
+    parser.add_argument("--password", default="Administrator")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(measure(args)))
+        return
+
+    def run(mode, path):
+        cmd = [sys.executable, __file__, "--mode", mode, "--path", path] + sys.argv[1:]
+        r = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1])
+        rate = r["documents"] / r["seconds"]
+        print(f"{mode:<16} {os.path.basename(path):<16} docs={r['documents']:>9}  {rate:10.0f} docs/s  "
+              f"est. total={args.count / rate:8.1f}s  peak RSS={r['peak_rss_mb']:.0f} MB")
+
+    with tempfile.TemporaryDirectory() as directory:
+        array_path, jsonl_path = write_files(directory, args.count)
+        print(f"{args.count} customers, JSON array {os.path.getsize(array_path) / 1e6:.0f} MB")
+        run("parse-json.load", array_path)
+        run("parse-stream", array_path)
+        run("parse-stream", jsonl_path)
+        run("load-legacy", jsonl_path)
+        run("load-bulk", array_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Per-turn cost of conversation history writes/reads as a conversation grows.
+
+Runs against a live Couchbase (customer_data bucket) using scratch document
+keys. "legacy" reproduces the old get + append-in-Python + upsert of the whole
+customer document followed by a full read; "subdoc" uses ConversationStore.
+Timings are averaged over a window of turns at each checkpoint.
+
+Usage: python benchmarks/bench_conversation_history.py [--turns 10000] [--window 100]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from couchbase.auth import PasswordAuthenticator
+from couchbase.cluster import Cluster
+from couchbase.exceptions import DocumentNotFoundException
+from couchbase.options import ClusterOptions
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from agents.grok_agent import COUCHBASE_URL, USERNAME, PASSWORD, CUSTOMERS_BUCKET_NAME  # noqa: E402
+from utils.conversation_store import ConversationStore, archive_key  # noqa: E402
+
+MESSAGE = "I would like to know whether the earbuds from my last order support wireless charging. " * 2
+
+
+def legacy_turn(collection, key):
+    message = {"role": "user", "content": MESSAGE, "timestamp": datetime.now().isoformat()}
+    try:
+        customer = collection.get(key).content_as[dict]
+    except DocumentNotFoundException:
+        customer = {"customer_id": key}
+    customer.setdefault("conversation_history", []).append(message)
+    collection.upsert(key, customer)
+    return collection.get(key).content_as[dict]["conversation_history"][-10:]
+
+
+def subdoc_turn(store, key):
+    store.append(key, "user", MESSAGE)
+    return store.recent(key, 10)
+
+
+def run(label, turn, turns, window, checkpoints):
+    print(label)
+    elapsed = 0.0
+    for i in range(1, turns + 1):
+        start = time.perf_counter()
+        turn()
+        elapsed += time.perf_counter() - start
+        if i % window == 0 and i in checkpoints:
+            print(f"  turns={i:>6}  avg per turn={elapsed / window * 1000:.2f}ms")
+        if i % window == 0:
+            elapsed = 0.0
+
+
+def cleanup(collection, key):
+    for doc_key in [key] + [archive_key(key, seq) for seq in range(1000)]:
+        try:
+            collection.remove(doc_key)
+        except DocumentNotFoundException:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--window", type=int, default=100)
+    args = parser.parse_args()
+    checkpoints = {args.window, 1000, 2500, 5000, 7500, args.turns}
+
+    cluster = Cluster(COUCHBASE_URL, ClusterOptions(PasswordAuthenticator(USERNAME, PASSWORD)))
+    collection = cluster.bucket(CUSTOMERS_BUCKET_NAME).default_collection()
+    store = ConversationStore(collection)
+
+    for label, key, turn in [
+        ("legacy get/upsert", "BENCH_HISTORY_LEGACY", lambda: legacy_turn(collection, "BENCH_HISTORY_LEGACY")),
+        ("sub-document store", "BENCH_HISTORY_SUBDOC", lambda: subdoc_turn(store, "BENCH_HISTORY_SUBDOC")),
+    ]:
+        cleanup(collection, key)
+        run(label, turn, args.turns, args.window, checkpoints)
+        cleanup(collection, key)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare per-call latency of one-shot requests.post against the pooled LLM client.
+
+Runs a local HTTP/1.1 stub of the completions endpoint, so the numbers show
+connection setup cost only (no TLS, no model time). Against api.x.ai the gap
+is larger because every one-shot call also pays a TLS handshake.
+
+Usage: python benchmarks/bench_llm_client.py [--calls 500]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.llm_client import LLMClient  # noqa: E402
+
+STUB_RESPONSE = json.dumps({
+    "choices": [{"message": {"role": "assistant", "content": "Thanks for reaching out!"}}]
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = set()
+
+    def do_POST(self):
+        StubHandler.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(STUB_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label, call, calls):
+    StubHandler.connections.clear()
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<22} mean={statistics.mean(timings):.3f}ms p50={timings[len(timings) // 2]:.3f}ms "
+          f"p95={timings[int(len(timings) * 0.95)]:.3f}ms connections={len(StubHandler.connections)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    payload = {"model": "grok-3-mini", "messages": [{"role": "user", "content": "Hello"}]}
+    headers = {"Authorization": "Bearer test", "Content-Type": "application/json"}
+
+    run("requests.post", lambda: requests.post(f"{base_url}/chat/completions", headers=headers, json=payload).json(), args.calls)
+    client = LLMClient(base_url=base_url)
+    run("pooled LLMClient", lambda: client.chat_completion(payload, "test"), args.calls)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Cold vs warm tool round-trips on a local Ollama model: old request layout vs agents.simple_agent.
+
+Needs a running Ollama server with the model pulled (ollama pull qwen2.5:0.5b).
+One "round" is what a tool-using turn costs: the tool-selection call with
+the system prompt and tool schemas, then the follow-up call with a canned
+tool result. Two layouts are compared:
+  legacy  module-level ollama.chat, follow-up sent without tools and no keep_alive/num_ctx
+  agent   SimpleAgent._chat: persistent client, identical tools/options on both calls, keep_alive
+Before each layout the model is unloaded (keep_alive=0), so the first round
+is cold; the remaining --rounds are warm. Prefill/generation times come from
+Ollama's response metadata.
+
+Usage: python benchmarks/bench_ollama_prefix.py [--model qwen2.5:0.5b] [--rounds 10]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import ollama
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from agents.simple_agent import SimpleAgent, response_timings  # noqa: E402
+from utils.schemas import handle_complaint_schema, handle_general_question_schema, mock_purchase_schema  # noqa: E402
+
+QUESTION = "Customer CUST001 says the charger for style JNE3781 stopped working after a week. What can we do?"
+TOOL_CALL = {"role": "assistant", "content": "", "tool_calls": [{"function": {
+    "name": "handle_complaint",
+    "arguments": {"customer_id": "CUST001", "style": "JNE3781", "complaint": "charger stopped working"},
+}}]}
+TOOL_RESULT = {"role": "tool", "content": "Offer a replacement charger or 10% off the next purchase."}
+
+
+def make_agent(model, host):
+    agent = SimpleAgent(model_name=model, host=host)
+    for schema in (handle_complaint_schema, handle_general_question_schema, mock_purchase_schema):
+        agent.register_tool(schema, lambda **kwargs: None)
+    return agent
+
+
+def unload(model, host):
+    ollama.Client(host=host).generate(model=model, keep_alive=0)
+
+
+def legacy_round(agent):
+    messages = agent._messages(QUESTION)
+    first = ollama.chat(model=agent.model_name, messages=messages, tools=agent.tool_schemas, options={"num_predict": 32})
+    second = ollama.chat(model=agent.model_name, messages=messages + [TOOL_CALL, TOOL_RESULT], options={"num_predict": 32})
+    return response_timings(first), response_timings(second)
+
+
+def agent_round(agent):
+    messages = agent._messages(QUESTION)
+    first = agent._chat("chat", messages, num_predict=32)
+    second = agent._chat("tool_followup", messages + [TOOL_CALL, TOOL_RESULT], num_predict=32)
+    return response_timings(first), response_timings(second)
+
+
+def run(layout, agent, host, rounds):
+    unload(agent.model_name, host)
+    fn = legacy_round if layout == "legacy" else agent_round
+    results = []
+    for _ in range(rounds + 1):
+        start = time.perf_counter()
+        first, second = fn(agent)
+        results.append((time.perf_counter() - start, first, second))
+    cold, warm = results[0], results[1:]
+    print(f"{layout:<7} cold: wall={cold[0] * 1000:7.0f}ms load={cold[1]['load_s'] * 1000:6.0f}ms "
+          f"prefill={cold[1]['prefill_tokens']}+{cold[2]['prefill_tokens']} tok")
+    print(f"{layout:<7} warm: wall={statistics.mean(r[0] for r in warm) * 1000:7.0f}ms "
+          f"prefill1={statistics.mean(r[1]['prefill_s'] for r in warm) * 1000:6.1f}ms/"
+          f"{statistics.mean(r[1]['prefill_tokens'] for r in warm):.0f}tok "
+          f"prefill2={statistics.mean(r[2]['prefill_s'] for r in warm) * 1000:6.1f}ms/"
+          f"{statistics.mean(r[2]['prefill_tokens'] for r in warm):.0f}tok "
+          f"gen={statistics.mean(r[1]['generation_s'] + r[2]['generation_s'] for r in warm) * 1000:6.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="qwen2.5:0.5b")
+    parser.add_argument("--host", default="http://localhost:11434")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    agent = make_agent(args.model, args.host)
+    for layout in ("legacy", "agent"):
+        run(layout, agent, args.host, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Latency and memory of sales stats lookups: the old monolith cache vs SalesStatsStore.
+
+For catalogs of --sizes styles a synthetic stats set is "stored" in an
+in-process stub collection that keeps serialized JSON and charges --rtt-ms
+per call plus transfer time at --mbps for the bytes returned. Three readers
+are compared, each in a fresh subprocess:
+  monolith      the old get_sales_stats: fetch total_sales_stats once, keep it
+  per-style     SalesStatsStore reading sales_stats::style::<style> documents
+  subdoc        SalesStatsStore with only the monolith present (lookup_in fallback)
+Reported: first-call (cold) latency, mean latency over --lookups lookups of
+random styles, and Python heap retained afterwards (tracemalloc).
+
+Usage: python benchmarks/bench_sales_stats.py [--sizes 1000 10000 100000] [--rtt-ms 0.5] [--mbps 1000]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.sales_stats import MONOLITH_KEY, SalesStatsStore, style_key  # noqa: E402
+
+STATUSES = ["Shipped", "Shipped - Delivered to Buyer", "Cancelled", "Shipped - Returned to Seller", "Pending",
+            "Shipped - Picked Up", "Shipping", "Shipped - Out for Delivery"]
+
+
+def synthetic_stats(size):
+    rng = random.Random(0)
+    stats = {}
+    for i in range(size):
+        counts = {status: rng.randint(0, 500) for status in rng.sample(STATUSES, rng.randint(2, len(STATUSES)))}
+        stats[f"ST{i:07d}"] = {"total_count": sum(counts.values()), "status_counts": counts}
+    return stats
+
+
+class StubCollection:
+    """Serialized documents behind a simulated network: rtt per call plus bytes / bandwidth."""
+
+    def __init__(self, docs, rtt, bytes_per_second):
+        self.docs = {key: json.dumps(doc).encode() for key, doc in docs.items()}
+        self.parsed = docs  # what the server would walk for sub-document paths
+        self.rtt = rtt
+        self.bytes_per_second = bytes_per_second
+
+    def _wait(self, nbytes):
+        time.sleep(self.rtt + nbytes / self.bytes_per_second)
+
+    def get(self, key):
+        raw = self.docs[key]
+        self._wait(len(raw))
+        return SimpleNamespace(content_as={dict: json.loads(raw)})
+
+    def get_multi(self, keys):
+        found = {key: self.docs[key] for key in keys if key in self.docs}
+        self._wait(sum(map(len, found.values())))
+        return SimpleNamespace(results={key: SimpleNamespace(content_as={dict: json.loads(raw)}) for key, raw in found.items()},
+                               exceptions={key: KeyError(key) for key in keys if key not in found})
+
+    def lookup_in(self, key, specs):
+        # The server resolves the paths; only the matched fragments cross the wire
+        doc = self.parsed[key]
+        values = []
+        for spec in specs:
+            value = doc
+            for part in spec[1].strip("`").split("`.`"):
+                value = value.get(part) if isinstance(value, dict) else None
+            values.append(value)
+        self._wait(sum(len(json.dumps(v)) for v in values if v is not None))
+        return SimpleNamespace(content_as={dict: lambda i: values[i]}, exists=lambda i: values[i] is not None)
+
+
+def measure(mode, size, rtt, bytes_per_second, lookups):
+    stats = synthetic_stats(size)
+    if mode == "per-style":
+        docs = {style_key(style): dict(value, style=style) for style, value in stats.items()}
+    else:
+        docs = {MONOLITH_KEY: {"style_status_counts": stats}}
+    collection = StubCollection(docs, rtt, bytes_per_second)
+    styles = list(stats)
+    del stats, docs
+    rng = random.Random(1)
+    queries = [rng.choice(styles) for _ in range(lookups)]
+
+    tracemalloc.start()
+    if mode == "monolith":
+        cache = {}
+
+        def lookup(style):
+            if "doc" not in cache:
+                cache["doc"] = collection.get(MONOLITH_KEY).content_as[dict]
+            return cache["doc"].get("style_status_counts", {}).get(style, {"total_count": 0, "status_counts": {}})
+    else:
+        store = SalesStatsStore(collection, maxsize=5000, ttl=600, refresh_interval=0)
+        lookup = store.get
+
+    start = time.perf_counter()
+    lookup(queries[0])
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    for style in queries:
+        lookup(style)
+    mean = (time.perf_counter() - start) / len(queries)
+    retained = tracemalloc.get_traced_memory()[0]
+    return {"cold_ms": cold * 1000, "mean_ms": mean * 1000, "retained_mb": retained / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--rtt-ms", type=float, default=0.5)
+    parser.add_argument("--mbps", type=float, default=1000, help="Simulated network bandwidth in megabits/s")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    bytes_per_second = args.mbps * 1e6 / 8
+
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.size, args.rtt_ms / 1000, bytes_per_second, args.lookups)))
+        return
+
+    for size in args.sizes:
+        for mode in ("monolith", "per-style", "subdoc"):
+            out = subprocess.run([sys.executable, __file__, "--mode", mode, "--size", str(size),
+                                  "--rtt-ms", str(args.rtt_ms), "--mbps", str(args.mbps), "--lookups", str(args.lookups)],
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"styles={size:>7}  {mode:<10} cold={r['cold_ms']:9.2f} ms  mean={r['mean_ms']:7.3f} ms  "
+                  f"retained={r['retained_mb']:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
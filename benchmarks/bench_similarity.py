@@ -0,0 +1,93 @@
+"""Queries per second and peak memory of SimilarityEngine at 10k, 100k and 1M products.
+
+Synthetic normalized float32 vectors are written to a temporary index with
+np.lib.format.open_memmap (so generating 1M x 384 never sits in RAM), then
+each size is measured in its own subprocess so peak RSS is not shared.
+Peak RSS includes the file-backed pages of the memory-mapped matrix touched
+by a full scan; those are page cache the kernel can reclaim, not heap.
+
+Usage: python benchmarks/bench_similarity.py [--sizes 10000 100000 1000000] [--dim 384] [--batch 32]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.similarity import EMBEDDINGS_FILE, META_FILE, SimilarityEngine  # noqa: E402
+
+CATEGORIES = ["Accessories", "Mobile Phones", "Data Plans"]
+
+
+def write_index(index_dir, size, dim, chunk=100_000):
+    rng = np.random.default_rng(0)
+    vectors = np.lib.format.open_memmap(os.path.join(index_dir, EMBEDDINGS_FILE), mode="w+",
+                                        dtype=np.float32, shape=(size, dim))
+    for start in range(0, size, chunk):
+        block = rng.standard_normal((min(chunk, size - start), dim), dtype=np.float32)
+        vectors[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    vectors.flush()
+    del vectors
+    with open(os.path.join(index_dir, META_FILE), "w") as f:
+        json.dump({"model": "synthetic", "styles": [f"ST{i:07d}" for i in range(size)],
+                   "categories": [CATEGORIES[i % len(CATEGORIES)] for i in range(size)]}, f)
+
+
+def peak_rss_mb():
+    # VmHWM is per address space; ru_maxrss would inherit the parent's peak from writing the index
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def measure(index_dir, batch, rounds, k):
+    engine = SimilarityEngine(index_dir)
+    rng = np.random.default_rng(1)
+    queries = engine.vectors[rng.integers(0, engine.vectors.shape[0], batch * rounds)]
+    engine.search(queries[:batch], k)  # warm the page cache
+    start = time.perf_counter()
+    for r in range(rounds):
+        engine.search(queries[r * batch:(r + 1) * batch], k)
+    batched = batch * rounds / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for style in engine.styles[:rounds]:
+        engine.similar_to_style(style, k, "Accessories")
+    single = rounds / (time.perf_counter() - start)
+    return {"size": engine.vectors.shape[0], "batched_qps": batched, "single_qps": single, "peak_rss_mb": peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.batch, args.rounds, args.k)))
+        return
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as index_dir:
+            write_index(index_dir, size, args.dim)
+            out = subprocess.run([sys.executable, __file__, "--measure", index_dir, "--batch", str(args.batch),
+                                  "--rounds", str(args.rounds), "--k", str(args.k)],
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"products={r['size']:>9}  batched={r['batched_qps']:9.1f} q/s  "
+                  f"single+category={r['single_qps']:8.1f} q/s  peak RSS={r['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
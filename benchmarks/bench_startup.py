@@ -0,0 +1,95 @@
+"""Worker cold start: time to import the Flask app and Couchbase connections it opens.
+
+Each run is a fresh interpreter that imports main (app, routes, agent, tool
+handlers) from --src, counting Cluster objects constructed (sync and
+acouchbase). Point --src at a checkout of an older revision to compare, e.g.
+    git worktree add /tmp/before <rev> && python benchmarks/bench_startup.py --src /tmp/before/src
+Where the tree has utils.couchbase_manager, the time until the background
+connection reports ready is also shown (bounded by --ready-timeout).
+
+Tracked in CI-style runs with --baseline: exits non-zero when the median
+import time regresses by more than --tolerance against a file written with
+--save (numbers are machine specific; save the baseline on the machine
+that runs the check).
+
+Usage: python benchmarks/bench_startup.py [--src src] [--runs 5] [--save FILE | --baseline FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+CHILD = r"""
+import json, sys, time
+counts = {"clusters": 0}
+import couchbase.cluster
+original = couchbase.cluster.Cluster.__init__
+def counting_init(self, *args, **kwargs):
+    counts["clusters"] += 1
+    return original(self, *args, **kwargs)
+couchbase.cluster.Cluster.__init__ = counting_init
+start = time.perf_counter()
+error = None
+try:
+    import main
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+imported = time.perf_counter() - start
+ready = None
+try:
+    from utils.couchbase_manager import couchbase_manager
+    if couchbase_manager.wait_ready(float(sys.argv[1])):
+        ready = time.perf_counter() - start
+except ImportError:
+    pass
+print(json.dumps({"import_s": imported, "ready_s": ready, "clusters": counts["clusters"], "error": error}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(__file__), "..", "src"))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready-timeout", type=float, default=15.0)
+    parser.add_argument("--save", help="Write the results as a baseline JSON file")
+    parser.add_argument("--baseline", help="Compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed import-time regression (fraction)")
+    args = parser.parse_args()
+
+    results = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", CHILD, str(args.ready_timeout)], cwd=os.path.abspath(args.src),
+                             capture_output=True, text=True)
+        lines = out.stdout.strip().splitlines()
+        if out.returncode != 0 or not lines:
+            sys.exit(out.stderr)
+        results.append(json.loads(lines[-1]))
+
+    imports = [r["import_s"] * 1000 for r in results]
+    ready = [r["ready_s"] * 1000 for r in results if r["ready_s"] is not None]
+    print(f"import main: median={statistics.median(imports):.0f}ms min={min(imports):.0f}ms max={max(imports):.0f}ms")
+    print(f"Cluster objects per worker: {results[-1]['clusters']}")
+    print("Couchbase ready: " + (f"median={statistics.median(ready):.0f}ms" if ready else "not reported"))
+    errors = {r["error"] for r in results if r["error"]}
+    for error in errors:
+        print(f"import failed: {error}")
+
+    summary = {"import_ms": statistics.median(imports), "clusters": results[-1]["clusters"],
+               "python": platform.python_version(), "cpus": os.cpu_count()}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit = baseline["import_ms"] * (1 + args.tolerance)
+        print(f"baseline: import_ms={baseline['import_ms']:.0f} clusters={baseline['clusters']} (limit {limit:.0f}ms)")
+        if summary["import_ms"] > limit or summary["clusters"] > baseline["clusters"]:
+            sys.exit("startup regression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Time to first byte of SimpleAgent.chat vs SimpleAgent.chat_stream against a local stub.
+
+The stub emits a completion as server-sent events, one token every
+--token-delay seconds (or as one JSON body when the request is not
+streaming), so the gap between the two modes is the generation time the
+user no longer waits for. Conversation history is kept in memory.
+
+Usage: python benchmarks/bench_streaming_ttfb.py [--tokens 40] [--token-delay 0.025] [--runs 5]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils import llm_client  # noqa: E402
+from agents.grok_agent import SimpleAgent  # noqa: E402
+
+
+def start_stub_server(tokens: int, token_delay: float) -> int:
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            words = [f"word{i} " for i in range(tokens)]
+            if not payload.get("stream"):
+                time.sleep(token_delay * tokens)
+                body = json.dumps({"choices": [{"message": {"role": "assistant", "content": "".join(words)}}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in words + [None]:
+                time.sleep(token_delay)
+                event = "data: [DONE]\n\n" if word is None else \
+                    f"data: {json.dumps({'choices': [{'delta': {'content': word}}]})}\n\n"
+                data = event.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+class InMemoryAgent(SimpleAgent):
+    def __init__(self):
+        self.model_name, self.api_key, self.tools, self.tool_schemas = "grok-3-mini", "test", {}, []
+        self.system_prompt, self.history = "You are a test agent.", {}
+
+    def get_conversation_history(self, customer_id, limit=10):
+        return self.history.get(customer_id, [])[-limit:]
+
+    def save_conversation_turn(self, customer_id, role, content):
+        self.history.setdefault(customer_id, []).append({"role": role, "content": content})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--token-delay", type=float, default=0.025)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    port = start_stub_server(args.tokens, args.token_delay)
+    llm_client._client = llm_client.LLMClient(base_url=f"http://127.0.0.1:{port}/v1")
+    agent = InMemoryAgent()
+
+    for run in range(args.runs):
+        start = time.perf_counter()
+        agent.chat("What are the features of AN201?", customer_id="CUST001")
+        blocking = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ttfb = None
+        for chunk in agent.chat_stream("What are the features of AN201?", customer_id="CUST001"):
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+        total = time.perf_counter() - start
+        print(f"run {run + 1}: chat first byte={blocking * 1000:.0f}ms | "
+              f"chat_stream first byte={ttfb * 1000:.0f}ms total={total * 1000:.0f}ms")
+    saved = agent.history["CUST001"][-1]["content"]
+    print(f"persisted streamed reply: {len(saved.split())} words")
+
+
+if __name__ == "__main__":
+    main()
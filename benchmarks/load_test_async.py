@@ -0,0 +1,220 @@
+"""Load test: sync SimpleAgent on a fixed thread pool vs AsyncSimpleAgent on one event loop.
+
+Couchbase is replaced by an in-memory history store that sleeps for a
+simulated round-trip, and the Grok API by a local stub with a fixed
+generation delay, so the numbers isolate how much I/O wait each model of
+concurrency can overlap for the same number of workers.
+
+With --tools every message is a complaint: the stub answers the first
+completion with a handle_complaint tool call, and the handler reads the
+customer, product and sales stats documents seeded by stub_service.py
+(sleeping --cb-delay per round-trip) before making its own completion.
+The async agent runs twice, once with the synchronous handler (a thread
+per call) and once with ahandle_complaint awaited on the event loop.
+
+Usage: python benchmarks/load_test_async.py [--requests 200] [--workers 8] [--llm-delay 0.2] [--cb-delay 0.005]
+                                            [--tools]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils import llm_client  # noqa: E402
+from agents.grok_agent import SimpleAgent  # noqa: E402
+from agents.tool_executor import ToolExecutor  # noqa: E402
+from agents.async_grok_agent import AsyncSimpleAgent  # noqa: E402
+from utils.context_window import ContextWindow  # noqa: E402
+
+STUB_RESPONSE = json.dumps({
+    "choices": [{"message": {"role": "assistant", "content": "Thanks for reaching out!"}}]
+}).encode()
+
+
+def stub_reply(body: bytes) -> bytes:
+    """A handle_complaint tool call for a tool-selection request, STUB_RESPONSE for anything else."""
+    payload = json.loads(body)
+    if not payload.get("tools") or payload.get("tool_choice") == "none":
+        return STUB_RESPONSE
+    message = payload["messages"][-1]["content"]
+    customer_id, style, complaint = re.match(r"(CUST\d+) wants to cancel (\w+): (.*)", message).groups()
+    arguments = {"customer_id": customer_id, "style": style, "complaint": complaint}
+    return json.dumps({
+        "choices": [{"message": {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_0", "type": "function",
+            "function": {"name": "handle_complaint", "arguments": json.dumps(arguments)}}]}}]
+    }).encode()
+
+
+def start_stub_server(delay: float) -> int:
+    """Serve a completions stub (thread per connection) in the background; returns the port."""
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            reply = stub_reply(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    class StubServer(ThreadingHTTPServer):
+        request_queue_size = 1024  # accept a burst of concurrent connections
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+class MemorySummaries:
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, customer_id):
+        return self.docs.get(customer_id, {})
+
+    def set(self, customer_id, summary):
+        self.docs[customer_id] = summary
+
+
+class AsyncMemorySummaries(MemorySummaries):
+    async def get(self, customer_id):
+        return self.docs.get(customer_id, {})
+
+    async def set(self, customer_id, summary):
+        self.docs[customer_id] = summary
+
+
+class StubSyncAgent(SimpleAgent):
+    def __init__(self, cb_delay: float):
+        self.model_name, self.api_key, self.tools, self.tool_schemas = "grok-3-mini", "test", {}, []
+        self.system_prompt, self.cb_delay, self.history = "You are a test agent.", cb_delay, {}
+        self.summaries, self.context = MemorySummaries(), ContextWindow()
+        self.tool_executor = ToolExecutor(self.tools, self.api_key)
+
+    def get_conversation_history(self, customer_id, limit=10):
+        time.sleep(self.cb_delay)
+        return self.history.get(customer_id, [])[-limit:]
+
+    def save_conversation_turn(self, customer_id, role, content):
+        time.sleep(self.cb_delay * 2)  # get + upsert
+        self.history.setdefault(customer_id, []).append({"role": role, "content": content})
+
+
+class StubAsyncAgent(AsyncSimpleAgent):
+    def __init__(self, cb_delay: float):
+        super().__init__(api_key="test")
+        self.system_prompt, self.cb_delay, self.history = "You are a test agent.", cb_delay, {}
+        self.summaries = AsyncMemorySummaries()
+
+    async def get_conversation_history(self, customer_id, limit=10):
+        await asyncio.sleep(self.cb_delay)
+        return self.history.get(customer_id, [])[-limit:]
+
+    async def save_conversation_turn(self, customer_id, role, content):
+        await asyncio.sleep(self.cb_delay * 2)
+        self.history.setdefault(customer_id, []).append({"role": role, "content": content})
+
+
+def report(label, latencies, elapsed):
+    latencies.sort()
+    n = len(latencies)
+    print(f"{label:<28} {n / elapsed:8.1f} req/s  p50={latencies[n // 2] * 1000:.0f}ms "
+          f"p95={latencies[int(n * 0.95)] * 1000:.0f}ms p99={latencies[int(n * 0.99)] * 1000:.0f}ms")
+
+
+def question(i):
+    return f"Question {i}", f"CUST{i % 50:03d}"
+
+
+def clear_caches():
+    """Start each run cold, so every customer is read from the stub bucket."""
+    from utils import tool_utils
+    for cache in (tool_utils.customer_cache, tool_utils.product_cache, tool_utils.sales_stats_store.cache):
+        cache.clear()
+
+
+def run_sync(agent, total, workers, message=question, use_tools=False):
+    def one(i):
+        start = time.perf_counter()
+        agent.chat(*message(i), use_tools=use_tools)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one, range(total)))
+    report(f"sync, {workers} threads", latencies, time.perf_counter() - start)
+
+
+async def run_async(agent, total, label="async, 1 event loop", message=question, use_tools=False):
+    async def one(i):
+        start = time.perf_counter()
+        await agent.chat(*message(i), use_tools=use_tools)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(total)))
+    report(label, list(latencies), time.perf_counter() - start)
+    await llm_client.get_async_client().close()
+
+
+def run_tools(args, base_url):
+    os.environ["STUB_CB_DELAY"] = str(args.cb_delay)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    # Seeds the documents and patches Couchbase on import
+    from stub_service import CUSTOMER_COUNT, SEEDED_STYLE
+    from utils.tool_utils import handle_complaint, ahandle_complaint
+    from utils.schemas import handle_complaint_schema
+
+    def complaint(i):
+        customer_id = f"CUST{i % CUSTOMER_COUNT:04d}"
+        return f"{customer_id} wants to cancel {SEEDED_STYLE}: the left earbud stopped working", customer_id
+
+    clear_caches()
+    agent = StubSyncAgent(args.cb_delay)
+    agent.register_tool(handle_complaint_schema, handle_complaint)
+    run_sync(agent, args.requests, args.workers, complaint, use_tools=True)
+
+    for label, handler in (("async, sync handler", handle_complaint), ("async, coroutine handler", ahandle_complaint)):
+        clear_caches()
+        llm_client._async_client = llm_client.AsyncLLMClient(base_url=base_url, pool_maxsize=args.requests)
+        agent = StubAsyncAgent(args.cb_delay)
+        agent.register_tool(handle_complaint_schema, handler)
+        asyncio.run(run_async(agent, args.requests, label, complaint, use_tools=True))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--llm-delay", type=float, default=0.2)
+    parser.add_argument("--cb-delay", type=float, default=0.005)
+    parser.add_argument("--tools", action="store_true", help="complaints that go through the handle_complaint tool")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{start_stub_server(args.llm_delay)}/v1"
+    llm_client._client = llm_client.LLMClient(base_url=base_url)
+    llm_client._async_client = llm_client.AsyncLLMClient(base_url=base_url, pool_maxsize=args.requests)
+
+    if args.tools:
+        run_tools(args, base_url)
+        return
+    run_sync(StubSyncAgent(args.cb_delay), args.requests, args.workers)
+    asyncio.run(run_async(StubAsyncAgent(args.cb_delay), args.requests))
+
+
+if __name__ == "__main__":
+    main()
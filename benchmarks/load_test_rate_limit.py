@@ -0,0 +1,139 @@
+"""Overload test for POST /retain against a provider stub that rate-limits.
+
+The completions stub serves at most --provider-limit requests at once and
+answers the rest with 429 + Retry-After, like a provider at its quota.
+The service (stub_service.py, as in load_test_retain.py) is driven with
+more concurrent clients than that, and the report shows what the provider
+saw (served vs 429) next to what clients got (200 vs 503 + Retry-After),
+plus the limiter's llm_limiter_* series from /metrics at the end.
+
+Usage: python benchmarks/load_test_rate_limit.py [--provider-limit 8] [--concurrency 64] [--requests 1000]
+"""
+import argparse
+import json
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from load_test_retain import ANSWER, percentile, start_service, stub_reply, wait_healthy
+
+RATE_LIMITED = json.dumps({"error": "rate limit exceeded"}).encode()
+
+
+def start_limited_stub(delay: float, limit: int, retry_after: float) -> tuple:
+    counts = Counter()
+    lock = threading.Lock()
+    active = [0]
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with lock:
+                admitted = active[0] < limit
+                if admitted:
+                    active[0] += 1
+                counts["served" if admitted else "429"] += 1
+            if not admitted:
+                self._reply(429, RATE_LIMITED, {"Retry-After": f"{retry_after:g}"})
+                return
+            try:
+                time.sleep(delay)
+                self._reply(200, stub_reply(body), {})
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        def _reply(self, status, body, headers):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class StubServer(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, counts
+
+
+def run_load(port: int, total: int, concurrency: int):
+    local = threading.local()
+    url = f"http://127.0.0.1:{port}/retain"
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = {"customer_id": f"CUST{i % 500:04d}", "style": "AN201", "complaint": f"Earbuds stopped working ({i})"}
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=body, timeout=120)
+            outcome = str(response.status_code)
+            if response.status_code == 503 and "Retry-After" in response.headers:
+                outcome = "503+Retry-After"
+            elif response.status_code == 200 and response.json().get("message") != ANSWER:
+                outcome = "200 error text"
+        except requests.RequestException:
+            outcome = "client error"
+        return time.perf_counter() - start, outcome
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["gunicorn", "werkzeug"], default="werkzeug")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--llm-delay", type=float, default=0.1)
+    parser.add_argument("--provider-limit", type=int, default=8)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--cb-delay", type=float, default=0.002)
+    parser.add_argument("--port", type=int, default=5058)
+    args = parser.parse_args()
+
+    grok_port, provider = start_limited_stub(args.llm_delay, args.provider_limit, args.retry_after)
+    service = start_service(args, grok_port)
+    try:
+        wait_healthy(args.port)
+        results, elapsed = run_load(args.port, args.requests, args.concurrency)
+        metrics = requests.get(f"http://127.0.0.1:{args.port}/metrics", timeout=5).text
+    finally:
+        service.send_signal(signal.SIGTERM)
+        service.wait(timeout=60)
+
+    outcomes = Counter(outcome for _, outcome in results)
+    ok = sorted(latency for latency, outcome in results if outcome == "200")
+    print(f"{len(results)} requests in {elapsed:.1f}s, {outcomes['200'] / elapsed:.1f} successful req/s")
+    print("client outcomes: " + ", ".join(f"{name}={count}" for name, count in sorted(outcomes.items())))
+    if ok:
+        print(f"successful latency: p50={percentile(ok, 0.50) * 1000:.0f}ms p95={percentile(ok, 0.95) * 1000:.0f}ms "
+              f"p99={percentile(ok, 0.99) * 1000:.0f}ms")
+    print(f"provider: served={provider['served']} rate_limited={provider['429']}")
+    limiter = [line.split("{")[0][len("llm_limiter_"):] + "=" + line.split()[-1]
+               for line in metrics.splitlines() if line.startswith("llm_limiter_")]
+    print("limiter: " + " ".join(limiter))
+
+
+if __name__ == "__main__":
+    main()
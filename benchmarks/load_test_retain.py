@@ -0,0 +1,171 @@
+"""Load test for POST /retain under the production server, with Grok and Couchbase stubbed.
+
+Starts a local completions stub (fixed --llm-delay per call), runs the
+service from stub_service.py under gunicorn with the repo's
+gunicorn.conf.py (or a single-process threaded Werkzeug server with
+--server werkzeug), then fires --requests POSTs from --concurrency client
+threads and reports throughput and latency percentiles. The server is
+stopped with SIGTERM, so graceful shutdown is exercised too.
+
+The stub answers the agent's first completion with a handle_complaint
+tool call for the customer and style in the message, and every other
+completion with ANSWER, so each request runs the tool handler against the
+seeded Couchbase documents and makes two LLM calls. A request only counts
+as successful when the body carries ANSWER; a 200 with an error string
+(customer not found, HTTP error from the stub, ...) is a failure.
+
+Usage: python benchmarks/load_test_retain.py [--server gunicorn] [--workers 2] [--threads 8]
+                                             [--concurrency 32] [--requests 1000] [--llm-delay 0.1]
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+ANSWER = "Sorry to hear that! Here is 10% off your next order."
+STUB_RESPONSE = json.dumps({
+    "choices": [{"message": {"role": "assistant", "content": ANSWER}}],
+    "usage": {"prompt_tokens": 420, "completion_tokens": 18},
+}).encode()
+
+
+def stub_reply(body: bytes) -> bytes:
+    """A handle_complaint tool call for a tool-selection request, STUB_RESPONSE for anything else."""
+    payload = json.loads(body)
+    if not payload.get("tools") or payload.get("tool_choice") == "none":
+        return STUB_RESPONSE
+    message = payload["messages"][-1]["content"]
+    customer_id = re.search(r"CUST\d+", message)
+    style = re.search(r"productID \(optional\) (\w+)", message)
+    complaint = message.rsplit(": ", 1)[-1]
+    arguments = {"customer_id": customer_id and customer_id.group(0), "style": style and style.group(1),
+                 "complaint": complaint}
+    return json.dumps({
+        "choices": [{"message": {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_0", "type": "function",
+            "function": {"name": "handle_complaint", "arguments": json.dumps(arguments)}}]}}],
+        "usage": {"prompt_tokens": 610, "completion_tokens": 24},
+    }).encode()
+
+
+def start_grok_stub(delay: float) -> int:
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            reply = stub_reply(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    class StubServer(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+def start_service(args, grok_port: int) -> subprocess.Popen:
+    env = dict(os.environ, STUB_GROK_URL=f"http://127.0.0.1:{grok_port}/v1", STUB_CB_DELAY=str(args.cb_delay),
+               PYTHONPATH=os.pathsep.join([HERE, os.environ.get("PYTHONPATH", "")]))
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{args.port}",
+                   "--workers", str(args.workers), "--threads", str(args.threads), "--log-level", "warning",
+                   "stub_service:create_app()"]
+    else:
+        command = [sys.executable, "-c", f"import stub_service; stub_service.serve({args.port})"]
+    return subprocess.Popen(command, cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_healthy(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("service did not become healthy")
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def run_load(port: int, total: int, concurrency: int):
+    local = threading.local()
+    url = f"http://127.0.0.1:{port}/retain"
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = {"customer_id": f"CUST{i % 500:04d}", "style": "AN201", "complaint": "The earbuds stopped working"}
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=body, timeout=60)
+            ok = response.status_code == 200 and response.json().get("message") == ANSWER
+        except (requests.RequestException, ValueError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["gunicorn", "werkzeug"], default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--llm-delay", type=float, default=0.1)
+    parser.add_argument("--cb-delay", type=float, default=0.002)
+    parser.add_argument("--port", type=int, default=5057)
+    args = parser.parse_args()
+
+    service = start_service(args, start_grok_stub(args.llm_delay))
+    try:
+        wait_healthy(args.port)
+        run_load(args.port, min(50, args.requests), args.concurrency)  # warm pools and caches
+        results, elapsed = run_load(args.port, args.requests, args.concurrency)
+    finally:
+        stop_start = time.perf_counter()
+        service.send_signal(signal.SIGTERM)
+        service.wait(timeout=60)
+        stopped = time.perf_counter() - stop_start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    label = f"{args.server} {args.workers}x{args.threads}" if args.server == "gunicorn" else "werkzeug threaded"
+    print(f"{label}: {len(results) / elapsed:.1f} req/s  p50={percentile(latencies, 0.50) * 1000:.0f}ms "
+          f"p95={percentile(latencies, 0.95) * 1000:.0f}ms p99={percentile(latencies, 0.99) * 1000:.0f}ms "
+          f"errors={errors}/{len(results)}  shutdown={stopped:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Where import time goes when a worker boots.
+
+Runs `python -X importtime -c "import <module>"` from src in a fresh
+interpreter and prints the slowest modules by cumulative and self time,
+plus totals per top-level package.
+
+Usage: python benchmarks/profile_imports.py [--module main] [--top 20]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile(module: str, src: str):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=src,
+                         capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    if out.returncode != 0:
+        print(out.stderr.splitlines()[-1] if out.stderr else f"import {module} failed", file=sys.stderr)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--src", default=os.path.join(os.path.dirname(__file__), "..", "src"))
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = profile(args.module, os.path.abspath(args.src))
+    total = sum(self_us for _, self_us, _, _ in rows)
+    print(f"import {args.module}: {total / 1000:.0f}ms across {len(rows)} modules\n")
+
+    print("slowest by cumulative time (ms):")
+    for name, _, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {'  ' * min(depth, 6)}{name}")
+
+    packages = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        packages[name.split(".")[0]] += self_us
+    print("\nself time per top-level package (ms):")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f}  {package}")
+
+
+if __name__ == "__main__":
+    main()
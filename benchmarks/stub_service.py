@@ -0,0 +1,174 @@
+"""The Flask service with Grok and Couchbase stubbed out, for load tests.
+
+Importing this module points the LLM client at STUB_GROK_URL and replaces
+Couchbase with in-process dictionaries that sleep STUB_CB_DELAY seconds per
+round-trip (conversation history, summaries and documents), for the
+synchronous SDK and the acouchbase API alike. The customer
+bucket is seeded with CUSTOMER_COUNT customers (CUST0000...) who all
+bought the SEEDED_STYLE product, so tool handlers find their documents and
+build real prompts. The patches are made at import time on classes and
+the shared connection manager, so they carry over into forked server
+workers. Used by load_test_retain.py and by load_test_async.py --tools:
+    gunicorn -c gunicorn.conf.py --pythonpath ../benchmarks 'stub_service:create_app()'
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from config import settings  # noqa: E402
+
+settings.GROK_BASE_URL = os.environ.get("STUB_GROK_URL", "http://127.0.0.1:8001/v1")
+CB_DELAY = float(os.environ.get("STUB_CB_DELAY", "0.002"))
+
+from couchbase.exceptions import DocumentNotFoundException  # noqa: E402
+from utils.conversation_store import ConversationStore  # noqa: E402
+from utils.couchbase_manager import couchbase_manager  # noqa: E402
+from utils.sales_stats import style_key  # noqa: E402
+
+CUSTOMER_COUNT = 500
+SEEDED_STYLE = "AN201"
+
+
+class StubCollection:
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, key):
+        time.sleep(CB_DELAY)
+        if key not in self.docs:
+            raise DocumentNotFoundException()
+        return SimpleNamespace(content_as={dict: dict(self.docs[key])})
+
+    def upsert(self, key, value, *args, **kwargs):
+        time.sleep(CB_DELAY)
+        self.docs[key] = value
+
+    def get_multi(self, keys, *args, **kwargs):
+        time.sleep(CB_DELAY)
+        return SimpleNamespace(results={k: SimpleNamespace(content_as={dict: self.docs[k]}) for k in keys if k in self.docs},
+                               exceptions={k: DocumentNotFoundException() for k in keys if k not in self.docs})
+
+    def lookup_in(self, key, *args, **kwargs):
+        time.sleep(CB_DELAY)
+        raise DocumentNotFoundException()  # only the sales stats monolith is read this way; it isn't seeded
+
+
+class StubCluster:
+    def __init__(self):
+        self.buckets = {}
+
+    def bucket(self, name):
+        collection = self.buckets.setdefault(name, StubCollection())
+        return SimpleNamespace(default_collection=lambda: collection)
+
+    def wait_until_ready(self, *args, **kwargs):
+        pass
+
+    def query(self, *args, **kwargs):
+        time.sleep(CB_DELAY)
+        return []
+
+    def close(self):
+        pass
+
+
+class AsyncStubCollection:
+    """The same documents behind the acouchbase API: round-trips await the delay instead of blocking."""
+
+    def __init__(self, collection: StubCollection):
+        self.docs = collection.docs
+
+    async def get(self, key):
+        await asyncio.sleep(CB_DELAY)
+        if key not in self.docs:
+            raise DocumentNotFoundException()
+        return SimpleNamespace(content_as={dict: dict(self.docs[key])})
+
+    async def upsert(self, key, value, *args, **kwargs):
+        await asyncio.sleep(CB_DELAY)
+        self.docs[key] = value
+
+    async def lookup_in(self, key, *args, **kwargs):
+        await asyncio.sleep(CB_DELAY)
+        raise DocumentNotFoundException()
+
+
+class AsyncStubCluster:
+    def query(self, *args, **kwargs):
+        async def rows():
+            await asyncio.sleep(CB_DELAY)
+            return
+            yield
+        return SimpleNamespace(rows=rows)
+
+
+_history = {}
+_history_lock = threading.Lock()
+
+
+def _recent(self, customer_id, limit=10):
+    time.sleep(CB_DELAY)
+    with _history_lock:
+        return list(_history.get(customer_id, [])[-limit:])
+
+
+def _append(self, customer_id, role, content):
+    time.sleep(CB_DELAY)
+    with _history_lock:
+        _history.setdefault(customer_id, []).append(
+            {"role": role, "content": content, "timestamp": f"{time.time():.6f}"})
+
+
+def _seed(cluster: StubCluster):
+    products = cluster.bucket(settings.PRODUCTS_BUCKET).default_collection()
+    products.docs[SEEDED_STYLE] = {
+        "style": SEEDED_STYLE, "description": "Wireless earbuds", "category": "Audio", "price": 79.99,
+        "color": "Black", "accessory_type": "Earbuds", "features": ["Noise cancelling", "Bluetooth 5.3"],
+        "usage_type": "Everyday", "stock_quantity": 120}
+    sales = cluster.bucket(settings.SALES_STATS_BUCKET).default_collection()
+    sales.docs[style_key(SEEDED_STYLE)] = {"total_count": 340, "status_counts": {"delivered": 310, "cancelled": 30}}
+    customers = cluster.bucket(settings.CUSTOMERS_BUCKET).default_collection()
+    for i in range(CUSTOMER_COUNT):
+        customer_id = f"CUST{i:04d}"
+        customers.docs[customer_id] = {
+            "customer_id": customer_id, "name": f"Customer {i}", "loyalty_level": ("Bronze", "Silver", "Gold")[i % 3],
+            "preferred_category": "Audio",
+            "purchase_history": [{"style": SEEDED_STYLE, "purchase_date": "2024-11-02", "amount": 79.99, "status": "Delivered"}],
+        }
+
+
+async def _async_collection(bucket):
+    return AsyncStubCollection(_cluster.bucket(bucket).default_collection())
+
+
+async def _async_connect():
+    return _async_cluster
+
+
+_cluster = StubCluster()
+_async_cluster = AsyncStubCluster()
+_seed(_cluster)
+couchbase_manager.cluster = lambda: _cluster
+couchbase_manager.async_collection = _async_collection
+couchbase_manager.async_cluster = _async_connect
+ConversationStore.recent = _recent
+ConversationStore.append = _append
+
+
+def create_app():
+    import main
+    return main.app
+
+
+def serve(port: int):
+    """Single-process threaded Werkzeug server (when gunicorn isn't installed)."""
+    from werkzeug.serving import make_server
+    from routes.routes import init_worker
+    app = create_app()
+    init_worker()
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
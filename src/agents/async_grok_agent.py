@@ -0,0 +1,164 @@
+import asyncio
+from typing import Dict, Callable, List
+import logging
+
+import httpx
+
+from config import settings
+from agents.grok_agent import SYSTEM_PROMPT, parse_tool_calls
+from utils.llm_client import get_async_client
+from utils.llm_limiter import LLMOverloadedError
+from agents.tool_executor import ToolExecutor
+from utils.conversation_store import AsyncConversationStore
+from utils.couchbase_manager import couchbase_manager
+from utils.context_window import ContextWindow, AsyncSummaryStore, context_tokens
+from utils.tracing import traced, span
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSimpleAgent:
+    """asyncio-native version of grok_agent.SimpleAgent.
+
+    Conversation history goes through acouchbase and completions through the
+    pooled httpx client, so a worker can keep many requests in flight while
+    they wait on I/O. Coroutine tools (the a* handlers in tool_utils) are
+    awaited directly; synchronous tools run in a thread pool.
+    """
+
+    def __init__(self, model_name: str = settings.GROK_MODEL, api_key: str = "xai-kei"):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.tools = {}
+        self.tool_schemas = []
+        self.system_prompt = SYSTEM_PROMPT
+        self.customers_collection = None
+        self.conversations = None
+        self.summaries = None
+        self.context = ContextWindow()
+        self.tool_executor = ToolExecutor(self.tools, self.api_key)
+
+    async def connect(self):
+        """Open the process's acouchbase connection; call once from the serving event loop."""
+        self.customers_collection = await couchbase_manager.async_collection(settings.CUSTOMERS_BUCKET)
+        self.conversations = AsyncConversationStore(self.customers_collection)
+        self.summaries = AsyncSummaryStore(self.customers_collection)
+
+    async def close(self):
+        await get_async_client().close()
+
+    def register_tool(self, schema: Dict, function: Callable):
+        tool_name = schema["function"]["name"]
+        self.tools[tool_name] = function
+        self.tool_schemas.append({"type": "function", "function": schema["function"]})
+        logger.debug(f"Registered tool: {tool_name}")
+
+    @traced("history.read")
+    async def get_conversation_history(self, customer_id: str, limit: int = 10) -> list:
+        """Retrieve the last 'limit' messages for a customer."""
+        try:
+            history = await self.conversations.recent(customer_id, limit)
+            logger.debug(f"Retrieved {len(history)} messages for customer {customer_id}")
+            return history
+        except Exception as e:
+            logger.error(f"Error retrieving conversation history for {customer_id}: {str(e)}")
+            return []
+
+    @traced("history.write", size=None)
+    async def save_conversation_turn(self, customer_id: str, role: str, content: str):
+        """Append a conversation turn to the customer's history in Couchbase."""
+        try:
+            await self.conversations.append(customer_id, role, content)
+        except Exception as e:
+            logger.error(f"Error saving conversation turn for {customer_id}: {str(e)}")
+
+    async def _read_summary(self, customer_id: str):
+        try:
+            return await self.summaries.get(customer_id)
+        except Exception as e:
+            logger.error(f"Error reading conversation summary for {customer_id}: {str(e)}")
+            return None
+
+    async def build_messages(self, customer_id: str, message: str) -> List[Dict]:
+        """See SimpleAgent.build_messages; history and summary are read concurrently."""
+        history, summary = await asyncio.gather(
+            self.get_conversation_history(customer_id, settings.CONTEXT_HISTORY_FETCH),
+            self._read_summary(customer_id),
+        )
+        with span("context.build") as current:
+            messages, tokens, updated = self.context.assemble(self.system_prompt, history, message, summary)
+            if updated is not None:
+                try:
+                    await self.summaries.set(customer_id, updated)
+                except Exception as e:
+                    logger.error(f"Error saving conversation summary for {customer_id}: {str(e)}")
+            if current is not None:
+                current.size = tokens
+        context_tokens.observe("grok_async", tokens)
+        logger.info(f"Context for {customer_id}: {len(messages)} messages, ~{tokens} tokens "
+                    f"(budget {self.context.budget}, {len(history)} history messages read)")
+        return messages
+
+    @traced("agent.chat")
+    async def chat(self, message: str, customer_id: str, use_tools: bool = False) -> str:
+        logger.debug(f"Calling async chat with message: {message}, customer_id: {customer_id}, use_tools: {use_tools}")
+        user_saved = False
+        try:
+            # The user message is saved once the model has answered, so a shed request leaves no trace in the history
+            messages = await self.build_messages(customer_id, message)
+            payload = {
+                "model": self.model_name,
+                "messages": messages
+            }
+            if use_tools and self.tools:
+                payload["tools"] = self.tool_schemas
+            response_data = await get_async_client().chat_completion(payload, self.api_key)
+            await self.save_conversation_turn(customer_id, "user", message)
+            user_saved = True
+            tool_calls = parse_tool_calls(response_data)
+            if use_tools and tool_calls:
+                content = await self._handle_tool_calls(message, response_data, messages)
+            else:
+                content = response_data["choices"][0]["message"]["content"]
+            await self.save_conversation_turn(customer_id, "assistant", content)
+            return content
+        except LLMOverloadedError:
+            raise
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error in async chat: {e.response.status_code} - {e.response.text}")
+            if not user_saved:
+                await self.save_conversation_turn(customer_id, "user", message)
+            await self.save_conversation_turn(customer_id, "assistant", f"Error: HTTP {e.response.status_code}")
+            return f"Error: HTTP {e.response.status_code} - {e.response.text}"
+        except Exception as e:
+            logger.error(f"Error in async chat: {str(e)}")
+            if not user_saved:
+                await self.save_conversation_turn(customer_id, "user", message)
+            await self.save_conversation_turn(customer_id, "assistant", f"Error: {str(e)}")
+            return f"Error: {str(e)}"
+
+    async def _answer_from_tools(self, messages: List[Dict], response_data: Dict, tool_calls: list) -> str:
+        """Run all tool calls concurrently and answer them with one follow-up completion."""
+        assistant = dict(response_data["choices"][0]["message"], tool_calls=tool_calls)
+        payload = {
+            "model": self.model_name,
+            "messages": messages + [assistant] + await self.tool_executor.arun(tool_calls),
+            "tools": self.tool_schemas,
+            "tool_choice": "none",
+        }
+        response_data = await get_async_client().chat_completion(payload, self.api_key)
+        return response_data["choices"][0]["message"]["content"]
+
+    @traced("agent.tool_calls", size=None)
+    async def _handle_tool_calls(self, original_message: str, response_data: Dict, messages: List[Dict] = None) -> str:
+        logger.debug(f"Handling tool calls for message: {original_message}")
+        tool_calls = parse_tool_calls(response_data)
+        if tool_calls is None:
+            return "Error: Invalid tool call format"
+        known = [c for c in tool_calls if c.get("function", {}).get("name") in self.tools]
+        if len(known) > 1 and messages is not None:
+            # Several intents in one message: one concurrent tool round and one completion instead of one per tool
+            return await self._answer_from_tools(messages, response_data, known)
+        if known:
+            return await self.tool_executor.acall(known[0])
+        return "No valid tool calls found"
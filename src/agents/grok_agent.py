@@ -1,43 +1,58 @@
 import json
-from datetime import datetime
-from typing import Dict, Callable, List
+from typing import Dict, Callable, Iterator, List
 import requests
 import logging
-from couchbase.cluster import Cluster
-from couchbase.auth import PasswordAuthenticator
-from couchbase.options import ClusterOptions, QueryOptions
-from couchbase.exceptions import DocumentNotFoundException
+from config import settings
+from utils.llm_client import chat_completion, stream_chat_completion
+from utils.llm_limiter import LLMOverloadedError
+from agents.tool_executor import ToolExecutor
+from utils.conversation_store import ConversationStore
+from utils.couchbase_manager import couchbase_manager, LazyCollection
+from utils.context_window import ContextWindow, SummaryStore, context_tokens
+from utils.tracing import traced, span
+from utils.logging_setup import log_payload
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-COUCHBASE_URL = "couchbase://localhost"
-USERNAME = "Administrator"
-PASSWORD = "Administrator"
-CUSTOMERS_BUCKET_NAME = "customer_data"
+SYSTEM_PROMPT = (
+    "You are a friendly, persuasive Sales AI chatbot. Your goal is to convince customers to keep their orders and explore more products. "
+    "Use 'handle_complaint' tool for cancellation or complaint requests with customer_id, style, and complaint in JSON format, e.g., Tool Call: handle_complaint(customer_id=\"CUST005\", style=\"AN201\", complaint=\"The earbuds stopped working\"). "
+    "Use 'handle_general_question' tool for general questions with customer_id, style (optional), and question (passed as complaint when style is absent or extracted from complaint) in JSON format, e.g., Tool Call: handle_general_question(customer_id=\"CUST005\", style=\"AN201\", question=\"What are the features of AN201?\"). "
+    "Use 'mock_purchase' tool for purchase requests with customer_id and style in JSON format, e.g., Tool Call: mock_purchase(customer_id=\"CUST005\", style=\"AN201\"). "
+    "If no complaint or style is provided, assume it's the start of the chat and use a default like 'Hello! How can I assist you today with our products, such as our latest wireless earbuds or other accessories?'. "
+    "For questions about specific products, extract the style code from the complaint if not provided in style field and include product details like description, price, color, accessory_type, features, and usage_type. "
+    "For purchase requests, check for keywords like 'purchase', 'buy', or 'order' in the complaint and use the style field. "
+    "Keep responses short, engaging, and professional. Always recommend alternative products based on the customer's preferred category or product category, highlighting details like accessory_type, features, and usage_type. "
+    "Check previous messages to avoid repetition and maintain coherent conversation using customer_id as reference."
+)
+
+
+def parse_tool_calls(response_data: Dict) -> list:
+    """Extract tool calls from a completions response; some responses encode them as a JSON string."""
+    tool_calls = response_data.get("choices", [{}])[0].get("message", {}).get("tool_calls")
+    if isinstance(tool_calls, str):
+        try:
+            tool_calls = json.loads(tool_calls).get("tool_calls", [])
+        except json.JSONDecodeError:
+            logger.error("Failed to parse tool_calls string")
+            return None
+    return tool_calls or []
 
 
 class SimpleAgent:
-    def __init__(self, model_name: str = "grok-3-mini", api_key: str = "xai-kei"):
+    def __init__(self, model_name: str = settings.GROK_MODEL, api_key: str = "xai-kei"):
         self.model_name = model_name
         self.api_key = api_key
         self.tools = {}
         self.tool_schemas = []
-        self.base_url = "https://api.x.ai/v1"
-        self.system_prompt = (
-            "You are a friendly, persuasive Sales AI chatbot. Your goal is to convince customers to keep their orders and explore more products. "
-            "Use 'handle_complaint' tool for cancellation or complaint requests with customer_id, style, and complaint in JSON format, e.g., Tool Call: handle_complaint(customer_id=\"CUST005\", style=\"AN201\", complaint=\"The earbuds stopped working\"). "
-            "Use 'handle_general_question' tool for general questions with customer_id, style (optional), and question (passed as complaint when style is absent or extracted from complaint) in JSON format, e.g., Tool Call: handle_general_question(customer_id=\"CUST005\", style=\"AN201\", question=\"What are the features of AN201?\"). "
-            "Use 'mock_purchase' tool for purchase requests with customer_id and style in JSON format, e.g., Tool Call: mock_purchase(customer_id=\"CUST005\", style=\"AN201\"). "
-            "If no complaint or style is provided, assume it's the start of the chat and use a default like 'Hello! How can I assist you today with our products, such as our latest wireless earbuds or other accessories?'. "
-            "For questions about specific products, extract the style code from the complaint if not provided in style field and include product details like description, price, color, accessory_type, features, and usage_type. "
-            "For purchase requests, check for keywords like 'purchase', 'buy', or 'order' in the complaint and use the style field. "
-            "Keep responses short, engaging, and professional. Always recommend alternative products based on the customer's preferred category or product category, highlighting details like accessory_type, features, and usage_type. "
-            "Check previous messages to avoid repetition and maintain coherent conversation using customer_id as reference."
-        )
-        self.cluster = Cluster(COUCHBASE_URL, ClusterOptions(PasswordAuthenticator(USERNAME, PASSWORD)))
-        self.customers_bucket = self.cluster.bucket(CUSTOMERS_BUCKET_NAME)
-        self.customers_collection = self.customers_bucket.default_collection()
+        self.base_url = settings.GROK_BASE_URL
+        self.system_prompt = SYSTEM_PROMPT
+        # Same connection as the tool handlers, opened on first use
+        self.customers_collection = LazyCollection(couchbase_manager, settings.CUSTOMERS_BUCKET)
+        self.conversations = ConversationStore(self.customers_collection)
+        self.summaries = SummaryStore(self.customers_collection)
+        self.context = ContextWindow()
+        self.tool_executor = ToolExecutor(self.tools, self.api_key)
 
     def register_tool(self, schema: Dict, function: Callable):
         tool_name = schema["function"]["name"]
@@ -45,79 +60,74 @@ class SimpleAgent:
         self.tool_schemas.append({"type": "function", "function": schema["function"]})
         logger.debug(f"Registered tool: {tool_name}")
 
+    @traced("history.read")
     def get_conversation_history(self, customer_id: str, limit: int = 10) -> list:
         """Retrieve the last 'limit' messages for a customer."""
         try:
-            result = self.customers_collection.get(customer_id)
-            customer = result.content_as[dict]
-            history = customer.get("conversation_history", [])
+            history = self.conversations.recent(customer_id, limit)
             logger.debug(f"Retrieved {len(history)} messages for customer {customer_id}")
-            return history[-limit:]  # Return the last 'limit' messages
-        except DocumentNotFoundException:
-            logger.warning(f"No conversation history found for customer {customer_id}")
-            return []
+            return history
         except Exception as e:
             logger.error(f"Error retrieving conversation history for {customer_id}: {str(e)}")
             return []
 
+    @traced("history.write", size=None)
     def save_conversation_turn(self, customer_id: str, role: str, content: str):
-        """Save a conversation turn to Couchbase."""
+        """Append a conversation turn to the customer's history in Couchbase."""
         try:
-            timestamp = datetime.now().isoformat()
-            message = {"role": role, "content": content, "timestamp": timestamp}
-            result = self.customers_collection.get(customer_id)
-            customer = result.content_as[dict]
-            customer.setdefault("conversation_history", []).append(message)
-            self.customers_collection.upsert(customer_id, customer)
-            logger.debug(f"Saved conversation turn for {customer_id}: {message}")
-        except DocumentNotFoundException:
-            # Create new customer document if it doesn't exist
-            customer = {"conversation_history": [message], "customer_id": customer_id}
-            self.customers_collection.upsert(customer_id, customer)
-            logger.debug(f"Created new customer document with conversation for {customer_id}")
+            self.conversations.append(customer_id, role, content)
         except Exception as e:
             logger.error(f"Error saving conversation turn for {customer_id}: {str(e)}")
 
+    def build_messages(self, customer_id: str, message: str) -> List[Dict]:
+        """Message list for a new turn, kept within settings.CONTEXT_TOKEN_BUDGET.
+
+        Call before saving the user turn: 'message' is appended here, not read back from history.
+        """
+        history = self.get_conversation_history(customer_id, settings.CONTEXT_HISTORY_FETCH)
+        with span("context.build") as current:
+            try:
+                summary = self.summaries.get(customer_id)
+            except Exception as e:
+                logger.error(f"Error reading conversation summary for {customer_id}: {str(e)}")
+                summary = None
+            messages, tokens, updated = self.context.assemble(self.system_prompt, history, message, summary)
+            if updated is not None:
+                try:
+                    self.summaries.set(customer_id, updated)
+                except Exception as e:
+                    logger.error(f"Error saving conversation summary for {customer_id}: {str(e)}")
+            if current is not None:
+                current.size = tokens
+        context_tokens.observe("grok", tokens)
+        logger.info(f"Context for {customer_id}: {len(messages)} messages, ~{tokens} tokens "
+                    f"(budget {self.context.budget}, {len(history)} history messages read)")
+        return messages
+
+    @traced("agent.chat")
     def chat(self, message: str, customer_id: str, use_tools: bool = False) -> str:
         logger.debug(f"Calling chat with message: {message}, customer_id: {customer_id}, use_tools: {use_tools}")
+        user_saved = False
         try:
-            # Save user message
-            self.save_conversation_turn(customer_id, "user", message)
-            # Get conversation history
-            history = self.get_conversation_history(customer_id)
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            # Build messages with history
-            messages = [{"role": "system", "content": self.system_prompt}] + history + [{"role": "user", "content": message}]
+            # Build the context window from earlier turns; the user message is saved once the model has answered,
+            # so a request shed for overload leaves no trace in the history
+            messages = self.build_messages(customer_id, message)
             payload = {
                 "model": self.model_name,
                 "messages": messages
             }
             if use_tools and self.tools:
                 payload["tools"] = self.tool_schemas
-            logger.debug(f"Sending Grok API request in chat: {json.dumps(payload, indent=2)}")
-            logger.debug(f"Headers: {headers}")
-            response = requests.post(
-                "https://api.x.ai/v1/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            response_data = response.json()
-            logger.debug(f"Grok API response in chat: {json.dumps(response_data, indent=2)}")
-            tool_calls = response_data.get("choices", [{}])[0].get("message", {}).get("tool_calls")
-            if isinstance(tool_calls, str):
-                try:
-                    tool_calls = json.loads(tool_calls).get("tool_calls", [])
-                except json.JSONDecodeError:
-                    logger.error("Failed to parse tool_calls string")
-                    tool_calls = []
+            log_payload(logger, "Sending Grok API request in chat", payload)
+            response_data = chat_completion(payload, self.api_key)
+            log_payload(logger, "Grok API response in chat", response_data)
+            self.save_conversation_turn(customer_id, "user", message)
+            user_saved = True
+            tool_calls = parse_tool_calls(response_data)
             logger.debug(f"Parsed tool_calls: {tool_calls}")
             if use_tools and tool_calls:
                 logger.debug("Entering tool_calls block")
-                response_content = self._handle_tool_calls(message, response_data)
+                response_content = self._handle_tool_calls(message, response_data, messages=messages)
                 # Save assistant response
                 self.save_conversation_turn(customer_id, "assistant", response_content)
                 return response_content
@@ -125,36 +135,99 @@ class SimpleAgent:
             # Save assistant response
             self.save_conversation_turn(customer_id, "assistant", content)
             return content
+        except LLMOverloadedError:
+            raise  # the route answers 503 + Retry-After; nothing goes into the history
         except requests.exceptions.HTTPError as e:
-            error_response = e.response.json() if e.response else {}
-            logger.error(f"HTTP error in chat: {e.response.status_code} - {json.dumps(error_response, indent=2)}")
+            error_response = e.response.json() if e.response is not None else {}
+            log_payload(logger, f"HTTP error in chat: {e.response.status_code}", error_response, logging.ERROR)
+            if not user_saved:
+                self.save_conversation_turn(customer_id, "user", message)
             self.save_conversation_turn(customer_id, "assistant", f"Error: HTTP {e.response.status_code}")
-            return f"Error: HTTP {e.response.status_code} - {json.dumps(error_response, indent=2)}"
+            return f"Error: HTTP {e.response.status_code} - {json.dumps(error_response)}"
         except Exception as e:
             logger.error(f"Error in chat: {str(e)}")
+            if not user_saved:
+                self.save_conversation_turn(customer_id, "user", message)
             self.save_conversation_turn(customer_id, "assistant", f"Error: {str(e)}")
             return f"Error: {str(e)}"
 
-    def _handle_tool_calls(self, original_message: str, response_data: Dict) -> str:
+    def chat_stream(self, message: str, customer_id: str, use_tools: bool = False) -> Iterator[str]:
+        """Like chat, but yields the response text in chunks as the model generates it.
+
+        With tools enabled the first (tool-selection) call is not streamed;
+        the selected tool's completion is. The full text is saved to the
+        conversation history once the stream ends.
+        """
+        logger.debug(f"Calling chat_stream with message: {message}, customer_id: {customer_id}, use_tools: {use_tools}")
+        chunks = []
+        user_saved = False
+        try:
+            messages = self.build_messages(customer_id, message)
+            payload = {
+                "model": self.model_name,
+                "messages": messages
+            }
+            if use_tools and self.tools:
+                payload["tools"] = self.tool_schemas
+                response_data = chat_completion(payload, self.api_key)
+                self.save_conversation_turn(customer_id, "user", message)
+                user_saved = True
+                if parse_tool_calls(response_data):
+                    stream = self._handle_tool_calls(message, response_data, stream=True, messages=messages)
+                else:
+                    stream = iter([response_data["choices"][0]["message"]["content"]])
+            else:
+                stream = stream_chat_completion(payload, self.api_key)
+            for chunk in stream:
+                if not user_saved:
+                    self.save_conversation_turn(customer_id, "user", message)
+                    user_saved = True
+                chunks.append(chunk)
+                yield chunk
+            if not user_saved:
+                self.save_conversation_turn(customer_id, "user", message)
+            self.save_conversation_turn(customer_id, "assistant", "".join(chunks))
+        except LLMOverloadedError:
+            raise
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"HTTP error in chat_stream: {e.response.status_code}")
+            if not user_saved:
+                self.save_conversation_turn(customer_id, "user", message)
+            self.save_conversation_turn(customer_id, "assistant", f"Error: HTTP {e.response.status_code}")
+            yield f"Error: HTTP {e.response.status_code}"
+        except Exception as e:
+            logger.error(f"Error in chat_stream: {str(e)}")
+            if not user_saved:
+                self.save_conversation_turn(customer_id, "user", message)
+            self.save_conversation_turn(customer_id, "assistant", f"Error: {str(e)}")
+            yield f"Error: {str(e)}"
+
+    def _answer_from_tools(self, messages: List[Dict], response_data: Dict, tool_calls: list, stream: bool):
+        """Run all tool calls concurrently and answer them with one follow-up completion."""
+        assistant = dict(response_data["choices"][0]["message"], tool_calls=tool_calls)
+        payload = {
+            "model": self.model_name,
+            "messages": messages + [assistant] + self.tool_executor.run(tool_calls),
+            "tools": self.tool_schemas,
+            "tool_choice": "none",
+        }
+        log_payload(logger, "Sending Grok API tool follow-up", payload)
+        if stream:
+            return stream_chat_completion(payload, self.api_key)
+        response_data = chat_completion(payload, self.api_key)
+        log_payload(logger, "Grok API tool follow-up response", response_data)
+        return response_data["choices"][0]["message"]["content"]
+
+    @traced("agent.tool_calls", size=None)
+    def _handle_tool_calls(self, original_message: str, response_data: Dict, stream: bool = False, messages: List[Dict] = None):
         logger.debug(f"Handling tool calls for message: {original_message}")
-        tool_calls = response_data.get("choices", [{}])[0].get("message", {}).get("tool_calls")
-        if isinstance(tool_calls, str):
-            try:
-                tool_calls = json.loads(tool_calls).get("tool_calls", [])
-            except json.JSONDecodeError:
-                logger.error("Failed to parse tool_calls string")
-                return "Error: Invalid tool call format"
-        for tool_call in tool_calls:
-            function_name = tool_call.get("function", {}).get("name")
-            arguments = tool_call.get("function", {}).get("arguments", {})
-            if isinstance(arguments, str):
-                arguments = json.loads(arguments)
-            if function_name in self.tools:
-                logger.debug(f"Calling tool {function_name} with arguments: {arguments}")
-                try:
-                    result = self.tools[function_name](**arguments, api_key=self.api_key)
-                    return result
-                except Exception as e:
-                    logger.error(f"Error executing tool {function_name}: {str(e)}")
-                    return f"Error executing tool {function_name}: {str(e)}"
-        return "No valid tool calls found"
\ No newline at end of file
+        tool_calls = parse_tool_calls(response_data)
+        if tool_calls is None:
+            return iter(["Error: Invalid tool call format"]) if stream else "Error: Invalid tool call format"
+        known = [c for c in tool_calls if c.get("function", {}).get("name") in self.tools]
+        if len(known) > 1 and messages is not None:
+            # Several intents in one message: one concurrent tool round and one completion instead of one per tool
+            return self._answer_from_tools(messages, response_data, known, stream)
+        if known:
+            return self.tool_executor.call(known[0], stream)
+        return iter(["No valid tool calls found"]) if stream else "No valid tool calls found"
\ No newline at end of file
@@ -1,13 +1,48 @@
 import ollama
 import json
+import logging
 from datetime import datetime
-from typing import Dict, Callable, List
+from typing import Dict, Callable, Iterator, List
+
+from config import settings
+from utils.tracing import Histogram, register_histogram, DURATION_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# Split of Ollama's server-side time per call: model load, prompt prefill, token generation
+ollama_phase_seconds = register_histogram(
+    Histogram("ollama_phase_seconds", "Ollama load, prefill and generation time per call.", DURATION_BUCKETS, label="phase"))
+
+
+def response_timings(response) -> Dict:
+    """Load/prefill/generation timings (seconds) and token counts from a final Ollama response."""
+    def seconds(field):
+        return (response.get(field) or 0) / 1e9
+    return {
+        "load_s": seconds("load_duration"),
+        "prefill_s": seconds("prompt_eval_duration"),
+        "prefill_tokens": response.get("prompt_eval_count") or 0,
+        "generation_s": seconds("eval_duration"),
+        "generated_tokens": response.get("eval_count") or 0,
+        "total_s": seconds("total_duration"),
+    }
+
 
 class SimpleAgent:
-    def __init__(self, model_name: str = "llama3.1"):
+    """Tool-calling agent on a local Ollama model.
+
+    Every request starts with the same system prompt and carries the same
+    tool schemas and num_ctx, so Ollama can reuse the cached prompt prefix
+    (including for the follow-up call after a tool runs) instead of
+    prefilling it again. keep_alive keeps the model loaded between requests.
+    """
+
+    def __init__(self, model_name: str = settings.OLLAMA_MODEL, host: str = settings.OLLAMA_HOST):
         self.model_name = model_name
+        self.client = ollama.Client(host=host)
         self.tools = {}
         self.tool_schemas = []
+        self.last_timings = {}
         # System prompt to encourage tool usage
         self.system_prompt = (
             "you are the best Sales Ai this side of the mississippi. "
@@ -25,32 +60,74 @@ class SimpleAgent:
         self.tools[tool_name] = function
         self.tool_schemas.append(schema)
 
+    def _messages(self, message: str) -> List[Dict]:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": message}
+        ]
+
+    def _record(self, call: str, response):
+        timings = response_timings(response)
+        self.last_timings[call] = timings
+        ollama_phase_seconds.observe("load", timings["load_s"])
+        ollama_phase_seconds.observe("prefill", timings["prefill_s"])
+        ollama_phase_seconds.observe("generation", timings["generation_s"])
+        logger.info(
+            f"Ollama {call}: prefill {timings['prefill_tokens']} tokens in {timings['prefill_s'] * 1000:.0f}ms, "
+            f"generated {timings['generated_tokens']} tokens in {timings['generation_s'] * 1000:.0f}ms, "
+            f"load {timings['load_s'] * 1000:.0f}ms"
+        )
+
+    def _chat(self, call: str, messages: List[Dict], stream: bool = False, **options):
+        """One ollama chat call with the fixed tools/keep_alive/num_ctx that keep the prefix cacheable."""
+        response = self.client.chat(
+            model=self.model_name,
+            messages=messages,
+            tools=self.tool_schemas,
+            stream=stream,
+            keep_alive=settings.OLLAMA_KEEP_ALIVE,
+            options=dict(options, num_ctx=settings.OLLAMA_NUM_CTX),
+        )
+        if not stream:
+            self._record(call, response)
+            return response
+        return self._recorded_stream(call, response)
+
+    def _recorded_stream(self, call: str, chunks):
+        for chunk in chunks:
+            if chunk.get("done"):
+                self._record(call, chunk)
+            yield chunk
+
     def chat(self, message: str) -> str:
         """Process a user message and return a response."""
         try:
-            # Include system prompt and user message
-            messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": message}
-            ]
-            response = ollama.chat(
-                model=self.model_name,
-                messages=messages,
-                tools=self.tool_schemas
-            )
+            response = self._chat("chat", self._messages(message))
             if response.get("message", {}).get("tool_calls"):
                 return self._handle_tool_calls(message, response)
             return response["message"]["content"]
         except Exception as e:
             return f"Error: {str(e)}"
 
-    def _handle_tool_calls(self, original_message: str, response: Dict) -> str:
+    def chat_stream(self, message: str) -> Iterator[str]:
+        """Process a user message and yield the response text as it is generated."""
+        try:
+            tool_calls = []
+            for chunk in self._chat("chat", self._messages(message), stream=True):
+                tool_calls.extend(chunk["message"].get("tool_calls") or [])
+                if chunk["message"].get("content"):
+                    yield chunk["message"]["content"]
+            if tool_calls:
+                yield from self._handle_tool_calls(
+                    message, {"message": {"role": "assistant", "content": "", "tool_calls": tool_calls}}, stream=True
+                )
+        except Exception as e:
+            yield f"Error: {str(e)}"
+
+    def _handle_tool_calls(self, original_message: str, response: Dict, stream: bool = False):
         """Handle tool calls and return the final response."""
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": original_message},
-            response["message"]
-        ]
+        # Same leading messages as the first call, so only the tool turn needs prefilling
+        messages = self._messages(original_message) + [response["message"]]
         for tool_call in response["message"]["tool_calls"]:
             function_name = tool_call["function"]["name"]
             function_args = tool_call["function"]["arguments"]
@@ -63,5 +140,9 @@ class SimpleAgent:
                     "content": str(result),
                     "tool_call_id": tool_call.get("id", "")
                 })
-        final_response = ollama.chat(model=self.model_name, messages=messages)
-        return final_response["message"]["content"]
\ No newline at end of file
+        if stream:
+            # Like the first call: the final chunk (and tool-call chunks) carry no text
+            return (chunk["message"]["content"] for chunk in self._chat("tool_followup", messages, stream=True)
+                    if chunk["message"].get("content"))
+        final_response = self._chat("tool_followup", messages)
+        return final_response["message"]["content"]
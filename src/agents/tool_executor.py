@@ -0,0 +1,189 @@
+"""Runs the tool calls from a model response.
+
+When a response asks for more than one tool, run/arun execute them
+concurrently: each handler runs in data-only mode (it returns the context it
+gathered instead of making its own completion), and the agent feeds all
+results back in a single follow-up completion. Each tool gets
+settings.TOOL_TIMEOUT seconds and its output is capped at
+settings.TOOL_RESULT_MAX_CHARS before it goes back to the model. A running
+thread can't be cancelled, so tools that write (settings.TOOL_NO_TIMEOUT)
+are always waited for: the model must never be told a purchase failed when
+it went through.
+
+A single tool call goes through call/acall, and the handler makes its own
+(optionally streamed) completion.
+"""
+import asyncio
+import contextvars
+import inspect
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Tuple
+
+from config import settings
+from utils.llm_limiter import LLMOverloadedError
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Separate from the lookup pool: tools fan out their own lookups there and must not wait on themselves
+_pool = ThreadPoolExecutor(max_workers=settings.TOOL_POOL_WORKERS, thread_name_prefix="tool")
+
+
+def parse_call(tool_call: Dict) -> Tuple[str, str, Dict]:
+    """(id, function name, arguments) of an OpenAI-style tool call; arguments may arrive JSON-encoded."""
+    function = tool_call.get("function", {})
+    arguments = function.get("arguments") or {}
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments)
+    return tool_call.get("id", ""), function.get("name"), arguments
+
+
+class ToolExecutor:
+    def __init__(self, tools: Dict[str, Callable], api_key: str, timeout: float = settings.TOOL_TIMEOUT,
+                 max_chars: int = settings.TOOL_RESULT_MAX_CHARS, no_timeout: tuple = settings.TOOL_NO_TIMEOUT):
+        self.tools = tools
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_chars = max_chars
+        self.no_timeout = set(no_timeout)
+
+    def _call_args(self, function: Callable, arguments: Dict, data_only: bool, stream: bool = False) -> Dict:
+        """Add api_key / data_only / stream for the tools that take them."""
+        parameters = inspect.signature(function).parameters
+        kwargs = dict(arguments)
+        if "api_key" in parameters:
+            kwargs["api_key"] = self.api_key
+        if data_only and "data_only" in parameters:
+            kwargs["data_only"] = True
+        if stream and "stream" in parameters:
+            kwargs["stream"] = True
+        return kwargs
+
+    def _cap(self, name: str, result) -> str:
+        text = result if isinstance(result, str) else json.dumps(result, default=str)
+        if len(text) > self.max_chars:
+            logger.warning(f"Tool {name} returned {len(text)} characters; truncated to {self.max_chars}")
+            text = f"{text[:self.max_chars]}... [truncated]"
+        return text
+
+    def _invoke(self, name: str, arguments: Dict, data_only: bool) -> str:
+        function = self.tools[name]
+        start = time.perf_counter()
+        try:
+            with span(f"tool.{name}"):
+                result = function(**self._call_args(function, arguments, data_only))
+            return self._cap(name, result)
+        except Exception as e:
+            logger.error(f"Error executing tool {name}: {str(e)}")
+            return f"Error executing tool {name}: {str(e)}"
+        finally:
+            logger.debug(f"Tool {name} finished in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    def _resolve(self, tool_call: Dict):
+        """(id, name, arguments, error) for one call; error is set when it can't be run."""
+        try:
+            call_id, name, arguments = parse_call(tool_call)
+        except json.JSONDecodeError:
+            return tool_call.get("id", ""), None, None, "Error: tool arguments are not valid JSON"
+        if name not in self.tools:
+            return call_id, name, None, f"Error: unknown tool {name}"
+        return call_id, name, arguments, None
+
+    def run(self, tool_calls: List[Dict], data_only: bool = True) -> List[Dict]:
+        """Execute all calls concurrently; returns one 'tool' message per call, in call order."""
+        resolved = [self._resolve(tool_call) for tool_call in tool_calls]
+        futures = {
+            i: _pool.submit(contextvars.copy_context().run, self._invoke, name, arguments, data_only)
+            for i, (_, name, arguments, error) in enumerate(resolved) if error is None
+        }
+        wait(futures.values(), timeout=self.timeout)
+        messages = []
+        for i, (call_id, name, _, error) in enumerate(resolved):
+            future = futures.get(i)
+            if future is None:
+                content = error
+            elif future.done() or name in self.no_timeout:
+                content = future.result()
+            else:
+                future.cancel()
+                logger.error(f"Tool {name} timed out after {self.timeout}s")
+                content = f"Error: tool {name} timed out after {self.timeout}s"
+            messages.append({"role": "tool", "tool_call_id": call_id, "name": name, "content": content})
+        return messages
+
+    async def _ainvoke(self, name: str, arguments: Dict, data_only: bool) -> str:
+        function = self.tools[name]
+        kwargs = self._call_args(function, arguments, data_only)
+        timeout = None if name in self.no_timeout else self.timeout
+        try:
+            with span(f"tool.{name}"):
+                if inspect.iscoroutinefunction(function):
+                    result = await asyncio.wait_for(function(**kwargs), timeout)
+                else:
+                    # Sync tools block on Couchbase and HTTP; keep them off the event loop
+                    loop = asyncio.get_running_loop()
+                    call = contextvars.copy_context().run
+                    result = await asyncio.wait_for(
+                        loop.run_in_executor(_pool, lambda: call(function, **kwargs)), timeout)
+            return self._cap(name, result)
+        except asyncio.TimeoutError:
+            logger.error(f"Tool {name} timed out after {self.timeout}s")
+            return f"Error: tool {name} timed out after {self.timeout}s"
+        except Exception as e:
+            logger.error(f"Error executing tool {name}: {str(e)}")
+            return f"Error executing tool {name}: {str(e)}"
+
+    async def arun(self, tool_calls: List[Dict], data_only: bool = True) -> List[Dict]:
+        """asyncio version of run."""
+        resolved = [self._resolve(tool_call) for tool_call in tool_calls]
+
+        async def one(name, arguments, error):
+            return error if error is not None else await self._ainvoke(name, arguments, data_only)
+
+        contents = await asyncio.gather(*(one(name, arguments, error) for _, name, arguments, error in resolved))
+        return [{"role": "tool", "tool_call_id": call_id, "name": name, "content": content}
+                for (call_id, name, _, _), content in zip(resolved, contents)]
+
+    def call(self, tool_call: Dict, stream: bool = False):
+        """Run one tool call with its own completion; returns the text, or an iterator of chunks when stream is True.
+
+        Errors come back as text; LLMOverloadedError propagates so the route can answer 503.
+        """
+        _, name, arguments, error = self._resolve(tool_call)
+        if error is None:
+            function = self.tools[name]
+            kwargs = self._call_args(function, arguments, False, stream)
+            logger.debug(f"Calling tool {name} with arguments: {arguments}")
+            try:
+                with span(f"tool.{name}"):
+                    result = function(**kwargs)
+                return result if "stream" in kwargs else (iter([result]) if stream else result)
+            except LLMOverloadedError:
+                raise
+            except Exception as e:
+                logger.error(f"Error executing tool {name}: {str(e)}")
+                error = f"Error executing tool {name}: {str(e)}"
+        return iter([error]) if stream else error
+
+    async def acall(self, tool_call: Dict) -> str:
+        """asyncio version of call (not streamed)."""
+        _, name, arguments, error = self._resolve(tool_call)
+        if error is not None:
+            return error
+        function = self.tools[name]
+        kwargs = self._call_args(function, arguments, False)
+        logger.debug(f"Calling tool {name} with arguments: {arguments}")
+        try:
+            with span(f"tool.{name}"):
+                if inspect.iscoroutinefunction(function):
+                    return await function(**kwargs)
+                # Sync tools block on Couchbase and HTTP; keep them off the event loop
+                return await asyncio.to_thread(function, **kwargs)
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"Error executing tool {name}: {str(e)}")
+            return f"Error executing tool {name}: {str(e)}"
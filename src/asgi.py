@@ -0,0 +1,16 @@
+"""ASGI entry point serving the asyncio request path.
+
+Run with an ASGI server from the src directory, e.g.:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4 --timeout-graceful-shutdown 30
+Each worker process opens its own connections in before_serving.
+"""
+from quart import Quart
+from utils.logging_setup import configure_logging
+
+configure_logging()
+
+app = Quart(__name__)
+
+from routes.async_routes import async_routes  # Ensure routes are registered
+
+app.register_blueprint(async_routes)
@@ -1,4 +1,134 @@
 MODEL_PATH = "path/to/your/model"
 API_KEY = "your_api_key_here"
 DEBUG = True
-LOG_LEVEL = "INFO"
\ No newline at end of file
+LOG_LEVEL = "INFO"
+
+# Couchbase (one shared connection per process, see utils/couchbase_manager.py)
+COUCHBASE_URL = "couchbase://localhost"  # use 'couchbases://' for TLS
+COUCHBASE_USERNAME = "Administrator"
+COUCHBASE_PASSWORD = "Administrator"
+CUSTOMERS_BUCKET = "customer_data"
+PRODUCTS_BUCKET = "products"
+SALES_STATS_BUCKET = "sales_cache"
+COUCHBASE_READY_TIMEOUT = 10.0   # seconds per wait_until_ready attempt
+COUCHBASE_RETRY_INTERVAL = 5.0   # seconds between background connection attempts
+
+# Grok completions client
+GROK_BASE_URL = "https://api.x.ai/v1"
+GROK_MODEL = "grok-3-mini"
+LLM_POOL_CONNECTIONS = 4        # number of distinct hosts kept in the pool
+LLM_POOL_MAXSIZE = 32           # keep-alive connections per host
+LLM_CONNECT_TIMEOUT = 3.05      # seconds
+LLM_READ_TIMEOUT = 60.0         # seconds
+LLM_MAX_RETRIES = 3             # retries on 429/5xx and connection errors
+LLM_BACKOFF_BASE = 0.5          # seconds, doubled on each attempt
+LLM_BACKOFF_MAX = 8.0           # seconds, cap for a single backoff sleep
+LLM_SINGLEFLIGHT_ENABLED = True # identical concurrent requests share one upstream call
+LLM_SINGLEFLIGHT_WAIT = 90.0    # seconds a coalesced caller waits for the shared result (a stream: its first chunk)
+
+# Upstream LLM concurrency (utils/llm_limiter.py): AIMD limit on in-flight Grok calls per process
+LLM_CONCURRENCY_INITIAL = 16    # starting limit
+LLM_CONCURRENCY_MIN = 1
+LLM_CONCURRENCY_MAX = 64        # ceiling however well the provider keeps up
+LLM_CONCURRENCY_BACKOFF = 0.75  # limit multiplier on a 429/503 from the provider
+LLM_QUEUE_MAX = 256             # callers waiting for a slot before new ones are shed
+LLM_QUEUE_TIMEOUT = 10.0        # seconds a caller waits for a slot before it is shed with a 503
+
+# Conversation history
+HISTORY_MAX_MESSAGES = 100      # live messages kept on the customer document
+HISTORY_ARCHIVE_BATCH = 50      # oldest messages moved to an archive document once the cap is hit
+HISTORY_ARCHIVE_RETRIES = 3     # CAS retries before leaving archiving to the next turn
+
+# In-process caches (sizes in entries, TTLs in seconds)
+PRODUCT_CACHE_SIZE = 5000
+PRODUCT_CACHE_TTL = 300
+CUSTOMER_CACHE_SIZE = 10000
+CUSTOMER_CACHE_TTL = 30
+SALES_STATS_CACHE_SIZE = 5000
+SALES_STATS_CACHE_TTL = 600
+SALES_STATS_REFRESH_INTERVAL = 120  # re-read cached styles this often; 0 disables the refresher
+SALES_STATS_FETCH_CHUNK = 500
+
+# Recommendation index
+RECOMMENDATION_INDEX_ENABLED = True
+RECOMMENDATION_REFRESH_INTERVAL = 300   # seconds between background rebuilds
+RECOMMENDATION_TOP_N = 20               # products kept per category (ranked by the query service)
+
+# Embedding similarity engine (vectors are built offline: python -m utils.similarity --output <dir>)
+SIMILARITY_ENGINE_ENABLED = False
+SIMILARITY_INDEX_DIR = "resources/similarity"
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64
+SIMILARITY_BLOCK_ROWS = 65536   # matrix rows scored per batched dot product
+
+# Response cache for handle_general_question. Opt-in: cached answers come from a shared prompt that leaves out
+# the customer's name and purchase history so they can be reused across a loyalty tier, which makes every
+# answer less personal in exchange for skipping the model on repeated questions.
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_SIZE = 2000
+RESPONSE_CACHE_TTL = 900
+RESPONSE_CACHE_SEMANTIC = False             # also match paraphrased questions by embedding similarity
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = 0.92  # cosine similarity needed for a semantic hit
+RESPONSE_CACHE_SEMANTIC_BUCKET = 64         # questions remembered per (style, category, loyalty tier) for semantic matching
+
+# Thread pool for concurrent Couchbase lookups inside the tool handlers
+LOOKUP_POOL_WORKERS = 32
+
+# Request tracing; switched on per request with the header, or for every request with TRACING_ALWAYS
+TRACE_HEADER = "X-Trace"
+TRACING_ALWAYS = False
+
+# Logging: records go through a bounded queue to a background writer; payload bodies are compacted
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_QUEUE_SIZE = 10000
+LOG_PAYLOAD_MAX_CHARS = 4000
+LOG_PAYLOAD_MAX_STRING = 500
+LOG_PAYLOAD_MAX_ITEMS = 20
+LOG_PAYLOAD_SAMPLE_RATE = 1.0
+
+# Batch retention runs (/retain/batch and python -m utils.batch)
+BATCH_CONCURRENCY = 8
+BATCH_RATE_LIMIT_RPS = 0  # 0 = no cap; otherwise max completions started per second across workers
+BATCH_FETCH_CHUNK = 500
+BATCH_JOB_RETRIES = 3
+BATCH_CHECKPOINT_DIR = "resources/batches"
+
+# Bulk document loader (utils/bulk_loader.py, populate_cust_CB.py)
+BULK_BATCH_SIZE = 500
+BULK_CONCURRENCY = 8
+BULK_PROGRESS_INTERVAL = 5.0
+
+# Prompt rendering
+PROMPT_SNIPPET_CACHE_SIZE = 5000
+PROMPT_HISTORY_ITEMS = 5  # most recent purchases listed in the purchase-history digest
+
+# Conversation context window (token counts are estimates, about four characters per token)
+CONTEXT_TOKEN_BUDGET = 3000          # system prompt + summary + history + new message
+CONTEXT_MAX_MESSAGES = 10            # newest history messages considered for the window
+CONTEXT_HISTORY_FETCH = 20           # messages read per turn; the ones beyond the window feed the summary
+CONTEXT_MESSAGE_MAX_TOKENS = 500     # a single history message is truncated to this
+CONTEXT_SUMMARY_MAX_TOKENS = 300     # rolling summary of older turns
+CONTEXT_SUMMARY_CACHE_SIZE = 10000
+CONTEXT_SUMMARY_CACHE_TTL = 300
+
+# Local Ollama agent (agents/simple_agent.py)
+OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_MODEL = "llama3.1"
+OLLAMA_KEEP_ALIVE = "30m"   # keep the model (and its prompt cache) resident between requests
+OLLAMA_NUM_CTX = 8192       # must be identical on every call; a different value reloads the model
+
+# Tool execution when one model response calls several tools (agents/tool_executor.py)
+TOOL_POOL_WORKERS = 16
+TOOL_TIMEOUT = 20.0             # seconds per tool; a slow tool reports a timeout instead of holding the turn
+TOOL_RESULT_MAX_CHARS = 4000    # tool output passed back to the model is truncated to this
+TOOL_NO_TIMEOUT = ("mock_purchase",)  # tools that write: always waited for, since a timed-out write still happens
+
+# Production serving (gunicorn.conf.py; asgi.py runs under uvicorn --workers)
+SERVER_BIND = "0.0.0.0:5000"
+SERVER_WORKERS = 0              # processes; 0 = 2 x CPUs + 1
+SERVER_THREADS = 8              # threads per process; requests mostly wait on Grok and Couchbase
+SERVER_TIMEOUT = 120            # seconds before a silent worker is killed and replaced
+SERVER_GRACEFUL_TIMEOUT = 30    # seconds in-flight requests get to finish on shutdown/reload
+SERVER_KEEPALIVE = 5
+SERVER_MAX_REQUESTS = 0         # recycle workers after this many requests (0 = never)
+SERVER_PRELOAD = True           # import the app once in the master; workers fork from it
@@ -0,0 +1,32 @@
+"""gunicorn settings for the Flask service; values come from config/settings.py.
+
+    gunicorn -c gunicorn.conf.py main:app   (from the src directory)
+
+With preload the app is imported once in the master and forked; each worker
+then builds its own agent, Couchbase connection and refresher threads in
+post_fork, and releases them in worker_exit.
+"""
+import multiprocessing
+
+from config import settings
+
+bind = settings.SERVER_BIND
+workers = settings.SERVER_WORKERS or multiprocessing.cpu_count() * 2 + 1
+worker_class = "gthread"
+threads = settings.SERVER_THREADS
+timeout = settings.SERVER_TIMEOUT
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+keepalive = settings.SERVER_KEEPALIVE
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS // 10
+preload_app = settings.SERVER_PRELOAD
+
+
+def post_fork(server, worker):
+    from routes.routes import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from routes.routes import shutdown_worker
+    shutdown_worker()
@@ -1,15 +1,32 @@
-from datetime import datetime
-from agents.simple_agent import SimpleAgent
-from typing import Dict, Callable, List
-from flask import Flask, request, jsonify
+"""Flask entry point.
 
-app = Flask(__name__)
+Development:  python main.py  (Werkzeug server; debug follows settings.DEBUG)
+Production:   gunicorn -c gunicorn.conf.py main:app  (run from the src directory)
+"""
+import os
 
-from routes.routes import routes  # Ensure routes are registered
+from flask import Flask
+from config import settings
+from utils.logging_setup import configure_logging
 
-app.register_blueprint(routes)
+
+def create_app() -> Flask:
+    """Build the app without per-process state; routes.init_worker adds that after fork."""
+    configure_logging()
+    app = Flask(__name__)
+    from routes.routes import routes  # Ensure routes are registered
+    app.register_blueprint(routes)
+    return app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
-    print("Starting Flask server with Simple AI Agent...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    from routes.routes import init_worker
+    host, port = settings.SERVER_BIND.rsplit(":", 1)
+    print("Starting Flask development server with Simple AI Agent...")
+    # With the reloader on, this process only watches files; the child it spawns (WERKZEUG_RUN_MAIN set) serves
+    if not settings.DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        init_worker()
+    app.run(host=host, port=int(port), debug=settings.DEBUG, use_reloader=settings.DEBUG)
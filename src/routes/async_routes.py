@@ -0,0 +1,153 @@
+from quart import Blueprint, Response, request, jsonify, g
+from agents.async_grok_agent import AsyncSimpleAgent
+from utils.tool_utils import get_current_time, ahandle_complaint, ahandle_general_question, amock_purchase, recommendation_index, sales_stats_store
+from utils.cache import cache_stats
+from utils.couchbase_manager import couchbase_manager
+from utils import tracing
+from utils.llm_limiter import LLMOverloadedError
+from utils.schemas import time_tool_schema, handle_complaint_schema, handle_general_question_schema, mock_purchase_schema
+import logging
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Initialize the agent globally; its Couchbase connection is opened in before_serving.
+# The Couchbase tools are the coroutine versions, awaited on the event loop rather than run in the tool pool.
+agent = AsyncSimpleAgent()
+agent.register_tool(time_tool_schema, get_current_time)
+agent.register_tool(handle_complaint_schema, ahandle_complaint)
+agent.register_tool(handle_general_question_schema, ahandle_general_question)
+agent.register_tool(mock_purchase_schema, amock_purchase)
+
+async_routes = Blueprint("async_routes", __name__)
+
+
+@async_routes.before_app_serving
+async def connect_agent():
+    # Runs in each server worker process, so background threads and connections are per worker
+    if settings.RECOMMENDATION_INDEX_ENABLED:
+        recommendation_index.start()
+    sales_stats_store.start()
+    couchbase_manager.start()
+    await agent.connect()
+
+
+@async_routes.after_app_serving
+async def close_agent():
+    recommendation_index.stop()
+    sales_stats_store.stop()
+    await agent.close()
+    await couchbase_manager.aclose()
+
+
+@async_routes.before_request
+async def start_trace():
+    if tracing.wants_trace(request.headers.get(settings.TRACE_HEADER)):
+        g.trace_token = tracing.start_trace()
+
+
+@async_routes.app_errorhandler(LLMOverloadedError)
+async def overloaded(e: LLMOverloadedError):
+    """Shed load: the upstream LLM is at its limit, tell the client when to come back."""
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+
+@async_routes.after_request
+async def finish_trace(response):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        spans = tracing.end_trace(token)
+        tracing.log_trace(request.path, spans)
+        response.headers["Server-Timing"] = tracing.server_timing(spans)
+    return response
+
+
+@async_routes.route('/ask', methods=['POST'])
+async def ask():
+    """Endpoint to handle user queries and return agent responses."""
+    try:
+        data = await request.get_json()
+        if not data or 'query' not in data:
+            return jsonify({"error": "Missing 'query' in JSON payload"}), 400
+        response = await agent.chat(data['query'], customer_id=data.get('customer_id', 'anonymous'))
+        return jsonify({"response": response})
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@async_routes.route('/health', methods=['GET'])
+async def health_check():
+    """Readiness check: 503 until this worker's Couchbase connections (sync and acouchbase) are ready."""
+    couchbase = couchbase_manager.status()
+    if couchbase["status"] != "ready" or couchbase.get("async", {}).get("status") != "ready":
+        return jsonify({"status": "starting", "couchbase": couchbase}), 503
+    return jsonify({"status": "ok", "couchbase": couchbase}), 200
+
+
+@async_routes.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Endpoint to expose hit, miss and eviction counters of the in-process caches."""
+    return jsonify({"caches": cache_stats()}), 200
+
+
+@async_routes.route('/metrics', methods=['GET'])
+async def metrics():
+    """Endpoint to expose span latency/size histograms and cache counters in Prometheus text format."""
+    return Response(tracing.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@async_routes.route('/tools', methods=['GET'])
+async def list_tools():
+    """Endpoint to list available tools and their schemas."""
+    return jsonify({"tools": agent.tool_schemas}), 200
+
+
+@async_routes.route('/cancel', methods=['POST'])
+async def cancel_order():
+    try:
+        data = await request.get_json()
+        customer_id = data.get('customer_id')
+        style = data.get('style')
+        if not customer_id or not style:
+            return jsonify({"error": "Missing customer_id or style"}), 400
+        response = await agent.chat(
+            f"Handle cancellation for customer {customer_id} and style {style}",
+            customer_id=customer_id,
+            use_tools=False
+        )
+        return jsonify({"message": response}), 200
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error in cancel_order: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@async_routes.route('/retain', methods=['POST'])
+async def handle_complain():
+    try:
+        data = await request.get_json()
+        customer_id = data.get('customer_id')
+        style = data.get('style')
+        complaint = data.get('complaint')
+
+        if not customer_id:
+            return jsonify({"error": "Missing customer_id"}), 400
+
+        purchase_keywords = ["purchase", "buy", "order"]
+        is_purchase = complaint and any(keyword in complaint.lower() for keyword in purchase_keywords) and style
+
+        if is_purchase:
+            message = f"Mock purchase for customer {customer_id} and productID {style}: {complaint or 'None'}"
+        else:
+            message = f"Handle the following query from {customer_id} and productID (optional) {style or 'None'} with either a question, a complaint or a cancellation request: {complaint or 'None'}"
+        response = await agent.chat(message, customer_id=customer_id, use_tools=True)
+        return jsonify({"message": response}), 200
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,24 +1,107 @@
-from flask import Flask, request, jsonify, Blueprint
+from flask import Flask, request, jsonify, Blueprint, Response, stream_with_context, g
 #from agents.simple_agent import SimpleAgent
 from agents.grok_agent import SimpleAgent
+import itertools
 import json
-from utils.tool_utils import get_current_time, handle_complaint, handle_general_question, mock_purchase
+import threading
+import uuid
+from utils.tool_utils import get_current_time, handle_complaint, handle_general_question, mock_purchase, recommendation_index, sales_stats_store
+from utils.cache import cache_stats
+from utils.couchbase_manager import couchbase_manager
+from utils import tracing
+from utils.logging_setup import log_payload
+from utils.batch import run_batch, checkpoint_path
+from utils.llm_client import close_client
+from utils.llm_limiter import LLMOverloadedError
 from utils.schemas import time_tool_schema, handle_complaint_schema, handle_general_question_schema, mock_purchase_schema
 import logging
+from config import settings
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Initialize the agent globally
-agent = SimpleAgent()
-agent.register_tool(time_tool_schema, get_current_time)
-agent.register_tool(handle_complaint_schema, handle_complaint)
-agent.register_tool(handle_general_question_schema, handle_general_question)
-agent.register_tool(mock_purchase_schema, mock_purchase)
+# Per-process state, created by init_worker after the server forks (see gunicorn.conf.py)
+agent: SimpleAgent = None
+_init_lock = threading.Lock()
+
+
+def init_worker():
+    """Build the agent and start this process's background refreshers and Couchbase connect; idempotent."""
+    global agent
+    with _init_lock:
+        if agent is not None:
+            return
+        worker_agent = SimpleAgent()
+        worker_agent.register_tool(time_tool_schema, get_current_time)
+        worker_agent.register_tool(handle_complaint_schema, handle_complaint)
+        worker_agent.register_tool(handle_general_question_schema, handle_general_question)
+        worker_agent.register_tool(mock_purchase_schema, mock_purchase)
+        if settings.RECOMMENDATION_INDEX_ENABLED:
+            recommendation_index.start()
+        sales_stats_store.start()
+        couchbase_manager.start()
+        agent = worker_agent
+
+
+def shutdown_worker():
+    """Stop background work and close pooled connections; called as a worker exits."""
+    recommendation_index.stop()
+    sales_stats_store.stop()
+    close_client()
+    couchbase_manager.close()
 # Create a Flask Blueprint for routes
 
 routes = Blueprint("routes", __name__)
 
+
+@routes.before_request
+def start_trace():
+    if agent is None:
+        init_worker()  # servers without a post-fork hook (dev server, plain WSGI containers)
+    if tracing.wants_trace(request.headers.get(settings.TRACE_HEADER)):
+        g.trace_token = tracing.start_trace()
+
+
+@routes.app_errorhandler(LLMOverloadedError)
+def overloaded(e: LLMOverloadedError):
+    """Shed load: the upstream LLM is at its limit, tell the client when to come back."""
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+
+@routes.after_request
+def finish_trace(response):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        spans = tracing.end_trace(token)
+        tracing.log_trace(request.path, spans)
+        response.headers["Server-Timing"] = tracing.server_timing(spans)
+    return response
+
+
+def _wants_stream(data: dict) -> bool:
+    return bool(data.get('stream')) or request.args.get('stream') in ('1', 'true')
+
+
+def _event_stream(chunks):
+    """Server-sent events: one JSON delta per chunk, then [DONE]."""
+    for chunk in chunks:
+        yield f"data: {json.dumps({'delta': chunk})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def _streaming_response(chunks) -> Response:
+    # Pull the first chunk here, so a call shed by the LLM limiter still becomes a 503 rather than a broken stream
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is not None:
+        chunks = itertools.chain([first], chunks)
+    return Response(
+        stream_with_context(_event_stream(chunks)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @routes.route('/ask', methods=['POST'])
 def ask():
     """Endpoint to handle user queries and return agent responses."""
@@ -28,16 +111,36 @@ def ask():
             return jsonify({"error": "Missing 'query' in JSON payload"}), 400
         
         query = data['query']
-        response = agent.chat(query)
+        customer_id = data.get('customer_id', 'anonymous')
+        if _wants_stream(data):
+            return _streaming_response(agent.chat_stream(query, customer_id=customer_id))
+        response = agent.chat(query, customer_id=customer_id)
         return jsonify({"response": response})
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
 
 @routes.route('/health', methods=['GET'])
 def health_check():
-    """Simple health check endpoint."""
-    return jsonify({"status": "ok"}), 200
+    """Readiness check: 503 until this worker's Couchbase connection is ready."""
+    couchbase = couchbase_manager.status()
+    if couchbase["status"] != "ready":
+        return jsonify({"status": "starting", "couchbase": couchbase}), 503
+    return jsonify({"status": "ok", "couchbase": couchbase}), 200
+
+
+@routes.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Endpoint to expose hit, miss and eviction counters of the in-process caches."""
+    return jsonify({"caches": cache_stats()}), 200
+
+
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+    """Endpoint to expose span latency/size histograms and cache counters in Prometheus text format."""
+    return Response(tracing.render_metrics(), mimetype="text/plain; version=0.0.4")
 
 
 @routes.route('/tools', methods=['GET'])
@@ -50,7 +153,7 @@ def list_tools():
 def cancel_order():
     try:
         data = request.get_json()
-        logger.debug(f"Received request: {json.dumps(data, indent=2)}")
+        log_payload(logger, "Received request", data)
         customer_id = data.get('customer_id')
         style = data.get('style')
         if not customer_id or not style:
@@ -58,9 +161,12 @@ def cancel_order():
 
         # Use the agent to handle the cancellation
         # Test without tools to isolate issue
-        response = agent.chat(f"Handle cancellation for customer {customer_id} and style {style}", use_tools=False)
+        response = agent.chat(f"Handle cancellation for customer {customer_id} and style {style}", customer_id=customer_id,
+                              use_tools=False)
         logger.debug(f"Agent response: {response}")
         return jsonify({"message": response}), 200
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         logger.error(f"Error in cancel_order: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -103,18 +209,56 @@ def handle_complain():
 
         if is_purchase:
             # Handle mock purchase
-            response = agent.chat(
-                f"Mock purchase for customer {customer_id} and productID {style}: {complaint or 'None'}",
-                customer_id=customer_id,
-                use_tools=True
-            )
+            message = f"Mock purchase for customer {customer_id} and productID {style}: {complaint or 'None'}"
         else:
             # Handle complaint, cancellation, or general question
-            response = agent.chat(
-                f"Handle the following query from {customer_id} and productID (optional) {style or 'None'} with either a question, a complaint or a cancellation request: {complaint or 'None'}",
-                customer_id=customer_id,
-                use_tools=True
-            )
+            message = f"Handle the following query from {customer_id} and productID (optional) {style or 'None'} with either a question, a complaint or a cancellation request: {complaint or 'None'}"
+        if _wants_stream(data):
+            return _streaming_response(agent.chat_stream(message, customer_id=customer_id, use_tools=True))
+        response = agent.chat(message, customer_id=customer_id, use_tools=True)
         return jsonify({"message": response}), 200
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _ndjson(first, records, batch_id: str):
+    """One JSON record per line; an error after the headers went out becomes a final error record."""
+    if first is None:
+        return
+    yield json.dumps(first) + "\n"
+    try:
+        for record in records:
+            yield json.dumps(record) + "\n"
+    except Exception as e:
+        logger.error(f"Batch {batch_id} stopped: {str(e)}")
+        yield json.dumps({"status": "error", "error": str(e), "batch_id": batch_id}) + "\n"
+
+
+@routes.route('/retain/batch', methods=['POST'])
+def retain_batch():
+    """Endpoint to generate retention messages for many jobs; streams one JSON result per line.
+
+    Re-posting the same jobs with the returned batch_id resumes an interrupted batch.
+    """
+    try:
+        data = request.get_json()
+        jobs = data.get('jobs') if data else None
+        if not isinstance(jobs, list) or not jobs:
+            return jsonify({"error": "Missing 'jobs' list in JSON payload"}), 400
+        batch_id = data.get('batch_id') or uuid.uuid4().hex
+        concurrency = data.get('concurrency', settings.BATCH_CONCURRENCY)
+        if isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+            return jsonify({"error": "'concurrency' must be a positive integer"}), 400
+        concurrency = min(concurrency, settings.BATCH_CONCURRENCY)
+        records = run_batch(jobs, agent.api_key, checkpoint_path(batch_id), concurrency)
+        # The first record comes out here, so validation and early Couchbase errors still get a 500
+        first = next(records, None)
+        return Response(
+            stream_with_context(_ndjson(first, records, batch_id)),
+            mimetype="application/x-ndjson",
+            headers={"X-Batch-Id": batch_id, "X-Accel-Buffering": "no"}
+        )
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
@@ -1,62 +1,230 @@
-import pandas as pd
+"""Aggregate the Amazon sales report into per-style sales stats documents in Couchbase.
+
+Run from the src directory:
+    python -m utils.CB_pandas --csv Amazon_Sale_Report.csv               # full rebuild
+    python -m utils.CB_pandas --csv Amazon_Sale_Report.csv --incremental # fold in rows added since the last run
+
+The CSV is read in chunks with only the needed columns and compact dtypes;
+per-chunk partial aggregates are merged, so memory depends on the number of
+(style, status) pairs, not on the number of rows. Each style gets its own
+small document (see utils/sales_stats.py) and the overall figures plus the
+number of rows consumed per source file go in a summary document. A full
+rebuild removes the documents of styles that are no longer in the report,
+and the legacy monolith unless --write-monolith rewrites it; an incremental
+run reads and rewrites the affected style documents WRITE_BATCH at a time
+with get_multi/upsert_multi, so it assumes no other writer runs at the same
+time (as the summary update already does).
+"""
+import argparse
+import os
+from collections import Counter
 from datetime import timedelta
-from couchbase.cluster import Cluster
-from couchbase.auth import PasswordAuthenticator
-from couchbase.options import ClusterOptions
-from couchbase.exceptions import CouchbaseException
+from typing import Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+from couchbase.options import MutateInOptions, QueryOptions
+from couchbase.subdocument import StoreSemantics
+from couchbase.exceptions import CouchbaseException, DocumentNotFoundException
+import couchbase.subdocument as SD
 
-csv_file = r"c:\tools\jdtls\archive\Amazon_Sale_Report.csv"
+from config import settings
+from utils.couchbase_manager import couchbase_manager
+from utils.sales_stats import MONOLITH_KEY, STYLE_KEY_PREFIX, SUMMARY_KEY, style_key, subdoc_path
 
-# Step 1: Load and analyze the CSV
-# Replace 'your_sales.csv' with your actual file path
-df = pd.read_csv(csv_file)
+COLUMN_DTYPES = {"Style": "category", "Status": "category", "sales_amount": "float64", "Qty": "float32", "Amount": "float64"}
+MAX_MUTATE_SPECS = 16  # Couchbase limit on specs per mutate_in
+WRITE_BATCH = 500
 
-if 'Style' not in df.columns or 'Status' not in df.columns:
-    raise ValueError("CSV must have 'Style' and 'Status' columns.")
-if 'sales_amount' not in df.columns:
+
+def _columns(csv_file: str) -> list:
+    header = pd.read_csv(csv_file, nrows=0).columns
+    if 'Style' not in header or 'Status' not in header:
+        raise ValueError("CSV must have 'Style' and 'Status' columns.")
+    if 'sales_amount' in header:
+        return ['Style', 'Status', 'sales_amount']
     # Fallback: Compute sales_amount if needed (adjust column names based on your CSV)
-    if 'Qty' in df.columns and 'Amount' in df.columns:
-        df['sales_amount'] = df['Qty'] * df['Amount']
-    else:
-        raise ValueError("CSV must have 'sales_amount' or 'Qty' and 'Amount' columns to compute it.")
-
-# Compute statistics
-stats = {
-    'total_sales': float(df['sales_amount'].sum()),
-    'average_sales': float(df['sales_amount'].mean()),
-    'min_sales': float(df['sales_amount'].min()),
-    'max_sales': float(df['sales_amount'].max()),
-    'entry_count': int(df['sales_amount'].count()),
-    'style_status_counts': {}
-}
-
-# Group by Style and Status, count occurrences
-style_status_counts = df.groupby(['Style', 'Status']).size().unstack(fill_value=0).to_dict('index')
-
-# Build nested structure: {Style: {total_count: X, status_counts: {Status1: Y, Status2: Z, ...}}
-for style, status_counts in style_status_counts.items():
-    stats['style_status_counts'][str(style)] = {
-        'total_count': int(sum(status_counts.values())),
-        'status_counts': {str(k): int(v) for k, v in status_counts.items()}
+    if 'Qty' in header and 'Amount' in header:
+        return ['Style', 'Status', 'Qty', 'Amount']
+    raise ValueError("CSV must have 'sales_amount' or 'Qty' and 'Amount' columns to compute it.")
+
+
+def aggregate(csv_file: str, chunksize: int, skip_rows: int = 0) -> Tuple[Dict, Counter, int]:
+    """Partial aggregates of the rows after skip_rows: (sales figures, (style, status) counts, rows read)."""
+    columns = _columns(csv_file)
+    totals = {"total_sales": 0.0, "entry_count": 0, "min_sales": None, "max_sales": None}
+    counts = Counter()
+    rows = 0
+    reader = pd.read_csv(
+        csv_file, usecols=columns, dtype={c: COLUMN_DTYPES[c] for c in columns}, chunksize=chunksize,
+        skiprows=(lambda i: 0 < i <= skip_rows) if skip_rows else None,
+    )
+    for chunk in reader:
+        rows += len(chunk)
+        sales = chunk['sales_amount'] if 'sales_amount' in chunk else chunk['Qty'] * chunk['Amount']
+        if sales.count():
+            totals["total_sales"] += float(sales.sum())
+            totals["entry_count"] += int(sales.count())
+            totals["min_sales"] = _pick(min, totals["min_sales"], float(sales.min()))
+            totals["max_sales"] = _pick(max, totals["max_sales"], float(sales.max()))
+        for (style, status), n in chunk.groupby(['Style', 'Status'], observed=True).size().items():
+            if n:
+                counts[(str(style), str(status))] += int(n)
+    return totals, counts, rows
+
+
+def _pick(fn, current: Optional[float], new: Optional[float]) -> Optional[float]:
+    if current is None or new is None:
+        return new if current is None else current
+    return fn(current, new)
+
+
+def merge_summary(previous: Dict, totals: Dict, source: str, rows: int) -> Dict:
+    summary = {
+        "total_sales": previous.get("total_sales", 0.0) + totals["total_sales"],
+        "entry_count": previous.get("entry_count", 0) + totals["entry_count"],
+        "min_sales": _pick(min, previous.get("min_sales"), totals["min_sales"]),
+        "max_sales": _pick(max, previous.get("max_sales"), totals["max_sales"]),
+        "rows_processed": dict(previous.get("rows_processed", {})),
     }
-#print("Computed statistics:", stats)
-
-# Step 2: Connect to Couchbase and cache the stats
-try:
-    # Connection details (adjust for your setup; use 'couchbases://' for TLS)
-    cluster = Cluster('couchbase://localhost', ClusterOptions(
-        PasswordAuthenticator('Administrator', 'Administrator')  # Replace with your credentials
-    ))
-    cluster.wait_until_ready(timedelta(seconds=5))
-
-    bucket = cluster.bucket('sales_cache')  # Your created bucket
-    collection = bucket.default_collection()  # Use default collection
-
-    # Upsert the stats as a JSON document with key 'total_sales_stats'
-    result = collection.upsert('total_sales_stats', stats)
-    print("Successfully cached stats in Couchbase with CAS:", result.cas)
-
-except CouchbaseException as e:
-    print("Couchbase error:", e)
-except Exception as e:
-    print("Error:", e)
\ No newline at end of file
+    summary["average_sales"] = summary["total_sales"] / summary["entry_count"] if summary["entry_count"] else 0.0
+    summary["rows_processed"][source] = summary["rows_processed"].get(source, 0) + rows
+    return summary
+
+
+def style_documents(counts: Counter) -> Dict[str, Dict]:
+    """{Style: {style, total_count, status_counts: {Status: n}}}"""
+    docs = {}
+    for (style, status), n in counts.items():
+        doc = docs.setdefault(style, {"style": style, "total_count": 0, "status_counts": {}})
+        doc["total_count"] += n
+        doc["status_counts"][status] = n
+    return docs
+
+
+def stored_style_keys(cluster, bucket: str) -> Iterable[str]:
+    """Keys of the per-style documents currently in the bucket (streamed from the query service)."""
+    query = f"SELECT RAW META().id FROM `{bucket}` WHERE META().id LIKE $1"
+    return cluster.query(query, QueryOptions(positional_parameters=[f"{STYLE_KEY_PREFIX}%"]))
+
+
+def _report(result, action: str):
+    for key, error in result.exceptions.items():
+        print(f"Error {action} {key}: {error}")
+
+
+def write_full(collection, summary: Dict, docs: Dict[str, Dict], write_monolith: bool, stored_keys: Iterable[str] = ()):
+    """Replace all style documents; stored_keys not among the new styles are removed.
+
+    Without write_monolith an existing legacy monolith is deleted, since
+    SalesStatsStore would otherwise keep falling back to its old counts.
+    """
+    items = [(style_key(style), doc) for style, doc in docs.items()]
+    for start in range(0, len(items), WRITE_BATCH):
+        _report(collection.upsert_multi(dict(items[start:start + WRITE_BATCH])), "writing")
+    if write_monolith:
+        collection.upsert(MONOLITH_KEY, dict(summary, style_status_counts={
+            style: {"total_count": doc["total_count"], "status_counts": doc["status_counts"]} for style, doc in docs.items()
+        }))
+    else:
+        try:
+            collection.remove(MONOLITH_KEY)
+            print(f"Removed the legacy '{MONOLITH_KEY}' document (pass --write-monolith to keep it up to date)")
+        except DocumentNotFoundException:
+            pass
+    collection.upsert(SUMMARY_KEY, summary)
+    # Last, so a failed cleanup leaves extra documents rather than an unrecorded run
+    current = {key for key, _ in items}
+    stale = [key for key in stored_keys if key not in current]
+    for start in range(0, len(stale), WRITE_BATCH):
+        _report(collection.remove_multi(stale[start:start + WRITE_BATCH]), "removing")
+    if stale:
+        print(f"Removed {len(stale)} documents of styles no longer in the report")
+
+
+def add_counts(current: Dict, new: Dict) -> Dict:
+    """A style document with new's counts added to current's."""
+    status_counts = dict(current.get("status_counts", {}))
+    for status, n in new["status_counts"].items():
+        status_counts[status] = status_counts.get(status, 0) + n
+    return dict(current, style=new["style"], total_count=current.get("total_count", 0) + new["total_count"],
+                status_counts=status_counts)
+
+
+def write_increment(collection, summary: Dict, counts: Counter, write_monolith: bool):
+    """Add new counts to the style documents, then record the new summary.
+
+    Style documents are read with get_multi and written back with
+    upsert_multi, WRITE_BATCH at a time; a style whose document can't be
+    read is skipped (and reported) rather than overwritten. The summary
+    (with the rows consumed) is written last; if a run dies in between,
+    re-running it counts the unrecorded rows twice.
+    """
+    items = sorted(style_documents(counts).items())
+    for start in range(0, len(items), WRITE_BATCH):
+        batch = {style_key(style): doc for style, doc in items[start:start + WRITE_BATCH]}
+        stored = collection.get_multi(list(batch))
+        updated = {}
+        for key, doc in batch.items():
+            error = stored.exceptions.get(key)
+            if error is not None and not isinstance(error, DocumentNotFoundException):
+                print(f"Error reading {key}, its counts were not added: {error}")
+                continue
+            found = stored.results.get(key)
+            updated[key] = add_counts(found.content_as[dict] if found is not None else {}, doc)
+        _report(collection.upsert_multi(updated), "writing")
+    if write_monolith:
+        # Sub-document increments, packed MAX_MUTATE_SPECS to a call across styles
+        specs = []
+        for style, doc in items:
+            prefix = ("style_status_counts", style)
+            specs.append(SD.increment(subdoc_path(*prefix, "total_count"), doc["total_count"], create_parents=True))
+            specs += [SD.increment(subdoc_path(*prefix, "status_counts", status), n, create_parents=True)
+                      for status, n in doc["status_counts"].items()]
+        specs += [SD.upsert(field, value) for field, value in summary.items() if field != "rows_processed"]
+        for start in range(0, len(specs), MAX_MUTATE_SPECS):
+            collection.mutate_in(MONOLITH_KEY, specs[start:start + MAX_MUTATE_SPECS],
+                                 MutateInOptions(store_semantics=StoreSemantics.UPSERT))
+    collection.upsert(SUMMARY_KEY, summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate the sales report into per-style stats documents.")
+    parser.add_argument("--csv", required=True, help="Sales report CSV (Style, Status and sales_amount or Qty+Amount)")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fold in rows past those already processed for this file name")
+    parser.add_argument("--write-monolith", action="store_true",
+                        help="Also maintain the legacy single 'total_sales_stats' document")
+    parser.add_argument("--bucket", default=settings.SALES_STATS_BUCKET)
+    args = parser.parse_args()
+
+    try:
+        # Connection details come from config/settings.py
+        cluster = couchbase_manager.cluster()
+        cluster.wait_until_ready(timedelta(seconds=settings.COUCHBASE_READY_TIMEOUT))
+        collection = cluster.bucket(args.bucket).default_collection()
+
+        source = os.path.basename(args.csv)
+        previous = {}
+        if args.incremental:
+            try:
+                previous = collection.get(SUMMARY_KEY).content_as[dict]
+            except DocumentNotFoundException:
+                pass
+        skip = previous.get("rows_processed", {}).get(source, 0)
+        totals, counts, rows = aggregate(args.csv, args.chunksize, skip)
+        summary = merge_summary(previous, totals, source, rows)
+        if args.incremental:
+            write_increment(collection, summary, counts, args.write_monolith)
+        else:
+            write_full(collection, summary, style_documents(counts), args.write_monolith,
+                       stored_style_keys(cluster, args.bucket))
+        print(f"Aggregated {rows} rows of {source} (skipped {skip}) into {len({s for s, _ in counts})} styles")
+    except CouchbaseException as e:
+        print("Couchbase error:", e)
+    except Exception as e:
+        print("Error:", e)
+
+
+if __name__ == "__main__":
+    main()
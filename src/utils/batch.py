@@ -0,0 +1,196 @@
+"""Batch retention messages for offline campaigns.
+
+Customers and products are bulk-fetched with get_multi, prompts are built
+with the same logic as handle_complaint, and completions run on a bounded
+thread pool that backs off together when the API rate-limits. Finished jobs
+are appended to a JSONL checkpoint, so re-running a batch with the same
+checkpoint only does the jobs that are still missing or failed (failed
+records are kept in the file with their error).
+
+CLI, from the src directory:
+    python -m utils.batch --input jobs.jsonl --output results.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from config import settings
+from utils.llm_client import backoff_delay, chat_completion
+from utils.llm_limiter import LLMOverloadedError
+from utils.tool_utils import customers_collection, products_collection, get_similar_products, complaint_error
+from utils.prompts import complaint_prompt
+
+logger = logging.getLogger(__name__)
+
+
+def job_key(index: int, job: Dict) -> str:
+    """Identifies a job by position and content, so a checkpoint is never applied to a different job list."""
+    content = json.dumps([job.get("customer_id"), job.get("style"), job.get("complaint")])
+    return f"{index}:{hashlib.sha1(content.encode()).hexdigest()[:12]}"
+
+
+def checkpoint_path(batch_id: str) -> str:
+    return os.path.join(settings.BATCH_CHECKPOINT_DIR, f"{os.path.basename(batch_id)}.jsonl")
+
+
+def _load_checkpoint(path: Optional[str]) -> Dict[str, Dict]:
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            if record.get("status") == "failed":
+                continue  # recorded with its error, but retried on the next run
+            done[record["key"]] = record
+    return done
+
+
+def _get_multi(collection, keys: List[str]) -> Dict[str, Dict]:
+    """Documents by key in chunks of BATCH_FETCH_CHUNK; missing keys are left out."""
+    docs = {}
+    for start in range(0, len(keys), settings.BATCH_FETCH_CHUNK):
+        result = collection.get_multi(keys[start:start + settings.BATCH_FETCH_CHUNK])
+        docs.update({key: value.content_as[dict] for key, value in result.results.items()})
+    return docs
+
+
+class RateGate:
+    """Pacing shared by the batch workers: an optional requests-per-second cap and a global pause after HTTP 429."""
+
+    def __init__(self, rate_per_second: float = settings.BATCH_RATE_LIMIT_RPS):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _complete(prompt: str, api_key: str, gate: RateGate) -> str:
+    attempt = 0
+    while True:
+        gate.wait()
+        try:
+            payload = {"model": settings.GROK_MODEL, "messages": [{"role": "user", "content": prompt}]}
+            return chat_completion(payload, api_key)["choices"][0]["message"]["content"]
+        except LLMOverloadedError as e:
+            # The client has already retried (or the limiter shed the call); the whole batch should slow down
+            if attempt >= settings.BATCH_JOB_RETRIES:
+                raise
+            delay = backoff_delay(attempt, settings.LLM_BACKOFF_BASE, settings.LLM_BACKOFF_MAX, str(e.retry_after))
+            logger.warning(f"Batch rate-limited, pausing all workers for {delay:.2f}s")
+            gate.pause(delay)
+            attempt += 1
+
+
+def _run_job(index: int, key: str, job: Dict, customers: Dict, products: Dict, api_key: str, gate: RateGate) -> Dict:
+    customer_id, style = job.get("customer_id"), job.get("style")
+    record = {"key": key, "index": index, "customer_id": customer_id, "style": style}
+    customer, product = customers.get(customer_id), products.get(style)
+    error = complaint_error(customer_id, style, customer, product)
+    if error:
+        return dict(record, status="skipped", error=error)
+    try:
+        similar_products = get_similar_products(customer.get("preferred_category", product["category"]), style)
+        prompt = complaint_prompt(customer, product, style, job.get("complaint"), similar_products)
+        return dict(record, status="ok", message=_complete(prompt, api_key, gate))
+    except Exception as e:
+        logger.error(f"Batch job {key} for {customer_id} failed: {str(e)}")
+        return dict(record, status="failed", error=str(e))
+
+
+def run_batch(jobs: List[Dict], api_key: str, checkpoint: Optional[str] = None,
+              concurrency: int = settings.BATCH_CONCURRENCY) -> Iterator[Dict]:
+    """Yield one result record per job as it finishes.
+
+    Jobs already recorded in the checkpoint are replayed first (marked
+    resumed). New results are appended to the checkpoint by the workers
+    themselves, so they survive the caller going away; "failed" records
+    carry their error but don't count as done, so the next run retries them.
+    """
+    done = _load_checkpoint(checkpoint)
+    pending = []
+    for index, job in enumerate(jobs):
+        key = job_key(index, job)
+        if key in done:
+            yield dict(done[key], resumed=True)
+        else:
+            pending.append((index, key, job))
+    if not pending:
+        return
+    logger.info(f"Running {len(pending)} batch jobs ({len(done)} already done) with concurrency {concurrency}")
+
+    customers = _get_multi(customers_collection, sorted({job.get("customer_id") for _, _, job in pending if job.get("customer_id")}))
+    products = _get_multi(products_collection, sorted({job.get("style") for _, _, job in pending if job.get("style")}))
+
+    gate = RateGate()
+    write_lock = threading.Lock()
+    out = None
+    if checkpoint:
+        os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+        out = open(checkpoint, "a")
+
+    def work(index, key, job):
+        record = _run_job(index, key, job, customers, products, api_key, gate)
+        if out:
+            with write_lock:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+        return record
+
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        futures = [pool.submit(work, index, key, job) for index, key, job in pending]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # On early exit let running jobs finish (and be checkpointed) but drop the queued ones
+        pool.shutdown(wait=True, cancel_futures=True)
+        if out:
+            out.close()
+
+
+def read_jobs(lines: Iterable[str]) -> List[Dict]:
+    """Jobs from JSONL, or from a single JSON array."""
+    text = "".join(lines).strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+if __name__ == "__main__":
+    from utils.logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Generate retention messages for a batch of customer/style/complaint jobs.")
+    parser.add_argument("--input", required=True, help="JSONL (or JSON array) of {customer_id, style, complaint} jobs")
+    parser.add_argument("--output", required=True, help="JSONL results; also the checkpoint a re-run resumes from")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY)
+    parser.add_argument("--api-key", default=settings.API_KEY)
+    args = parser.parse_args()
+    configure_logging()
+    with open(args.input) as f:
+        jobs = read_jobs(f)
+    counts = {}
+    for record in run_batch(jobs, args.api_key, args.output, args.concurrency):
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    print(json.dumps({"jobs": len(jobs), **counts}), file=sys.stderr)
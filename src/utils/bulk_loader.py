@@ -0,0 +1,226 @@
+"""Streaming, batched and concurrent document loader for Couchbase.
+
+Reads a JSON array or JSONL file without holding it in memory, upserts
+documents in upsert_multi batches with a bounded number of batches in
+flight, logs throughput as it goes and records a checkpoint so an
+interrupted load can resume where it stopped.
+"""
+import json
+import os
+import threading
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 1 << 20
+# What a number can continue with; a number followed only by these at the end of the buffer may be cut short
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+def _runs_to_end(buffer: str, pos: int) -> bool:
+    """True when everything from pos to the end of buffer could still be part of a number."""
+    while pos < len(buffer) and buffer[pos] in _NUMBER_CHARS:
+        pos += 1
+    return pos == len(buffer)
+
+
+def _iter_json_array(f) -> Iterator[Dict]:
+    """Yield the elements of a top-level JSON array one at a time, reading the file in chunks."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while not buffer:
+        chunk = f.read(READ_CHUNK)
+        if not chunk:
+            break
+        buffer = chunk.lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array")
+    buffer, pos, eof = buffer[1:], 0, False
+    while True:
+        # Skip separators between elements
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(READ_CHUNK)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        # A number at the end of the buffer ('12' of '123', '5' of '5.0e3') may continue in the next chunk;
+        # decode it again with more data
+        if not eof and not isinstance(value, (dict, list, str)) and _runs_to_end(buffer, end):
+            chunk = f.read(READ_CHUNK)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield value
+        pos = end
+        if pos > READ_CHUNK:
+            buffer, pos = buffer[pos:], 0
+
+
+def iter_documents(path: str) -> Iterator[Dict]:
+    """Documents from a JSON array file or a JSONL file, detected from the first character."""
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from _iter_json_array(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@dataclass
+class LoadStats:
+    documents: int = 0
+    errors: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    failed_keys: List[str] = field(default_factory=list)
+
+    @property
+    def rate(self) -> float:
+        return self.documents / self.seconds if self.seconds else 0.0
+
+
+class BulkLoader:
+    """Upserts a stream of documents into a collection with upsert_multi.
+
+    Each document's key comes from key_field. Up to 'concurrency' batches of
+    'batch_size' documents are in flight at once. The checkpoint file holds
+    how many leading documents of the input are done; batches finish out of
+    order, so it only advances past a batch once every earlier batch has
+    finished too. A batch with any failed key (or a failed upsert_multi)
+    never counts as finished, so the checkpoint stops in front of it and a
+    resumed run loads it again; upserts are idempotent, so the batches after
+    it that did succeed are simply written twice.
+    """
+
+    def __init__(self, collection, key_field: str, batch_size: int = settings.BULK_BATCH_SIZE,
+                 concurrency: int = settings.BULK_CONCURRENCY, checkpoint: Optional[str] = None,
+                 progress_interval: float = settings.BULK_PROGRESS_INTERVAL):
+        self.collection = collection
+        self.key_field = key_field
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.checkpoint = checkpoint
+        self.progress_interval = progress_interval
+        self._lock = threading.Lock()
+
+    def _read_checkpoint(self, source: str) -> int:
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        if state.get("source") != os.path.abspath(source):
+            logger.warning(f"Checkpoint {self.checkpoint} is for {state.get('source')}; starting from the beginning")
+            return 0
+        return state.get("documents", 0)
+
+    def _write_checkpoint(self, source: str, documents: int):
+        if not self.checkpoint:
+            return
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": os.path.abspath(source), "documents": documents}, f)
+        os.replace(tmp, self.checkpoint)
+
+    def _upsert_batch(self, batch: List[Dict], stats: LoadStats) -> bool:
+        """Upsert one batch; True when every document with a key was written."""
+        docs = {}
+        for doc in batch:
+            key = doc.get(self.key_field)
+            if key is None:
+                with self._lock:
+                    stats.errors += 1
+                continue
+            docs[str(key)] = doc
+        try:
+            result = self.collection.upsert_multi(docs)
+            failed = list(result.exceptions)
+        except Exception as e:
+            logger.error(f"upsert_multi of {len(docs)} documents failed: {str(e)}")
+            failed = list(docs)
+        with self._lock:
+            stats.documents += len(docs) - len(failed)
+            stats.errors += len(failed)
+            stats.failed_keys.extend(failed[:max(0, 100 - len(stats.failed_keys))])
+        # Documents without a key fail the same way on every run; retrying the batch can't fix them
+        return not failed
+
+    def load(self, source: str) -> LoadStats:
+        """Load every document in source; returns counts and elapsed time."""
+        return self.load_documents(iter_documents(source), source)
+
+    def load_documents(self, documents: Iterable[Dict], source: str = "<stream>") -> LoadStats:
+        stats = LoadStats()
+        resume_at = self._read_checkpoint(source)
+        if resume_at:
+            logger.info(f"Resuming {source} after {resume_at} documents")
+            documents = islice(documents, resume_at, None)
+            stats.skipped = resume_at
+
+        start = last_report = time.perf_counter()
+        in_flight = {}  # future -> batch sequence number
+        finished, watermark, sizes = set(), 0, {}
+        done_documents = resume_at
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bulk") as pool:
+            def drain(block_until: int):
+                nonlocal watermark, done_documents
+                def collect(future):
+                    seq = in_flight.pop(future)
+                    if future.result():
+                        finished.add(seq)
+
+                for future in [f for f in in_flight if f.done()]:
+                    collect(future)
+                while len(in_flight) > block_until:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                # Advance the checkpoint over the contiguous prefix of finished batches; a failed one stops it
+                advanced = False
+                while watermark in finished:
+                    finished.discard(watermark)
+                    done_documents += sizes.pop(watermark)
+                    watermark += 1
+                    advanced = True
+                if advanced:
+                    self._write_checkpoint(source, done_documents)
+
+            for seq, batch in enumerate(batched(documents, self.batch_size)):
+                sizes[seq] = len(batch)
+                in_flight[pool.submit(self._upsert_batch, batch, stats)] = seq
+                drain(self.concurrency)
+                now = time.perf_counter()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    logger.info(f"Loaded {stats.documents} documents ({stats.documents / (now - start):.0f}/s), "
+                                f"{stats.errors} errors")
+            drain(0)
+        stats.seconds = time.perf_counter() - start
+        logger.info(f"Loaded {stats.documents} documents from {source} in {stats.seconds:.1f}s "
+                    f"({stats.rate:.0f}/s), {stats.errors} errors, {stats.skipped} skipped from checkpoint")
+        return stats
@@ -0,0 +1,296 @@
+"""Product catalog generator for the products bucket.
+
+Run from the src directory, e.g.:
+    python -m utils.catalog --template-set telecom --styles-file products.json --couchbase
+    python -m utils.catalog --template-set clothes --count 5000000 --output catalog.jsonl
+
+Descriptions and attributes come from a template set (telecom or clothes).
+Every style gets its own RNG seeded from "<seed>:<style>", so a style's
+document is the same whichever worker generates it and in whatever order.
+Styles are generated in chunks across a process pool and written to
+Couchbase through utils.bulk_loader, or to a JSONL or Parquet file.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List
+
+# Define description templates and attributes for telecom products
+TELECOM = {
+    "default_prefix": "AC",
+    "categories": {
+        "DP": {  # Data Plans
+            "name": "Data Plans",
+            "price_range": (10.00, 80.00),
+            "fields": ["data_amount", "network_type", "usage_type"],
+            "num_features": 2,
+            "templates": [
+                "Experience blazing-fast connectivity with this {data_amount} {network_type} data plan, perfect for {usage_type}. Includes {features} for an enhanced user experience.",
+                "Stay connected with our {data_amount} {network_type} plan, designed for {usage_type}. Enjoy {features} and reliable coverage for all your needs."
+            ],
+        },
+        "MP": {  # Mobile Phones
+            "name": "Mobile Phones",
+            "price_range": (200.00, 1500.00),
+            "fields": ["brand", "model", "display_size", "storage", "color", "usage_type"],
+            "num_features": 3,
+            "templates": [
+                "The {brand} {model} smartphone, featuring a {display_size}-inch display, {storage} storage, and {features}. Ideal for {usage_type}, this device offers {color} elegance and top-tier performance.",
+                "Discover the {brand} {model}, a {color} mobile phone with {storage} storage, {display_size}-inch screen, and {features}. Perfect for {usage_type} and built for reliability."
+            ],
+        },
+        "AC": {  # Accessories
+            "name": "Accessories",
+            "price_range": (15.00, 200.00),
+            "fields": ["brand", "accessory_type", "color", "compatibility", "usage_type"],
+            "num_features": 2,
+            "templates": [
+                "Enhance your device with this {color} {accessory_type} from {brand}. Designed for {compatibility}, it offers {features} and is perfect for {usage_type}.",
+                "This {brand} {color} {accessory_type} is crafted for {compatibility}, featuring {features}. Ideal for {usage_type}, it combines style and functionality."
+            ],
+        },
+    },
+    "attributes": {
+        "data_amount": ["1GB", "5GB", "10GB", "20GB", "50GB", "Unlimited"],
+        "network_type": ["4G", "5G"],
+        "brand": ["Samsung", "Apple", "Xiaomi", "OnePlus", "Google", "Sony"],
+        "model": ["Galaxy S23", "iPhone 15", "Redmi Note 12", "Nord 3", "Pixel 8", "Xperia 5"],
+        "display_size": ["6.1", "6.7", "6.4", "6.8", "6.2"],
+        "storage": ["64GB", "128GB", "256GB", "512GB", "1TB"],
+        "color": ["Midnight Black", "Starlight White", "Sky Blue", "Emerald Green", "Phantom Grey"],
+        "accessory_type": ["wireless earbuds", "fast charger", "protective case", "screen protector", "smartwatch"],
+        "compatibility": ["universal compatibility", "iOS devices", "Android devices", "specific models"],
+        "features": [
+            "unlimited calls and texts", "high-speed streaming", "advanced noise cancellation",
+            "water-resistant design", "long-lasting battery", "wireless charging support",
+            "AMOLED display", "dual SIM support", "5G connectivity", "shockproof protection"
+        ],
+        "usage_type": ["daily browsing", "gaming", "streaming", "professional use", "travel", "fitness tracking"]
+    },
+}
+
+# Apparel, keyed by the style prefixes used in the Amazon sales report (SET268, JNE3781, BL029, ...)
+CLOTHES = {
+    "default_prefix": "J",
+    "categories": {
+        "SET": {
+            "name": "Set",
+            "price_range": (25.00, 150.00),
+            "fields": ["fabric", "color", "fit", "occasion", "usage_type"],
+            "num_features": 2,
+            "templates": [
+                "A {color} {fabric} co-ord set with a {fit} fit, made for {occasion}. Comes with {features} and works well for {usage_type}.",
+                "This {fit} {fabric} set in {color} pairs {features}, ready for {occasion} and {usage_type}."
+            ],
+        },
+        "JNE": {
+            "name": "Kurta",
+            "price_range": (12.00, 80.00),
+            "fields": ["fabric", "color", "sleeve", "fit", "occasion", "usage_type"],
+            "num_features": 2,
+            "templates": [
+                "A {color} {fabric} kurta with {sleeve} sleeves and a {fit} fit. Features {features}, ideal for {occasion}.",
+                "Stay comfortable in this {fit} {fabric} kurta in {color}, with {sleeve} sleeves and {features}. Great for {usage_type}."
+            ],
+        },
+        "BL": {
+            "name": "Blouse",
+            "price_range": (10.00, 60.00),
+            "fields": ["fabric", "color", "sleeve", "occasion", "usage_type"],
+            "num_features": 2,
+            "templates": [
+                "An elegant {color} {fabric} blouse with {sleeve} sleeves and {features}, made for {occasion}.",
+                "This {fabric} blouse in {color} offers {features} and {sleeve} sleeves for {usage_type}."
+            ],
+        },
+        "J": {
+            "name": "Western Dress",
+            "price_range": (20.00, 120.00),
+            "fields": ["fabric", "color", "fit", "length", "occasion", "usage_type"],
+            "num_features": 3,
+            "templates": [
+                "A {length} {color} {fabric} dress with a {fit} silhouette and {features}. Perfect for {occasion}.",
+                "Turn heads in this {fit} {fabric} dress in {color}: {length}, with {features}, made for {usage_type}."
+            ],
+        },
+    },
+    "attributes": {
+        "fabric": ["cotton", "rayon", "silk blend", "georgette", "linen", "crepe"],
+        "color": ["Indigo", "Maroon", "Mustard", "Olive Green", "Off White", "Black", "Peach"],
+        "fit": ["regular", "slim", "relaxed", "A-line", "straight"],
+        "sleeve": ["three-quarter", "short", "full", "sleeveless"],
+        "length": ["knee-length", "midi", "maxi", "mini"],
+        "occasion": ["everyday wear", "festive occasions", "office wear", "weddings", "casual outings"],
+        "features": [
+            "hand block print", "side pockets", "breathable fabric", "embroidered neckline", "machine washable",
+            "adjustable waist tie", "lined interior", "mirror work", "wrinkle resistance", "button placket"
+        ],
+        "usage_type": ["daily wear", "travel", "summer days", "evening events", "work"]
+    },
+}
+
+TEMPLATE_SETS = {"telecom": TELECOM, "clothes": CLOTHES}
+CHUNK_SIZE = 10_000
+
+
+def get_category_key(style: str, template_set: Dict) -> str:
+    """Longest category prefix the style starts with, or the set's default."""
+    matches = [prefix for prefix in template_set["categories"] if style.startswith(prefix)]
+    return max(matches, key=len) if matches else template_set["default_prefix"]
+
+
+def generate_product_details(style: str, template_set: Dict, seed: int = 0) -> Dict:
+    rng = random.Random(f"{seed}:{style}")
+    category = template_set["categories"][get_category_key(style, template_set)]
+    attributes = template_set["attributes"]
+    template = rng.choice(category["templates"])
+
+    values = {field: rng.choice(attributes[field]) for field in category["fields"]}
+    features = rng.sample(attributes["features"], category["num_features"])
+    product_doc = {"description": template.format(features=", ".join(features), **values)}
+    product_doc.update(values)
+    product_doc["features"] = features
+
+    # Generate random price within category range
+    min_price, max_price = category["price_range"]
+    product_doc["price"] = round(rng.uniform(min_price, max_price), 2)
+    product_doc["category"] = category["name"]
+    product_doc["style"] = style
+
+    # Add sales-relevant fields
+    product_doc["stock_quantity"] = rng.randint(0, 100)
+    product_doc["warranty"] = rng.choice(["1 year", "2 years", "6 months", "No warranty"])
+    product_doc["release_date"] = f"202{rng.randint(3, 5)}-{rng.randint(1, 12):02d}-01"
+    return product_doc
+
+
+def _generate_chunk(args) -> List[Dict]:
+    styles, set_name, seed = args
+    template_set = TEMPLATE_SETS[set_name]
+    return [generate_product_details(style, template_set, seed) for style in styles]
+
+
+def synthetic_styles(set_name: str, count: int) -> Iterator[str]:
+    """Styles for load-test catalogs, spread evenly over the set's categories."""
+    prefixes = sorted(TEMPLATE_SETS[set_name]["categories"])
+    for i in range(count):
+        yield f"{prefixes[i % len(prefixes)]}{i:07d}"
+
+
+def read_styles(path: str) -> List[str]:
+    """Styles from a products.json file: either an object keyed by style or a list of styles."""
+    with open(path, "r") as file:
+        products = json.load(file)
+    return list(products.keys()) if isinstance(products, dict) else [str(style) for style in products]
+
+
+def generate(styles: Iterable[str], set_name: str, seed: int = 0, workers: int = None) -> Iterator[Dict]:
+    """Product documents for styles, in input order, generated across a process pool."""
+    def chunks():
+        chunk = []
+        for style in styles:
+            chunk.append(style)
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk, set_name, seed
+                chunk = []
+        if chunk:
+            yield chunk, set_name, seed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() submits every chunk up front; feed it in windows so memory stays bounded
+        window = (workers or os.cpu_count() or 1) * 4
+        pending = chunks()
+        while True:
+            batch = [c for _, c in zip(range(window), pending)]
+            if not batch:
+                return
+            yield from chain.from_iterable(pool.map(_generate_chunk, batch))
+
+
+def _parquet_schema(template_set: Dict):
+    import pyarrow as pa
+    string_fields = sorted({field for category in template_set["categories"].values() for field in category["fields"]})
+    return pa.schema(
+        [("style", pa.string()), ("category", pa.string()), ("description", pa.string())]
+        + [(field, pa.string()) for field in string_fields]
+        + [("features", pa.list_(pa.string())), ("price", pa.float64()), ("stock_quantity", pa.int64()),
+           ("warranty", pa.string()), ("release_date", pa.string())]
+    )
+
+
+def write_file(docs: Iterable[Dict], path: str, set_name: str) -> int:
+    count = 0
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Writing Parquet needs pyarrow; use a .jsonl output or install pyarrow")
+        schema = _parquet_schema(TEMPLATE_SETS[set_name])
+        with pq.ParquetWriter(path, schema) as writer:
+            batch = []
+            for doc in docs:
+                batch.append(doc)
+                if len(batch) == CHUNK_SIZE:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+        return count
+    with open(path, "w") as f:
+        for doc in docs:
+            f.write(json.dumps(doc) + "\n")
+            count += 1
+    return count
+
+
+def write_couchbase(docs: Iterable[Dict], bucket: str, batch_size: int, concurrency: int) -> int:
+    from config import settings
+    from utils.bulk_loader import BulkLoader
+    from utils.couchbase_manager import couchbase_manager
+
+    cluster = couchbase_manager.cluster()
+    cluster.wait_until_ready(timedelta(seconds=settings.COUCHBASE_READY_TIMEOUT))
+    collection = cluster.bucket(bucket).default_collection()
+    stats = BulkLoader(collection, "style", batch_size, concurrency).load_documents(docs, f"catalog:{bucket}")
+    return stats.documents
+
+
+def main(argv: List[str] = None):
+    from config import settings
+    from utils.logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Generate a product catalog.")
+    parser.add_argument("--template-set", choices=sorted(TEMPLATE_SETS), default="telecom")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--styles-file", help="products.json keyed by style (or a JSON list of styles)")
+    source.add_argument("--count", type=int, help="Generate this many synthetic styles")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="Write to a .jsonl or .parquet file")
+    target.add_argument("--couchbase", action="store_true", help="Upsert into the products bucket")
+    parser.add_argument("--bucket", default=settings.PRODUCTS_BUCKET)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=settings.BULK_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=settings.BULK_CONCURRENCY)
+    args = parser.parse_args(argv)
+    configure_logging("INFO")
+
+    styles = read_styles(args.styles_file) if args.styles_file else synthetic_styles(args.template_set, args.count)
+    docs = generate(styles, args.template_set, args.seed, args.workers)
+    if args.output:
+        count = write_file(docs, args.output, args.template_set)
+    else:
+        count = write_couchbase(docs, args.bucket, args.batch_size, args.concurrency)
+    print(f"Generated {count} {args.template_set} products", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Token-budgeted message lists for the chat agents.
+
+The newest history turns are kept while they fit the budget (and at most
+max_messages of them); everything older is folded into an extractive
+rolling summary stored next to the customer's history as
+'<customer_id>::summary'. Because history is fetched a few turns deeper
+than the window, every turn passes through the "dropped" range and gets
+summarized before it falls out of the fetch.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from couchbase.exceptions import DocumentNotFoundException
+
+from config import settings
+from utils.cache import TTLCache
+from utils.prompts import estimate_tokens
+from utils.tracing import Histogram, register_histogram
+
+CONTEXT_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+context_tokens = register_histogram(
+    Histogram("context_tokens_estimate", "Estimated tokens sent per chat completion.", CONTEXT_BUCKETS, label="agent"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def summary_key(customer_id: str) -> str:
+    return f"{customer_id}::summary"
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else f"{text[:max_chars]}..."
+
+
+def _extract(message: Dict, max_chars: int = 160) -> str:
+    """First sentence of a turn, prefixed with who said it."""
+    text = " ".join((message.get("content") or "").split())
+    first = _SENTENCE_END.split(text, 1)[0]
+    if len(first) > max_chars:
+        first = f"{first[:max_chars]}..."
+    return f"{message.get('role', 'user')}: {first}"
+
+
+class ContextWindow:
+    """Assembles [system, summary?, history..., user] within a token budget."""
+
+    def __init__(self, budget: int = settings.CONTEXT_TOKEN_BUDGET,
+                 max_messages: int = settings.CONTEXT_MAX_MESSAGES,
+                 message_max_tokens: int = settings.CONTEXT_MESSAGE_MAX_TOKENS,
+                 summary_max_tokens: int = settings.CONTEXT_SUMMARY_MAX_TOKENS):
+        self.budget = budget
+        self.max_messages = max_messages
+        self.message_max_tokens = message_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+
+    def assemble(self, system_prompt: str, history: List[Dict], message: str,
+                 summary: Optional[Dict]) -> Tuple[List[Dict], int, Optional[Dict]]:
+        """Returns (messages, estimated tokens, updated summary document or None if unchanged).
+
+        history is oldest-first and must not contain the new message.
+        """
+        updated = self._fold(summary, history)
+        summary_text = (updated or summary or {}).get("text")
+        used = estimate_tokens(system_prompt) + estimate_tokens(message)
+        if summary_text:
+            used += estimate_tokens(summary_text)
+
+        kept = []
+        for turn in reversed(history[-self.max_messages:]):
+            content = _truncate(turn.get("content") or "", self.message_max_tokens)
+            cost = estimate_tokens(content)
+            if used + cost > self.budget:
+                break
+            kept.append({"role": turn["role"], "content": content})
+            used += cost
+        kept.reverse()
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary_text:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary_text}"})
+        messages += kept
+        messages.append({"role": "user", "content": message})
+        return messages, used, updated
+
+    def _fold(self, summary: Optional[Dict], history: List[Dict]) -> Optional[Dict]:
+        """Add turns beyond the message window that the summary doesn't cover yet."""
+        through = (summary or {}).get("through") or ""
+        older = history[:-self.max_messages] if len(history) > self.max_messages else []
+        new = [turn for turn in older if (turn.get("timestamp") or "") > through]
+        if not new:
+            return None
+        previous = (summary or {}).get("text")
+        lines = previous.split(" | ") if previous else []
+        lines += [_extract(turn) for turn in new]
+        # Keep the most recent extracts that fit the summary budget
+        kept, used = [], 0
+        for line in reversed(lines):
+            used += estimate_tokens(line) + 1
+            if used > self.summary_max_tokens:
+                break
+            kept.append(line)
+        kept.reverse()
+        return {"text": " | ".join(kept), "through": new[-1].get("timestamp") or through}
+
+
+class SummaryStore:
+    """Rolling conversation summaries in the customers collection, with a small in-process cache."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.cache = TTLCache("conversation_summaries", settings.CONTEXT_SUMMARY_CACHE_SIZE,
+                              settings.CONTEXT_SUMMARY_CACHE_TTL)
+
+    def get(self, customer_id: str) -> Optional[Dict]:
+        cached = self.cache.get(customer_id)
+        if cached is not None:
+            return cached
+        try:
+            summary = self.collection.get(summary_key(customer_id)).content_as[dict]
+        except DocumentNotFoundException:
+            summary = {}
+        self.cache.set(customer_id, summary)
+        return summary
+
+    def set(self, customer_id: str, summary: Dict):
+        self.collection.upsert(summary_key(customer_id), dict(summary, customer_id=customer_id))
+        self.cache.set(customer_id, summary)
+
+
+class AsyncSummaryStore(SummaryStore):
+    """Same documents as SummaryStore, on an acouchbase collection."""
+
+    async def get(self, customer_id: str) -> Optional[Dict]:
+        cached = self.cache.get(customer_id)
+        if cached is not None:
+            return cached
+        try:
+            result = await self.collection.get(summary_key(customer_id))
+            summary = result.content_as[dict]
+        except DocumentNotFoundException:
+            summary = {}
+        self.cache.set(customer_id, summary)
+        return summary
+
+    async def set(self, customer_id: str, summary: Dict):
+        await self.collection.upsert(summary_key(customer_id), dict(summary, customer_id=customer_id))
+        self.cache.set(customer_id, summary)
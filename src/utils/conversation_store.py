@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Dict, List
+import logging
+
+import couchbase.subdocument as SD
+from couchbase.subdocument import StoreSemantics
+from couchbase.options import MutateInOptions
+from couchbase.exceptions import CasMismatchException, DocumentNotFoundException, PathNotFoundException
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PATH = "conversation_history"
+LENGTH_PATH = "conversation_length"
+ARCHIVE_SEQ_PATH = "history_archive_seq"
+MAX_LOOKUP_SPECS = 16  # Couchbase limit on specs per lookup_in
+
+
+def archive_key(customer_id: str, seq: int) -> str:
+    return f"{customer_id}::history::{seq:06d}"
+
+
+def _append_specs(customer_id: str, message: Dict) -> list:
+    return [
+        SD.array_append(HISTORY_PATH, message, create_parents=True),
+        SD.increment(LENGTH_PATH, 1, create_parents=True),
+        SD.upsert("customer_id", customer_id),
+    ]
+
+
+def _index_batches(count: int, limit: int) -> List[list]:
+    """Sub-doc get specs for the last 'limit' array entries, split to respect MAX_LOOKUP_SPECS."""
+    indexes = list(range(max(0, count - limit), count))
+    return [
+        [SD.get(f"{HISTORY_PATH}[{i}]") for i in indexes[start:start + MAX_LOOKUP_SPECS]]
+        for start in range(0, len(indexes), MAX_LOOKUP_SPECS)
+    ]
+
+
+def _collect(result, specs_len: int) -> list:
+    messages = []
+    for i in range(specs_len):
+        try:
+            messages.append(result.content_as[dict](i))
+        except PathNotFoundException:
+            # The array was trimmed between the count and the read; skip the vanished entry
+            continue
+    return messages
+
+
+class ConversationStore:
+    """Conversation history on the customer document, written with sub-document operations.
+
+    Each turn is a single array_append (plus a length counter) instead of a
+    full get/upsert of the document, so concurrent turns don't lose writes and
+    the per-turn cost doesn't grow with the history. Once the live array passes
+    max_messages, the oldest archive_batch messages are moved to a per-customer
+    archive document under CAS.
+    """
+
+    def __init__(self, collection, max_messages: int = settings.HISTORY_MAX_MESSAGES,
+                 archive_batch: int = settings.HISTORY_ARCHIVE_BATCH,
+                 archive_retries: int = settings.HISTORY_ARCHIVE_RETRIES):
+        self.collection = collection
+        self.max_messages = max_messages
+        self.archive_batch = archive_batch
+        self.archive_retries = archive_retries
+
+    def append(self, customer_id: str, role: str, content: str):
+        message = {"role": role, "content": content, "timestamp": datetime.now().isoformat()}
+        result = self.collection.mutate_in(
+            customer_id, _append_specs(customer_id, message),
+            MutateInOptions(store_semantics=StoreSemantics.UPSERT)
+        )
+        length = result.content_as[int](1)
+        logger.debug(f"Appended conversation turn for {customer_id} (length {length})")
+        if length > self.max_messages:
+            self._archive_overflow(customer_id)
+
+    def recent(self, customer_id: str, limit: int = 10) -> list:
+        """Fetch only the last 'limit' messages with sub-doc lookups."""
+        try:
+            count = self.collection.lookup_in(customer_id, [SD.count(HISTORY_PATH)]).content_as[int](0)
+        except (DocumentNotFoundException, PathNotFoundException):
+            return []
+        messages = []
+        for specs in _index_batches(count, limit):
+            messages.extend(_collect(self.collection.lookup_in(customer_id, specs), len(specs)))
+        return messages
+
+    def _archive_overflow(self, customer_id: str):
+        for _ in range(self.archive_retries):
+            result = self.collection.lookup_in(customer_id, [SD.get(HISTORY_PATH), SD.get(ARCHIVE_SEQ_PATH)])
+            history = result.content_as[list](0)
+            seq = result.content_as[int](1) if result.exists(1) else 0
+            if len(history) <= self.max_messages:
+                return
+            archived, kept = history[:self.archive_batch], history[self.archive_batch:]
+            # Written before the trim; a retry after a CAS mismatch rewrites the same seq with the same prefix
+            self.collection.upsert(archive_key(customer_id, seq),
+                                   {"customer_id": customer_id, "seq": seq, "messages": archived})
+            try:
+                self.collection.mutate_in(customer_id, [
+                    SD.replace(HISTORY_PATH, kept),
+                    SD.upsert(LENGTH_PATH, len(kept)),
+                    SD.upsert(ARCHIVE_SEQ_PATH, seq + 1),
+                ], MutateInOptions(cas=result.cas))
+                logger.debug(f"Archived {len(archived)} messages for {customer_id} into {archive_key(customer_id, seq)}")
+                return
+            except CasMismatchException:
+                logger.debug(f"CAS mismatch archiving history for {customer_id}, retrying")
+        logger.warning(f"Gave up archiving history for {customer_id}; will retry on a later turn")
+
+
+class AsyncConversationStore(ConversationStore):
+    """Same storage layout as ConversationStore, on an acouchbase collection."""
+
+    async def append(self, customer_id: str, role: str, content: str):
+        message = {"role": role, "content": content, "timestamp": datetime.now().isoformat()}
+        result = await self.collection.mutate_in(
+            customer_id, _append_specs(customer_id, message),
+            MutateInOptions(store_semantics=StoreSemantics.UPSERT)
+        )
+        length = result.content_as[int](1)
+        logger.debug(f"Appended conversation turn for {customer_id} (length {length})")
+        if length > self.max_messages:
+            await self._archive_overflow(customer_id)
+
+    async def recent(self, customer_id: str, limit: int = 10) -> list:
+        try:
+            result = await self.collection.lookup_in(customer_id, [SD.count(HISTORY_PATH)])
+            count = result.content_as[int](0)
+        except (DocumentNotFoundException, PathNotFoundException):
+            return []
+        messages = []
+        for specs in _index_batches(count, limit):
+            messages.extend(_collect(await self.collection.lookup_in(customer_id, specs), len(specs)))
+        return messages
+
+    async def _archive_overflow(self, customer_id: str):
+        for _ in range(self.archive_retries):
+            result = await self.collection.lookup_in(customer_id, [SD.get(HISTORY_PATH), SD.get(ARCHIVE_SEQ_PATH)])
+            history = result.content_as[list](0)
+            seq = result.content_as[int](1) if result.exists(1) else 0
+            if len(history) <= self.max_messages:
+                return
+            archived, kept = history[:self.archive_batch], history[self.archive_batch:]
+            await self.collection.upsert(archive_key(customer_id, seq),
+                                         {"customer_id": customer_id, "seq": seq, "messages": archived})
+            try:
+                await self.collection.mutate_in(customer_id, [
+                    SD.replace(HISTORY_PATH, kept),
+                    SD.upsert(LENGTH_PATH, len(kept)),
+                    SD.upsert(ARCHIVE_SEQ_PATH, seq + 1),
+                ], MutateInOptions(cas=result.cas))
+                logger.debug(f"Archived {len(archived)} messages for {customer_id} into {archive_key(customer_id, seq)}")
+                return
+            except CasMismatchException:
+                logger.debug(f"CAS mismatch archiving history for {customer_id}, retrying")
+        logger.warning(f"Gave up archiving history for {customer_id}; will retry on a later turn")
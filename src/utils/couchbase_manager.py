@@ -0,0 +1,205 @@
+"""One Couchbase connection per process, opened lazily and shared by every module.
+
+Nothing connects at import time. The first use of a collection (or an
+explicit start()) opens the cluster; start() does it on a background thread
+and then waits for the KV and query services with wait_until_ready, so
+/health can report readiness without blocking the worker. After a fork the
+child drops the parent's connection and opens its own on first use.
+
+The asyncio path (asgi.py) also needs an acouchbase Cluster, which belongs
+to the serving event loop; async_collection opens it once per process
+alongside the synchronous one, and status() reports both.
+"""
+import asyncio
+import os
+import threading
+import time
+import logging
+from datetime import timedelta
+from typing import Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def cluster_options():
+    from couchbase.auth import PasswordAuthenticator
+    from couchbase.options import ClusterOptions
+    return ClusterOptions(PasswordAuthenticator(settings.COUCHBASE_USERNAME, settings.COUCHBASE_PASSWORD))
+
+
+class CouchbaseManager:
+    def __init__(self, url: str = settings.COUCHBASE_URL):
+        self.url = url
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Called again in forked children: the inherited SDK handles and lock must not be reused
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()  # separate so start() never waits behind a connect in progress
+        self._cluster = None
+        self._collections: Dict[str, object] = {}
+        self._async_connect: Optional[asyncio.Future] = None  # task opening the acouchbase Cluster
+        self._async_collections: Dict[str, object] = {}
+        self.async_error: Optional[str] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._generation = 0  # bumped by close(), so a connect thread from before it stops
+        self.error: Optional[str] = None
+        self.connect_seconds: Optional[float] = None
+        self.connections_opened = 0
+
+    def cluster(self):
+        """The process's Cluster, connecting on first call."""
+        cluster = self._cluster
+        if cluster is not None:
+            return cluster
+        with self._lock:
+            if self._cluster is None:
+                from couchbase.cluster import Cluster
+                start = time.perf_counter()
+                self._cluster = Cluster(self.url, cluster_options())
+                self.connections_opened += 1
+                logger.info(f"Connected to Couchbase at {self.url} in {(time.perf_counter() - start) * 1000:.0f}ms")
+            return self._cluster
+
+    def collection(self, bucket: str):
+        """Default collection of a bucket, opened once per process."""
+        collection = self._collections.get(bucket)
+        if collection is None:
+            cluster = self.cluster()
+            with self._lock:
+                collection = self._collections.get(bucket)
+                if collection is None:
+                    collection = self._collections[bucket] = cluster.bucket(bucket).default_collection()
+        return collection
+
+    async def async_cluster(self):
+        """The process's acouchbase Cluster, connecting on first call; must be awaited on the serving event loop."""
+        if self._async_connect is None:
+            self._async_connect = asyncio.ensure_future(self._open_async())
+        try:
+            return await asyncio.shield(self._async_connect)
+        except Exception as e:
+            self.async_error = str(e)
+            self._async_connect = None  # let the next caller try again
+            raise
+
+    async def _open_async(self):
+        from acouchbase.cluster import Cluster
+        start = time.perf_counter()
+        cluster = Cluster(self.url, cluster_options())
+        await cluster.on_connect()
+        self.connections_opened += 1
+        self.async_error = None
+        logger.info(f"Connected to Couchbase (acouchbase) at {self.url} in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return cluster
+
+    async def async_collection(self, bucket: str):
+        """Default collection of a bucket on the acouchbase Cluster, opened once per process."""
+        collection = self._async_collections.get(bucket)
+        if collection is None:
+            cluster = await self.async_cluster()
+            handle = cluster.bucket(bucket)
+            await handle.on_connect()
+            collection = self._async_collections.setdefault(bucket, handle.default_collection())
+        return collection
+
+    def start(self):
+        """Connect and wait for readiness on a background thread; idempotent per process."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._connect_until_ready, args=(self._generation,),
+                                            name="couchbase-connect", daemon=True)
+        self._thread.start()
+
+    def _connect_until_ready(self, generation: int):
+        from couchbase.diagnostics import ServiceType
+        from couchbase.options import WaitUntilReadyOptions
+        start = time.perf_counter()
+        while generation == self._generation:
+            try:
+                cluster = self.cluster()
+                cluster.wait_until_ready(timedelta(seconds=settings.COUCHBASE_READY_TIMEOUT), WaitUntilReadyOptions(
+                    service_types=[ServiceType.KeyValue, ServiceType.Query]))
+                for bucket in (settings.CUSTOMERS_BUCKET, settings.PRODUCTS_BUCKET, settings.SALES_STATS_BUCKET):
+                    self.collection(bucket)
+                if generation != self._generation:
+                    return  # closed while connecting
+                self.connect_seconds = time.perf_counter() - start
+                self.error = None
+                self._ready.set()
+                logger.info(f"Couchbase ready after {self.connect_seconds:.2f}s")
+                return
+            except Exception as e:
+                self.error = str(e)
+                logger.error(f"Couchbase not ready, retrying in {settings.COUCHBASE_RETRY_INTERVAL}s: {str(e)}")
+                time.sleep(settings.COUCHBASE_RETRY_INTERVAL)
+
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        self.start()
+        return self._ready.wait(timeout)
+
+    def status(self) -> Dict:
+        """Readiness for /health; also kicks off the background connect in a fresh worker."""
+        self.start()
+        if self.ready():
+            status = {"status": "ready", "connect_seconds": round(self.connect_seconds, 3)}
+        else:
+            status = {"status": "connecting", "error": self.error}
+        if self._async_connect is not None or self.async_error:
+            connected = self._async_connect is not None and self._async_connect.done() \
+                and not self._async_connect.cancelled() and self._async_connect.exception() is None
+            status["async"] = {"status": "ready" if connected else "connecting", "error": self.async_error}
+        return status
+
+    def close(self):
+        """Close the connection and forget the connect state, so status() and start() begin again afterwards."""
+        with self._start_lock, self._lock:
+            cluster, self._cluster = self._cluster, None
+            self._collections = {}
+            self._ready.clear()
+            self._generation += 1
+            self._thread = None
+            self.error = None
+            self.connect_seconds = None
+        if cluster is not None:
+            cluster.close()
+
+    async def aclose(self):
+        """Close the acouchbase Cluster (on the loop that opened it) and then the synchronous one."""
+        connect, self._async_connect = self._async_connect, None
+        self._async_collections = {}
+        if connect is not None and connect.done() and not connect.cancelled() and connect.exception() is None:
+            await connect.result().close()
+        self.close()
+
+
+class LazyCollection:
+    """Stands in for a module-level collection; resolves it through the manager on first attribute access."""
+
+    def __init__(self, manager: CouchbaseManager, bucket: str):
+        self._manager = manager
+        self._bucket = bucket
+
+    def __getattr__(self, name):
+        return getattr(self._manager.collection(self._bucket), name)
+
+
+class LazyCluster:
+    """Stands in for a module-level Cluster (queries, bucket lookups)."""
+
+    def __init__(self, manager: CouchbaseManager):
+        self._manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self._manager.cluster(), name)
+
+
+couchbase_manager = CouchbaseManager()
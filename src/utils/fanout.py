@@ -0,0 +1,34 @@
+import contextvars
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+
+from config import settings
+
+# Shared by every handler; lookups are I/O bound so threads overlap their round-trips
+_pool = ThreadPoolExecutor(max_workers=settings.LOOKUP_POOL_WORKERS, thread_name_prefix="lookup")
+
+
+class Fanout:
+    """Runs a handler's independent lookups concurrently and records how long each stage took."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def submit(self, stage: str, fn: Callable, *args, **kwargs) -> Future:
+        def timed():
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.timings[stage] = (time.perf_counter() - start) * 1000
+        # Copy the caller's context so spans recorded in the pool land in the same request trace
+        return _pool.submit(contextvars.copy_context().run, timed)
+
+    def log(self, logger: logging.Logger, subject: str):
+        total = (time.perf_counter() - self._start) * 1000
+        stages = " ".join(f"{stage}={ms:.1f}ms" for stage, ms in self.timings.items())
+        logger.info(f"{self.label} lookups for {subject}: {stages} wall={total:.1f}ms")
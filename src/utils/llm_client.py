@@ -0,0 +1,298 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import logging
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from config import settings
+from utils.tracing import span
+from utils.singleflight import AsyncSingleFlight, SingleFlight, request_key
+from utils.llm_limiter import OVERLOAD_STATUS_CODES, AdaptiveLimiter, LLMOverloadedError, llm_limiter
+
+if TYPE_CHECKING:
+    import httpx  # imported lazily at runtime, only the asyncio path needs it
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _overloaded(status_code: int, retry_after: Optional[str], delay: float) -> LLMOverloadedError:
+    try:
+        seconds = float(retry_after)
+    except (TypeError, ValueError):
+        seconds = delay
+    return LLMOverloadedError(f"Upstream LLM returned HTTP {status_code} after retries", max(1, round(seconds)))
+
+
+def _never_sent(error: requests.exceptions.RequestException) -> bool:
+    """True when the request can't have reached the server (connect timeout or refused), so retrying the POST is safe."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff, honoring a numeric Retry-After, bounded by cap."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form of Retry-After; fall back to the computed backoff
+    return min(delay, cap)
+
+
+class LLMClient:
+    """Shared HTTP client for the Grok completions API.
+
+    Keeps a pooled keep-alive session so repeated calls reuse the same
+    TCP+TLS connection, applies connect/read timeouts to every call and
+    retries 429/5xx responses with jittered exponential backoff, as well as
+    connections that were refused or timed out before the request went out
+    (a read timeout is not retried: the completion may still be running and
+    would be paid for twice). Every attempt holds a slot of the process-wide
+    adaptive limiter.
+    """
+
+    def __init__(
+        self,
+        base_url: str = settings.GROK_BASE_URL,
+        pool_connections: int = settings.LLM_POOL_CONNECTIONS,
+        pool_maxsize: int = settings.LLM_POOL_MAXSIZE,
+        connect_timeout: float = settings.LLM_CONNECT_TIMEOUT,
+        read_timeout: float = settings.LLM_READ_TIMEOUT,
+        max_retries: int = settings.LLM_MAX_RETRIES,
+        backoff_base: float = settings.LLM_BACKOFF_BASE,
+        backoff_max: float = settings.LLM_BACKOFF_MAX,
+        limiter: AdaptiveLimiter = llm_limiter,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        # Retries are handled here, not by urllib3, so they can honor Retry-After and backoff settings
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def chat_completion(self, payload: Dict, api_key: str, timeout: Optional[Tuple[float, float]] = None) -> Dict:
+        """POST a chat completion request and return the decoded JSON body.
+
+        Raises requests.exceptions.HTTPError once retries are exhausted, like
+        response.raise_for_status() did at the old call sites, and
+        LLMOverloadedError when the call is shed or still rate-limited.
+        """
+        response, _ = self._post("/chat/completions", payload, api_key, timeout)
+        return response.json()
+
+    def stream_chat_completion(self, payload: Dict, api_key: str,
+                               timeout: Optional[Tuple[float, float]] = None) -> Iterator[str]:
+        """POST a streaming chat completion and yield content deltas as server-sent events arrive.
+
+        Retries only apply until the response headers arrive; once text has
+        been yielded a failure is raised to the caller. The limiter slot is
+        held until the body has been read.
+        """
+        response, slot = self._post("/chat/completions", dict(payload, stream=True), api_key, timeout, stream=True)
+        try:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        continue  # drain to the end of the body so the connection goes back to the pool
+                    delta = json.loads(data).get("choices", [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        finally:
+            self.limiter.release(slot, response.status_code, response.headers)
+
+    def _post(self, path: str, payload: Dict, api_key: str, timeout: Optional[Tuple[float, float]],
+              stream: bool = False) -> Tuple[requests.Response, Optional[float]]:
+        """(response, slot); for a successful stream the slot is still held and the caller releases it."""
+        url = f"{self.base_url}{path}"
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        attempt = 0
+        deadline = time.monotonic() + self.limiter.queue_timeout  # shared by the retries of this call
+        while True:
+            slot = self.limiter.acquire(deadline)
+            try:
+                with span("llm.http") as current:
+                    response = self.session.post(url, headers=headers, json=payload, timeout=timeout or self.timeout, stream=stream)
+                    if current is not None and not stream:
+                        current.size = len(response.content)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.limiter.release(slot)
+                # A completion is not idempotent: after a read timeout or a dropped connection it may still run
+                if attempt >= self.max_retries or not _never_sent(e):
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                logger.warning(f"LLM request to {path} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            except BaseException:
+                self.limiter.release(slot)
+                raise
+            else:
+                status, retry_after = response.status_code, response.headers.get("Retry-After")
+                if stream and status < 400:
+                    return response, slot
+                self.limiter.release(slot, status, response.headers)
+                if status not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if status in OVERLOAD_STATUS_CODES:
+                        response.close()
+                        raise _overloaded(status, retry_after, self.backoff_max)
+                    response.raise_for_status()
+                    return response, None
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+                logger.warning(f"LLM request to {path} returned HTTP {status}, retrying in {delay:.2f}s")
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncLLMClient:
+    """asyncio counterpart of LLMClient, built on a pooled httpx.AsyncClient.
+
+    Same timeout, retry and concurrency-limit policy; raises
+    httpx.HTTPStatusError once retries are exhausted.
+    """
+
+    def __init__(
+        self,
+        base_url: str = settings.GROK_BASE_URL,
+        pool_maxsize: int = settings.LLM_POOL_MAXSIZE,
+        connect_timeout: float = settings.LLM_CONNECT_TIMEOUT,
+        read_timeout: float = settings.LLM_READ_TIMEOUT,
+        max_retries: int = settings.LLM_MAX_RETRIES,
+        backoff_base: float = settings.LLM_BACKOFF_BASE,
+        backoff_max: float = settings.LLM_BACKOFF_MAX,
+        limiter: AdaptiveLimiter = llm_limiter,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        import httpx  # only the async (Quart) service needs it
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def chat_completion(self, payload: Dict, api_key: str) -> Dict:
+        if not settings.LLM_SINGLEFLIGHT_ENABLED:
+            return await self._complete(payload, api_key)
+        return await _async_flight.do(request_key(payload, api_key), lambda: self._complete(payload, api_key))
+
+    async def _complete(self, payload: Dict, api_key: str) -> Dict:
+        response = await self._post("/chat/completions", payload, api_key)
+        return response.json()
+
+    async def _post(self, path: str, payload: Dict, api_key: str) -> "httpx.Response":
+        import httpx
+        url = f"{self.base_url}{path}"
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        attempt = 0
+        deadline = time.monotonic() + self.limiter.queue_timeout
+        while True:
+            slot = await self.limiter.acquire_async(deadline)
+            try:
+                with span("llm.http") as current:
+                    response = await self.client.post(url, headers=headers, json=payload)
+                    if current is not None:
+                        current.size = len(response.content)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Only errors before the request went out; a read timeout may leave the completion running
+                self.limiter.release(slot)
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                logger.warning(f"LLM request to {path} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            except BaseException:
+                self.limiter.release(slot)
+                raise
+            else:
+                status, retry_after = response.status_code, response.headers.get("Retry-After")
+                self.limiter.release(slot, status, response.headers)
+                if status not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if status in OVERLOAD_STATUS_CODES:
+                        raise _overloaded(status, retry_after, self.backoff_max)
+                    response.raise_for_status()
+                    return response
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+                logger.warning(f"LLM request to {path} returned HTTP {status}, retrying in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+# Coalesce byte-identical requests in flight at the same time (e.g. the same question at the same tier)
+_flight = SingleFlight("llm_singleflight")
+_stream_flight = SingleFlight("llm_singleflight_stream")
+_async_flight = AsyncSingleFlight("llm_singleflight_async")
+
+
+def get_client() -> LLMClient:
+    """Return the process-wide LLM client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
+
+
+def close_client():
+    """Close the process-wide sync client's pooled connections (worker shutdown)."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+def chat_completion(payload: Dict, api_key: str, timeout: Optional[Tuple[float, float]] = None) -> Dict:
+    if not settings.LLM_SINGLEFLIGHT_ENABLED:
+        return get_client().chat_completion(payload, api_key, timeout)
+    return _flight.do(request_key(payload, api_key), lambda: get_client().chat_completion(payload, api_key, timeout))
+
+
+def stream_chat_completion(payload: Dict, api_key: str, timeout: Optional[Tuple[float, float]] = None) -> Iterator[str]:
+    if not settings.LLM_SINGLEFLIGHT_ENABLED:
+        return get_client().stream_chat_completion(payload, api_key, timeout)
+    return _stream_flight.stream(request_key(payload, api_key, stream=True),
+                                 lambda: get_client().stream_chat_completion(payload, api_key, timeout))
+
+
+def get_async_client() -> AsyncLLMClient:
+    """Return the process-wide async LLM client; only use it from one event loop."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncLLMClient()
+    return _async_client
@@ -0,0 +1,228 @@
+"""Adaptive concurrency limit for upstream LLM calls.
+
+Every HTTP attempt to the completions API takes a slot. The number of
+slots follows AIMD: each 2xx response adds 1/limit (about one slot per
+round of requests), a 429 or 503 multiplies it by
+LLM_CONCURRENCY_BACKOFF. Only responses to requests sent after the last
+cut can cut again, so a burst of 429s from one round counts once. When
+the provider's x-ratelimit-remaining-requests header reaches 0, new
+attempts wait until x-ratelimit-reset-requests has passed.
+
+Callers that can't get a slot queue up to LLM_QUEUE_TIMEOUT seconds; when
+the queue is full, the deadline passes or the provider has paused us for
+longer than that, LLMOverloadedError is raised with a retry_after the
+routes turn into a 503 + Retry-After.
+
+There is one limiter per process. Threads (the Flask service, tool
+handlers run with asyncio.to_thread) use acquire; coroutines use
+acquire_async, which waits on the event loop instead of blocking it.
+Both draw on the same slots, so a 429 seen on either path cuts the limit
+for both.
+"""
+import asyncio
+import math
+import re
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, List, Mapping, Optional
+
+from config import settings
+from utils.tracing import DURATION_BUCKETS, Histogram, register_collector, register_histogram, render_family
+
+logger = logging.getLogger(__name__)
+
+queue_wait = register_histogram(
+    Histogram("llm_queue_wait_seconds", "Time LLM calls waited for a concurrency slot.", DURATION_BUCKETS, label="limiter"))
+
+# Status codes that mean the provider wants less concurrency
+OVERLOAD_STATUS_CODES = {429, 503}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+# Every limiter in the process, by name, for /metrics
+_limiters: Dict[str, "AdaptiveLimiter"] = {}
+
+
+class LLMOverloadedError(Exception):
+    """The upstream LLM is saturated; the request was shed and can be retried after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After or rate-limit reset header: '12', '1.5', '250ms', '6m0s'."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None  # HTTP-date form or something unknown
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AdaptiveLimiter:
+    """Thread-safe AIMD limiter shared by every thread and event loop in the process."""
+
+    def __init__(self, name: str, initial: int = settings.LLM_CONCURRENCY_INITIAL,
+                 min_limit: int = settings.LLM_CONCURRENCY_MIN, max_limit: int = settings.LLM_CONCURRENCY_MAX,
+                 backoff: float = settings.LLM_CONCURRENCY_BACKOFF, queue_max: int = settings.LLM_QUEUE_MAX,
+                 queue_timeout: float = settings.LLM_QUEUE_TIMEOUT):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.rate_limited = 0
+        self.paused_until = 0.0   # time.monotonic() before which no new attempt starts
+        self.last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters = deque()  # (loop, future) of coroutines waiting in acquire_async
+        _limiters[name] = self
+
+    def _can_start(self, now: float) -> bool:
+        return self.in_flight < int(self.limit) and now >= self.paused_until
+
+    def _admit(self) -> float:
+        self.in_flight += 1
+        self.admitted += 1
+        return time.monotonic()
+
+    def _shed(self, now: float, reason: str) -> LLMOverloadedError:
+        self.shed += 1
+        # Roughly when a slot should be free again: the provider's pause, or one queue timeout
+        retry_after = max(1, math.ceil(self.paused_until - now if self.paused_until > now else self.queue_timeout))
+        logger.warning(f"Shedding LLM call ({self.name}: {reason}, limit {int(self.limit)}, "
+                       f"{self.in_flight} in flight, {self.queued} queued)")
+        return LLMOverloadedError(f"Upstream LLM is overloaded ({reason})", retry_after)
+
+    def _check_wait(self, now: float, deadline: float, queued: bool) -> float:
+        """Seconds to wait before trying again; sheds when the queue is full or the deadline can't be met."""
+        if not queued and self.queued >= self.queue_max:
+            raise self._shed(now, "queue full")
+        if now >= deadline or self.paused_until > deadline:
+            raise self._shed(now, "queue timeout")
+        return (self.paused_until if self.paused_until > now else deadline) - now
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """Take a slot, waiting until deadline (time.monotonic(); default queue_timeout from now).
+
+        Returns the token to pass to release. Retries of one call should
+        share a deadline, so their total queueing stays bounded.
+        """
+        start = time.monotonic()
+        deadline = deadline or start + self.queue_timeout
+        with self._cond:
+            if not self._can_start(start):
+                wait = self._check_wait(start, deadline, False)
+                self.queued += 1
+                try:
+                    while True:
+                        self._cond.wait(wait)
+                        now = time.monotonic()
+                        if self._can_start(now):
+                            break
+                        wait = self._check_wait(now, deadline, True)
+                finally:
+                    self.queued -= 1
+            started = self._admit()
+        queue_wait.observe(self.name, started - start)
+        return started
+
+    async def acquire_async(self, deadline: Optional[float] = None) -> float:
+        """acquire for coroutines: waits on the running event loop rather than blocking it."""
+        start = time.monotonic()
+        deadline = deadline or start + self.queue_timeout
+        loop = asyncio.get_running_loop()
+        queued = False
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    if self._can_start(now):
+                        started = self._admit()
+                        break
+                    wait = self._check_wait(now, deadline, queued)
+                    if not queued:
+                        self.queued += 1
+                        queued = True
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                try:
+                    await asyncio.wait_for(waiter, wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if queued:
+                with self._cond:
+                    self.queued -= 1
+        queue_wait.observe(self.name, started - start)
+        return started
+
+    def release(self, started: float, status: Optional[int] = None, headers: Optional[Mapping] = None):
+        """Free the slot and adapt the limit to the response (status None: no response, e.g. a timeout)."""
+        with self._cond:
+            self._record(started, status, headers)
+            free = max(0, int(self.limit) - self.in_flight)
+            # Wake only as many waiters as can start, threads and coroutines alike
+            self._cond.notify(free)
+            while free and self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                if not waiter.done():
+                    loop.call_soon_threadsafe(_wake, waiter)
+                    free -= 1
+
+    def _record(self, started: float, status: Optional[int], headers: Optional[Mapping]):
+        now = time.monotonic()
+        self.in_flight -= 1
+        if status in OVERLOAD_STATUS_CODES:
+            self.rate_limited += 1
+            if started >= self.last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+                logger.warning(f"{self.name}: HTTP {status} from provider, concurrency limit cut to {int(self.limit)}")
+        elif status is not None and 200 <= status < 300:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        # Retry-After is honored by the retrying call itself; an exhausted window holds back everyone
+        if headers and headers.get("x-ratelimit-remaining-requests") == "0":
+            pause = parse_seconds(headers.get("x-ratelimit-reset-requests"))
+            if pause:
+                self.paused_until = max(self.paused_until, now + pause)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {"limit": int(self.limit), "in_flight": self.in_flight, "queued": self.queued,
+                    "admitted": self.admitted, "shed": self.shed, "rate_limited": self.rate_limited,
+                    "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3)}
+
+
+@register_collector
+def render_limiters() -> List[str]:
+    """llm_limiter_* series, one per limiter."""
+    return render_family("llm_limiter", "limiter", (
+        ("limit", "gauge"), ("in_flight", "gauge"), ("queued", "gauge"), ("paused_for", "gauge"),
+        ("admitted", "counter"), ("shed", "counter"), ("rate_limited", "counter")),
+        {name: limiter.stats() for name, limiter in _limiters.items()})
+
+
+# One limit per process for all Grok traffic (agent chat, tool handlers, batch runs; sync and async clients)
+llm_limiter = AdaptiveLimiter("llm_limiter")
@@ -0,0 +1,121 @@
+import atexit
+import json
+import os
+import queue
+import random
+import re
+import sys
+import logging
+import logging.handlers
+from typing import Any
+
+from config import settings
+
+# Dict keys whose values never reach the logs
+SECRET_KEYS = {"authorization", "api_key", "apikey", "password", "token", "access_token", "secret"}
+SECRET_PATTERNS = [
+    (re.compile(r"(Bearer\s+)[^\s\"',]+", re.IGNORECASE), r"\1***"),
+    (re.compile(r"\bxai-[A-Za-z0-9_-]+"), "xai-***"),
+]
+
+_listener = None
+dropped_records = 0
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _shrink(value: Any, max_string: int, max_items: int) -> Any:
+    """Copy of a JSON-like value with secrets masked and long strings/lists cut down."""
+    if isinstance(value, dict):
+        return {k: "***" if str(k).lower() in SECRET_KEYS else _shrink(v, max_string, max_items) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_shrink(v, max_string, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"... {len(value) - max_items} more")
+        return items
+    if isinstance(value, str) and len(value) > max_string:
+        return f"{value[:max_string]}... ({len(value)} chars)"
+    return value
+
+
+class LazyPayload:
+    """Defers serializing a payload until a handler actually formats the record."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        text = json.dumps(_shrink(self.value, settings.LOG_PAYLOAD_MAX_STRING, settings.LOG_PAYLOAD_MAX_ITEMS),
+                          default=str, separators=(",", ":"))
+        if len(text) > settings.LOG_PAYLOAD_MAX_CHARS:
+            text = f"{text[:settings.LOG_PAYLOAD_MAX_CHARS]}... ({len(text)} chars)"
+        return redact(text)
+
+
+def log_payload(logger: logging.Logger, label: str, payload: Any, level: int = logging.DEBUG):
+    """Log a request/response body compactly, redacted and truncated, only when the level is on.
+
+    At DEBUG, bodies are additionally sampled by LOG_PAYLOAD_SAMPLE_RATE.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level <= logging.DEBUG and random.random() >= settings.LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, "%s: %s", label, LazyPayload(payload))
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: records are dropped (and counted) while the queue is full."""
+
+    def enqueue(self, record: logging.LogRecord):
+        global dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records += 1
+
+
+def configure_logging(level: str = settings.LOG_LEVEL):
+    """Route all logging through a bounded queue drained by a background listener thread.
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(RedactingFormatter(settings.LOG_FORMAT))
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers[:] = [_DroppingQueueHandler(log_queue)]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    # The listener thread doesn't survive fork (pre-fork servers); give the child its own queue and writer
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging(logging.getLogger().level)
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_after_fork)
@@ -1,51 +1,60 @@
-import json
-from couchbase.cluster import Cluster
-from couchbase.auth import PasswordAuthenticator
-from couchbase.options import ClusterOptions
+"""Load customer documents into Couchbase.
+
+Run from the src directory:
+    python -m utils.populate_cust_CB [--input resources/customers.json] [--checkpoint load.ckpt]
+
+Accepts a JSON array or JSONL file of any size; see utils.bulk_loader.
+"""
+import argparse
+import os
+import sys
+import logging
+
 from couchbase.exceptions import CouchbaseException
-import couchbase.subdocument as SD
 
-csv_file = r"C:\Users\ragde\Desktop\customers.json"
+from config import settings
+from utils.bulk_loader import BulkLoader
+from utils.couchbase_manager import couchbase_manager
+from utils.logging_setup import configure_logging
 
-# Load JSON data from file
-with open(csv_file, 'r') as file:
-    customers = json.load(file)
+logger = logging.getLogger(__name__)
 
-# Couchbase connection details
-cluster_connection_string = 'couchbase://localhost'  # Replace with your cluster IP or hostname
-username = 'Administrator'  # Replace with your Couchbase username
-password = 'Administrator'      # Replace with your Couchbase password
-bucket_name = 'customer_data'
+DEFAULT_INPUT = os.path.join(os.path.dirname(__file__), "..", "resources", "customers.json")
+
+# Connection details come from config/settings.py
+bucket_name = settings.CUSTOMERS_BUCKET
 scope_name = '_default'
 collection_name = '_default'
 
-# Connect to Couchbase cluster
-auth = PasswordAuthenticator(username, password)
-cluster = Cluster(cluster_connection_string, ClusterOptions(auth))
-#cluster.wait_until_ready(timeout=30)  # Wait for cluster to be ready
-
-# Get bucket and collection
-bucket = cluster.bucket(bucket_name)
-collection = bucket.scope(scope_name).collection(collection_name)
-
-# Upsert each customer document into Couchbase
-for customer in customers:
-    customer_id = customer['customer_id']
-    try:
-        # Upsert document with customer_id as the key
-        collection.upsert(customer_id, customer)
-        print(f"Successfully upserted customer {customer_id}")
-    except CouchbaseException as e:
-        print(f"Error upserting customer {customer_id}: {e}")
-
-# Optional: Verify data insertion by querying a few documents
-try:
-    query = f"SELECT * FROM `{bucket_name}`.`{scope_name}`.`{collection_name}` LIMIT 5"
-    result = cluster.query(query)
-    for row in result:
-        print(f"Retrieved document: {row}")
-except CouchbaseException as e:
-    print(f"Error querying documents: {e}")
-
-# Disconnect (optional, as Python will clean up on script exit)
-# cluster.disconnect()
\ No newline at end of file
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load customer documents into Couchbase.")
+    parser.add_argument("--input", default=DEFAULT_INPUT, help="JSON array or JSONL file of customers")
+    parser.add_argument("--key-field", default="customer_id")
+    parser.add_argument("--batch-size", type=int, default=settings.BULK_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=settings.BULK_CONCURRENCY)
+    parser.add_argument("--checkpoint", help="Progress file; re-running with it resumes an interrupted load")
+    parser.add_argument("--verify", action="store_true", help="Print a few loaded documents afterwards")
+    args = parser.parse_args()
+    configure_logging("INFO")
+
+    cluster = couchbase_manager.cluster()
+    collection = cluster.bucket(bucket_name).scope(scope_name).collection(collection_name)
+
+    loader = BulkLoader(collection, args.key_field, args.batch_size, args.concurrency, args.checkpoint)
+    stats = loader.load(args.input)
+    if stats.failed_keys:
+        logger.error(f"First failed keys: {', '.join(stats.failed_keys[:20])}")
+
+    if args.verify:
+        try:
+            query = f"SELECT * FROM `{bucket_name}`.`{scope_name}`.`{collection_name}` LIMIT 5"
+            for row in cluster.query(query):
+                print(f"Retrieved document: {row}")
+        except CouchbaseException as e:
+            print(f"Error querying documents: {e}")
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
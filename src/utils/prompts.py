@@ -0,0 +1,150 @@
+"""Prompt rendering for the tool handlers.
+
+Product blurbs are rendered once per product version and reused; a cached
+snippet is re-rendered as soon as any field it shows changes. Purchase
+history goes in as a short digest rather than raw JSON, and every prompt's
+estimated token count is recorded for /metrics.
+"""
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import settings
+from utils.cache import TTLCache
+from utils.tracing import Histogram, register_histogram
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+prompt_tokens = register_histogram(
+    Histogram("prompt_tokens_estimate", "Estimated input tokens per rendered prompt.", TOKEN_BUCKETS, label="prompt"))
+llm_prompt_tokens = register_histogram(
+    Histogram("llm_prompt_tokens", "Prompt tokens reported by the completions API.", TOKEN_BUCKETS, label="source"))
+
+# (style) -> (fields the snippet was rendered from, snippet)
+_snippets = TTLCache("prompt_snippets", settings.PROMPT_SNIPPET_CACHE_SIZE, settings.PRODUCT_CACHE_TTL)
+
+DISCOUNTS = {
+    "Platinum": "15% off your next purchase or free shipping.",
+    "Gold": "15% off your next purchase or free shipping.",
+    "Silver": "10% off your next purchase.",
+}
+DEFAULT_DISCOUNT = "5% off your next purchase."
+# Complaints can also be settled with a discounted replacement
+COMPLAINT_DISCOUNTS = dict(DISCOUNTS, Silver="10% off a replacement or next purchase.")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def _snippet_fields(product: Dict) -> tuple:
+    return (product.get("style"), product.get("description"), product.get("price"), product.get("color"),
+            product.get("accessory_type"), tuple(product.get("features") or ()), product.get("usage_type"))
+
+
+def product_snippet(product: Dict) -> str:
+    """'<description> (Style: .., Price: $.., Color: .., Type: .., Features: .., Usage: ..)', cached per product version."""
+    fields = _snippet_fields(product)
+    cached = _snippets.get(fields[0])
+    if cached is not None and cached[0] == fields:
+        return cached[1]
+    style, description, price, color, accessory_type, features, usage_type = fields
+    snippet = (
+        f"{description} (Style: {style}, Price: ${price}, Color: {color or 'N/A'}, "
+        f"Type: {accessory_type or 'N/A'}, Features: {', '.join(features) or 'None'}, Usage: {usage_type or 'N/A'})"
+    )
+    _snippets.set(style, (fields, snippet))
+    return snippet
+
+
+def render_alternatives(products: List[Dict]) -> str:
+    if not products:
+        return "No similar products found."
+    return "\n".join(f"- {product_snippet(p)}" for p in products)
+
+
+def discount_offer(loyalty_level: Optional[str], complaint: bool = False) -> str:
+    return (COMPLAINT_DISCOUNTS if complaint else DISCOUNTS).get(loyalty_level, DEFAULT_DISCOUNT)
+
+
+def purchase_digest(history: List[Dict], limit: int = settings.PROMPT_HISTORY_ITEMS) -> str:
+    """Bounded summary of a purchase history: totals, status mix and the most recent purchases."""
+    if not history:
+        return "no previous purchases"
+    total = sum(p.get("amount") or 0 for p in history)
+    statuses = Counter(p.get("status", "Unknown") for p in history)
+    recent = sorted(history, key=lambda p: p.get("purchase_date") or "", reverse=True)[:limit]
+    recent_text = "; ".join(f"{p.get('style')} on {p.get('purchase_date', '?')} ({p.get('status', 'Unknown')})" for p in recent)
+    status_text = ", ".join(f"{status} x{n}" for status, n in statuses.most_common(3))
+    return f"{len(history)} purchases totalling ${total:.2f} ({status_text}); most recent: {recent_text}"
+
+
+def _record(kind: str, prompt: str) -> str:
+    prompt_tokens.observe(kind, estimate_tokens(prompt))
+    return prompt
+
+
+def popularity(sales_stats: Optional[Dict]) -> str:
+    """'Ordered 340 times. ' from a style's sales stats; empty when there are none."""
+    total = (sales_stats or {}).get("total_count") or 0
+    return f"Ordered {total} times. " if total else ""
+
+
+def complaint_prompt(customer: Dict, product: Dict, style: str, complaint: Optional[str], alternatives: List[Dict],
+                     sales_stats: Optional[Dict] = None) -> str:
+    offer = discount_offer(customer.get("loyalty_level"), complaint=True)
+    header = f"Customer {customer['name']} ({customer['loyalty_level']})"
+    details = (f"{product_snippet(product)}. {popularity(sales_stats)}"
+               f"Preferred category: {customer.get('preferred_category', product.get('category'))}. ")
+    if complaint:
+        return _record("complaint", (
+            f"{header} complained about {style}: {details}Complaint: {complaint}. "
+            f"Alternatives: {render_alternatives(alternatives)}. "
+            f"Respond briefly: empathize, apologize, offer {offer} or replacement, suggest alternatives, and encourage further dialogue."
+        ))
+    return _record("cancellation", (
+        f"{header} wants to cancel {style}: {details}Alternatives: {render_alternatives(alternatives)}. "
+        f"Respond briefly: highlight product benefits, offer {offer}, suggest alternatives, and note return option."
+    ))
+
+
+def _question_details(product_style: Optional[str], product: Optional[Dict]) -> str:
+    if product:
+        return f"{product_snippet(product)}. "
+    if product_style:
+        return f"Product style {product_style} not found. "
+    return ""
+
+
+def question_prompt(customer: Dict, question: str, category: str, product_style: Optional[str],
+                    product: Optional[Dict], alternatives: List[Dict]) -> str:
+    return _record("question", (
+        f"Customer {customer['name']} ({customer['loyalty_level']}) asked: {question}. "
+        f"Preferred category: {category}. Purchase history: {purchase_digest(customer.get('purchase_history', []))}. "
+        f"{_question_details(product_style, product)}Recommended products: {render_alternatives(alternatives)}. "
+        f"Respond briefly: answer the question clearly (include product details if requested), "
+        f"offer {discount_offer(customer.get('loyalty_level'))}, suggest recommended products, and invite further questions."
+    ))
+
+
+def shared_question_prompt(loyalty_level: Optional[str], question: str, category: str, product_style: Optional[str],
+                           product: Optional[Dict], alternatives: List[Dict]) -> str:
+    """question_prompt without anything personal (name, purchase history), so the answer can be shared across customers."""
+    return _record("question_shared", (
+        f"A {loyalty_level or 'regular'} customer asked: {question}. Preferred category: {category}. "
+        f"{_question_details(product_style, product)}Recommended products: {render_alternatives(alternatives)}. "
+        f"Respond briefly without addressing the customer by name: answer the question clearly (include product details "
+        f"if requested), offer {discount_offer(loyalty_level)}, suggest recommended products, and invite further questions."
+    ))
+
+
+def purchase_prompt(customer: Dict, product: Dict, style: str, alternatives: List[Dict]) -> str:
+    return _record("purchase", (
+        f"Customer {customer['name']} ({customer['loyalty_level']}) successfully purchased {style}: {product_snippet(product)}. "
+        f"Preferred category: {customer.get('preferred_category', product['category'])}. "
+        f"Recommended products: {render_alternatives(alternatives)}. "
+        f"Respond briefly: confirm the purchase, highlight product benefits, offer {discount_offer(customer.get('loyalty_level'))}, "
+        f"suggest recommended products, and invite further questions."
+    ))
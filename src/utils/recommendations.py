@@ -0,0 +1,124 @@
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from couchbase.options import QueryOptions
+
+from config import settings
+from utils.sales_stats import MONOLITH_KEY, STYLE_KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Same projection the get_similar_products query returns
+PRODUCT_FIELDS = ("style", "description", "price", "color", "accessory_type", "features", "usage_type")
+
+
+# One stock rule for every recommendation path: a product without stock_quantity counts as in stock
+def in_stock(product: Dict) -> bool:
+    quantity = product.get("stock_quantity")
+    return quantity is None or quantity > 0
+
+
+def in_stock_condition(field: str = "stock_quantity") -> str:
+    """SQL++ form of in_stock for a WHERE clause."""
+    return f"({field} IS MISSING OR {field} IS NULL OR {field} > 0)"
+
+
+class RecommendationIndex:
+    """In-memory top-k alternatives per category, built from the products bucket.
+
+    Products are ranked by sales volume and then by stock_quantity;
+    out-of-stock products are left out. Sales volume is the total_count of
+    the per-style sales stats document, falling back to the style's entry
+    in the legacy monolith like SalesStatsStore does (the query service
+    reads the monolith once per build), and 0 without either. Ranking
+    happens in the query service with a window function, so each worker
+    only receives the best top_n products per category however large the
+    catalog is. The index is rebuilt in a background thread and both maps
+    are swapped in with one assignment, so lookups never block on Couchbase
+    or see a half-built index. top_k returns None until the first build
+    finishes.
+    """
+
+    def __init__(self, cluster, products_bucket: str, sales_bucket: str,
+                 top_n: int = settings.RECOMMENDATION_TOP_N,
+                 refresh_interval: float = settings.RECOMMENDATION_REFRESH_INTERVAL):
+        self.cluster = cluster
+        self.products_bucket = products_bucket
+        self.sales_bucket = sales_bucket
+        self.top_n = top_n
+        self.refresh_interval = refresh_interval
+        self._index: Optional[Tuple[Dict[str, List[Dict]], Dict[str, Dict]]] = None  # (by category, by style)
+        self._stop = threading.Event()
+        self._thread = None
+        self.built_at = None
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def build(self):
+        start = time.perf_counter()
+        fields = ", ".join(f"p.{field}" for field in PRODUCT_FIELDS)
+        query = (
+            f"WITH monolith AS (SELECT RAW m.style_status_counts FROM {self.sales_bucket} AS m "
+            f"USE KEYS \"{MONOLITH_KEY}\") "
+            f"SELECT r.* FROM ("
+            f"SELECT {fields}, p.category, ROW_NUMBER() OVER (PARTITION BY p.category "
+            f"ORDER BY IFMISSINGORNULL(s.total_count, monolith[0].[p.style].total_count, 0) DESC, "
+            f"IFMISSINGORNULL(p.stock_quantity, 0) DESC, p.style) AS pos "
+            f"FROM {self.products_bucket} AS p "
+            f"LEFT JOIN {self.sales_bucket} AS s ON KEYS \"{STYLE_KEY_PREFIX}\" || p.style "
+            f"WHERE p.style IS NOT MISSING AND {in_stock_condition('p.stock_quantity')}"
+            f") AS r WHERE r.pos <= $1 ORDER BY r.category, r.pos"
+        )
+        rows = list(self.cluster.query(query, QueryOptions(positional_parameters=[self.top_n])))
+
+        by_category = {}
+        for row in rows:
+            by_category.setdefault(row.get("category"), []).append({field: row.get(field) for field in PRODUCT_FIELDS})
+
+        by_style = {p["style"]: p for products in by_category.values() for p in products}
+        self._index = (by_category, by_style)
+        self.built_at = time.time()
+        logger.info(f"Built recommendation index: {len(rows)} products, {len(by_category)} categories "
+                    f"in {time.perf_counter() - start:.2f}s")
+
+    def top_k(self, category: str, exclude_style: str = None, limit: int = 3) -> Optional[List[Dict]]:
+        """Best-ranked in-stock products of a category, or None while the index is cold."""
+        index = self._index
+        if index is None:
+            return None
+        by_category, _ = index
+        results = []
+        for product in by_category.get(category, ()):
+            if product["style"] == exclude_style:
+                continue
+            results.append(product)
+            if len(results) == limit:
+                break
+        return results
+
+    def get(self, style: str) -> Optional[Dict]:
+        """Summary of an indexed (top_n, in-stock) product, or None."""
+        index = self._index
+        return index[1].get(style) if index is not None else None
+
+    def start(self):
+        """Build and keep refreshing the index in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="recommendation-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.build()
+            except Exception as e:
+                logger.error(f"Error building recommendation index: {str(e)}")
+            self._stop.wait(self.refresh_interval)
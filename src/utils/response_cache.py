@@ -0,0 +1,170 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+import logging
+from typing import Dict, Optional
+
+from config import settings
+from utils.cache import TTLCache, register_stats
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivially different phrasings share a key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+def product_fingerprint(product: Optional[Dict]) -> Optional[str]:
+    """Stable hash of a product document; changes whenever any field changes."""
+    if not product:
+        return None
+    return hashlib.sha1(json.dumps(product, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """LRU+TTL cache of generated answers keyed on (normalized question, style, category, loyalty tier).
+
+    Answers must come from customer-agnostic prompts (see
+    prompts.shared_question_prompt): nothing in the key identifies the
+    customer, so a cached answer is served to everyone in the tier. Each
+    entry remembers the fingerprint of the product it was generated from,
+    so a lookup made with a different fingerprint is treated as stale and
+    dropped. With semantic matching on, a miss falls back to the most
+    similar previously answered question for the same style, category and
+    tier. The question vectors are bounded like the answers: never more
+    than maxsize in total, least recently used bucket first, and a vector
+    whose answer has expired is dropped when a lookup finds it.
+    """
+
+    def __init__(self, maxsize: int = settings.RESPONSE_CACHE_SIZE, ttl: float = settings.RESPONSE_CACHE_TTL,
+                 semantic: bool = settings.RESPONSE_CACHE_SEMANTIC,
+                 threshold: float = settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+                 bucket_size: int = settings.RESPONSE_CACHE_SEMANTIC_BUCKET):
+        self._entries = TTLCache("responses", maxsize, ttl, register=False)
+        self.semantic = semantic
+        self.threshold = threshold
+        self.bucket_size = bucket_size
+        self._vectors = OrderedDict()  # (style, category, tier) -> OrderedDict(normalized question -> unit vector)
+        self._vector_count = 0
+        self._lock = threading.Lock()
+        self._encoder = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.stale = 0
+        self.misses = 0
+
+    def _encode(self, text: str):
+        if self._encoder is None:
+            from utils.similarity import TextEncoder, get_engine
+            engine = get_engine()
+            self._encoder = engine.encoder if engine is not None else TextEncoder()
+        return self._encoder.encode([text])[0]
+
+    def _lookup(self, key, fingerprint: Optional[str]) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cached_fingerprint, response = entry
+        if cached_fingerprint != fingerprint:
+            self._entries.invalidate(key)
+            self.stale += 1
+            return None
+        return response
+
+    def get(self, question: str, style: Optional[str], category: Optional[str], tier: Optional[str],
+            fingerprint: Optional[str]) -> Optional[str]:
+        normalized = normalize_question(question)
+        response = self._lookup((normalized, style, category, tier), fingerprint)
+        if response is not None:
+            self.exact_hits += 1
+            return response
+        if self.semantic:
+            try:
+                response = self._semantic_lookup(normalized, style, category, tier, fingerprint)
+            except Exception as e:
+                logger.error(f"Semantic response cache lookup failed: {str(e)}")
+                response = None
+            if response is not None:
+                self.semantic_hits += 1
+                return response
+        self.misses += 1
+        return None
+
+    def _semantic_lookup(self, normalized: str, style: Optional[str], category: Optional[str], tier: Optional[str],
+                         fingerprint: Optional[str]) -> Optional[str]:
+        bucket_key = (style, category, tier)
+        with self._lock:
+            candidates = list(self._vectors.get(bucket_key, {}).items())
+        if not candidates:
+            return None
+        vector = self._encode(normalized)
+        best_question, best_score = max(((q, float(vector @ v)) for q, v in candidates), key=lambda c: c[1])
+        if best_score < self.threshold:
+            return None
+        response = self._lookup((best_question, style, category, tier), fingerprint)
+        if response is None:
+            # The answer expired, was evicted or went stale; its vector can only produce misses now
+            self._forget(bucket_key, best_question)
+        return response
+
+    def _forget(self, bucket_key, question: str):
+        with self._lock:
+            bucket = self._vectors.get(bucket_key)
+            if bucket is None or bucket.pop(question, None) is None:
+                return
+            self._vector_count -= 1
+            if not bucket:
+                del self._vectors[bucket_key]
+
+    def set(self, question: str, style: Optional[str], category: Optional[str], tier: Optional[str],
+            fingerprint: Optional[str], response: str):
+        normalized = normalize_question(question)
+        self._entries.set((normalized, style, category, tier), (fingerprint, response))
+        if self.semantic:
+            try:
+                vector = self._encode(normalized)
+            except Exception as e:
+                logger.error(f"Could not embed question for the response cache: {str(e)}")
+                return
+            bucket_key = (style, category, tier)
+            with self._lock:
+                bucket = self._vectors.setdefault(bucket_key, OrderedDict())
+                self._vectors.move_to_end(bucket_key)
+                if normalized not in bucket:
+                    self._vector_count += 1
+                bucket[normalized] = vector
+                bucket.move_to_end(normalized)
+                while len(bucket) > self.bucket_size:
+                    bucket.popitem(last=False)
+                    self._vector_count -= 1
+                while self._vector_count > self._entries.maxsize:
+                    oldest_key, oldest = next(iter(self._vectors.items()))
+                    oldest.popitem(last=False)
+                    self._vector_count -= 1
+                    if not oldest:
+                        del self._vectors[oldest_key]
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        entries = self._entries.stats()
+        return {
+            "size": entries["size"],
+            "maxsize": entries["maxsize"],
+            "ttl": entries["ttl"],
+            "evictions": entries["evictions"],
+            "expirations": entries["expirations"],
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "stale": self.stale,
+            "misses": self.misses,
+            "semantic_buckets": len(self._vectors),
+            "semantic_vectors": self._vector_count,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
+register_stats("responses", response_cache)
@@ -0,0 +1,150 @@
+"""Layout of the sales statistics documents in the sales_cache bucket.
+
+utils/CB_pandas.py writes one small document per style plus a summary
+document; the legacy single 'total_sales_stats' document is optional.
+SalesStatsStore is the runtime accessor.
+"""
+import threading
+import time
+import logging
+from typing import Dict, List
+
+import couchbase.subdocument as SD
+from couchbase.exceptions import DocumentNotFoundException
+
+from config import settings
+from utils.cache import TTLCache
+from utils.conversation_store import MAX_LOOKUP_SPECS
+
+logger = logging.getLogger(__name__)
+
+MONOLITH_KEY = "total_sales_stats"
+STYLE_KEY_PREFIX = "sales_stats::style::"
+SUMMARY_KEY = "sales_stats::summary"
+
+
+def style_key(style: str) -> str:
+    return f"{STYLE_KEY_PREFIX}{style}"
+
+
+def subdoc_path(*parts: str) -> str:
+    """Sub-document path with every component backtick-quoted, since statuses contain spaces and dashes."""
+    return ".".join(f"`{part.replace('`', '``')}`" for part in parts)
+
+
+def empty_stats() -> Dict:
+    return {"total_count": 0, "status_counts": {}}
+
+
+class SalesStatsStore:
+    """Per-style sales stats read on demand, with a bounded cache kept fresh in the background.
+
+    Reads the per-style documents with get_multi; styles without one fall
+    back to a sub-document lookup of just their entry in the legacy
+    monolith, so nothing ever loads the whole catalog's stats. A daemon
+    thread re-reads the styles read within the last TTL each
+    refresh_interval, so hot styles don't go stale and don't miss; styles
+    nobody asks for are left to expire.
+    """
+
+    def __init__(self, collection, maxsize: int = settings.SALES_STATS_CACHE_SIZE,
+                 ttl: float = settings.SALES_STATS_CACHE_TTL,
+                 refresh_interval: float = settings.SALES_STATS_REFRESH_INTERVAL):
+        self.collection = collection
+        self.cache = TTLCache("sales_stats", maxsize, ttl)
+        self.refresh_interval = refresh_interval
+        self._accessed: Dict[str, float] = {}  # style -> time.monotonic() of its last read, for the refresher
+        self._accessed_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fetch(self, styles: List[str]) -> Dict[str, Dict]:
+        found = {}
+        keys = {style_key(style): style for style in styles}
+        result = self.collection.get_multi(list(keys))
+        for key, value in result.results.items():
+            doc = value.content_as[dict]
+            found[keys[key]] = {"total_count": doc.get("total_count", 0), "status_counts": doc.get("status_counts", {})}
+        missing = [style for style in styles if style not in found]
+        for start in range(0, len(missing), MAX_LOOKUP_SPECS):
+            found.update(self._fetch_from_monolith(missing[start:start + MAX_LOOKUP_SPECS]))
+        return found
+
+    def _fetch_from_monolith(self, styles: List[str]) -> Dict[str, Dict]:
+        try:
+            result = self.collection.lookup_in(
+                MONOLITH_KEY, [SD.get(subdoc_path("style_status_counts", style)) for style in styles])
+        except DocumentNotFoundException:
+            return {style: empty_stats() for style in styles}
+        return {style: result.content_as[dict](i) if result.exists(i) else empty_stats()
+                for i, style in enumerate(styles)}
+
+    def get(self, style: str) -> Dict:
+        return self.get_many([style])[style]
+
+    def _touch(self, styles: List[str]):
+        """Note the read for the refresher."""
+        if self.refresh_interval > 0:
+            now = time.monotonic()
+            with self._accessed_lock:
+                for style in styles:
+                    self._accessed[style] = now
+
+    def get_many(self, styles: List[str]) -> Dict[str, Dict]:
+        self._touch(styles)
+        stats = {}
+        for style in styles:
+            cached = self.cache.get(style)
+            if cached is not None:
+                stats[style] = cached
+        missing = [style for style in styles if style not in stats]
+        if missing:
+            fetched = self._fetch(missing)
+            for style, value in fetched.items():
+                self.cache.set(style, value)
+            stats.update(fetched)
+        return stats
+
+    async def aget(self, style: str, collection) -> Dict:
+        """get() for the asyncio path: same cache, with a miss read through an acouchbase collection."""
+        self._touch([style])
+        cached = self.cache.get(style)
+        if cached is not None:
+            return cached
+        try:
+            doc = (await collection.get(style_key(style))).content_as[dict]
+            stats = {"total_count": doc.get("total_count", 0), "status_counts": doc.get("status_counts", {})}
+        except DocumentNotFoundException:
+            try:
+                result = await collection.lookup_in(MONOLITH_KEY, [SD.get(subdoc_path("style_status_counts", style))])
+                stats = result.content_as[dict](0) if result.exists(0) else empty_stats()
+            except DocumentNotFoundException:
+                stats = empty_stats()
+        self.cache.set(style, stats)
+        return stats
+
+    def refresh(self):
+        """Re-read the styles read within the last TTL; the others are forgotten and expire from the cache."""
+        cutoff = time.monotonic() - self.cache.ttl
+        with self._accessed_lock:
+            self._accessed = {style: at for style, at in self._accessed.items() if at > cutoff}
+            styles = list(self._accessed)
+        for start in range(0, len(styles), settings.SALES_STATS_FETCH_CHUNK):
+            for style, value in self._fetch(styles[start:start + settings.SALES_STATS_FETCH_CHUNK]).items():
+                self.cache.set(style, value)
+        logger.debug(f"Refreshed sales stats for {len(styles)} recently read styles")
+
+    def start(self):
+        if self._thread is None and self.refresh_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="sales-stats-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing sales stats: {str(e)}")
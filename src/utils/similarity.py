@@ -0,0 +1,219 @@
+"""Embedding-based product similarity.
+
+Product texts (description, features, usage_type) are embedded once, offline
+and on CPU, into an L2-normalized float32 matrix saved as embeddings.npy next
+to a meta.json holding the row -> style/category mapping. At serving time the
+matrix is memory-mapped and top-k queries are answered with blocked numpy dot
+products, so resident memory stays bounded even for million-product catalogs.
+
+Build the index with:
+    python -m utils.similarity --output resources/similarity [--products-jsonl products.jsonl]
+"""
+import argparse
+import json
+import os
+import threading
+import logging
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+META_FILE = "meta.json"
+
+
+def product_text(product: Dict) -> str:
+    features = product.get("features") or []
+    if isinstance(features, str):
+        features = [features]
+    return " ".join(filter(None, [
+        product.get("description", ""),
+        "Features: " + ", ".join(features) if features else "",
+        f"Usage: {product['usage_type']}" if product.get("usage_type") else "",
+    ]))
+
+
+class TextEncoder:
+    """Mean-pooled transformer sentence embeddings on CPU; torch/transformers load on first use."""
+
+    def __init__(self, model_name: str = settings.EMBEDDING_MODEL_NAME, batch_size: int = settings.EMBEDDING_BATCH_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from transformers import AutoModel, AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self._model = AutoModel.from_pretrained(self.model_name).eval()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        import torch
+        if self._model is None:
+            self._load()
+        batches = []
+        with torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                tokens = self._tokenizer(texts[start:start + self.batch_size], padding=True, truncation=True,
+                                         max_length=256, return_tensors="pt")
+                hidden = self._model(**tokens).last_hidden_state
+                mask = tokens["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                batches.append(torch.nn.functional.normalize(pooled, dim=1).numpy().astype(np.float32))
+        return np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+
+def build_index(products: Iterable[Dict], output_dir: str, encoder: Optional[TextEncoder] = None):
+    """Embed products and write embeddings.npy + meta.json to output_dir.
+
+    Products are read and embedded encoder.batch_size at a time and the
+    vectors spooled to disk, so memory stays flat however large the catalog.
+    """
+    encoder = encoder or TextEncoder()
+    os.makedirs(output_dir, exist_ok=True)
+    spool_path = os.path.join(output_dir, EMBEDDINGS_FILE + ".tmp")
+    styles, categories, dimension = [], [], 0
+    products = iter(products)
+    with open(spool_path, "wb") as spool:
+        while True:
+            batch = list(islice(products, encoder.batch_size))
+            if not batch:
+                break
+            vectors = encoder.encode([product_text(p) for p in batch])
+            dimension = vectors.shape[1]
+            spool.write(vectors.tobytes())
+            styles.extend(p["style"] for p in batch)
+            categories.extend(p.get("category") for p in batch)
+    # np.save needs the row count up front; copy the spool into the .npy block by block
+    matrix = np.lib.format.open_memmap(os.path.join(output_dir, EMBEDDINGS_FILE), mode="w+", dtype=np.float32,
+                                       shape=(len(styles), dimension))
+    if styles:
+        spooled = np.memmap(spool_path, dtype=np.float32, mode="r", shape=matrix.shape)
+        for start in range(0, len(styles), settings.SIMILARITY_BLOCK_ROWS):
+            matrix[start:start + settings.SIMILARITY_BLOCK_ROWS] = spooled[start:start + settings.SIMILARITY_BLOCK_ROWS]
+        del spooled
+    matrix.flush()
+    del matrix
+    os.remove(spool_path)
+    with open(os.path.join(output_dir, META_FILE), "w") as f:
+        json.dump({"model": encoder.model_name, "styles": styles, "categories": categories}, f)
+    logger.info(f"Wrote {len(styles)} embeddings of dimension {dimension} to {output_dir}")
+
+
+class SimilarityEngine:
+    """Top-k cosine similarity over a memory-mapped float32 embedding matrix."""
+
+    def __init__(self, index_dir: str, mmap: bool = True, block_rows: int = settings.SIMILARITY_BLOCK_ROWS,
+                 encoder: Optional[TextEncoder] = None):
+        self.vectors = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            meta = json.load(f)
+        self.styles = meta["styles"]
+        self.rows = {style: row for row, style in enumerate(self.styles)}
+        category_names = sorted({c for c in meta["categories"] if c is not None})
+        self._category_codes = {name: code for code, name in enumerate(category_names)}
+        self.categories = np.array([self._category_codes.get(c, -1) for c in meta["categories"]], dtype=np.int16)
+        self._category_masks = {}
+        self.block_rows = block_rows
+        self.encoder = encoder or TextEncoder(meta.get("model", settings.EMBEDDING_MODEL_NAME))
+
+    def __contains__(self, style: str) -> bool:
+        return style in self.rows
+
+    def _mask(self, category: Optional[str]) -> Optional[np.ndarray]:
+        if category is None:
+            return None
+        mask = self._category_masks.get(category)
+        if mask is None:
+            mask = self.categories == self._category_codes.get(category, -2)
+            self._category_masks[category] = mask
+        return mask
+
+    def search(self, queries: np.ndarray, k: int, category: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores), each of shape (len(queries), k), best match first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        mask = self._mask(category)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.vectors.shape[0], self.block_rows):
+            scores = queries @ self.vectors[start:start + self.block_rows].T
+            if mask is not None:
+                scores[:, ~mask[start:start + scores.shape[1]]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+            # Merge this block's candidates with the running top-k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _styles_for(self, rows: np.ndarray, scores: np.ndarray, exclude: Optional[str], limit: int) -> List[str]:
+        return [self.styles[r] for r, s in zip(rows, scores) if np.isfinite(s) and self.styles[r] != exclude][:limit]
+
+    def similar_to_style(self, style: str, k: int = 3, category: Optional[str] = None) -> List[str]:
+        """Styles closest to an indexed style, excluding the style itself."""
+        rows, scores = self.search(self.vectors[self.rows[style]], k + 1, category)
+        return self._styles_for(rows[0], scores[0], style, k)
+
+    def search_text(self, text: str, k: int = 3, category: Optional[str] = None) -> List[str]:
+        """Styles closest to free text, e.g. a customer question."""
+        rows, scores = self.search(self.encoder.encode([text]), k, category)
+        return self._styles_for(rows[0], scores[0], None, k)
+
+
+_engine = None
+_engine_missing = False  # set once the index turned out not to exist, so it is not looked for on every call
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Optional[SimilarityEngine]:
+    """The process-wide engine, or None when disabled or the index has not been built."""
+    global _engine, _engine_missing
+    if not settings.SIMILARITY_ENGINE_ENABLED or _engine_missing:
+        return None
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None and not _engine_missing:
+                try:
+                    _engine = SimilarityEngine(settings.SIMILARITY_INDEX_DIR)
+                    logger.info(f"Loaded similarity index with {len(_engine.styles)} products")
+                except FileNotFoundError:
+                    logger.warning(f"Similarity index not found in {settings.SIMILARITY_INDEX_DIR}; engine disabled")
+                    _engine_missing = True
+    return _engine
+
+
+def _load_products(products_jsonl: Optional[str]) -> Iterator[Dict]:
+    """Products one at a time, from a JSONL file or streamed from the query service."""
+    if products_jsonl:
+        with open(products_jsonl) as f:
+            yield from (json.loads(line) for line in f if line.strip())
+        return
+    from utils.tool_utils import cluster, PRODUCTS_BUCKET_NAME
+    query = f"SELECT style, category, description, features, usage_type FROM {PRODUCTS_BUCKET_NAME}"
+    yield from cluster.query(query)
+
+
+if __name__ == "__main__":
+    from utils.logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Build the product embedding index.")
+    parser.add_argument("--output", default=settings.SIMILARITY_INDEX_DIR)
+    parser.add_argument("--products-jsonl", help="Read products from a JSONL file instead of Couchbase")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    args = parser.parse_args()
+    configure_logging("INFO")
+    build_index(_load_products(args.products_jsonl), args.output, TextEncoder(args.model, args.batch_size))
@@ -0,0 +1,218 @@
+"""Request coalescing: concurrent identical calls share one upstream call.
+
+The first caller for a key (the leader) makes the call; callers arriving
+while it is in flight (followers) get a copy of its result, or a copy of its
+exception chained to the original. Nothing is cached: once the call finishes
+the key is forgotten. Streams are driven by a background thread into a
+shared buffer, so every subscriber (including the first) reads the same
+chunks and one client disconnecting doesn't stall the others.
+
+wait_timeout means the same thing in both classes: a follower gives up with
+TimeoutError if the result (for a stream: the first chunk) has not arrived
+within wait_timeout of joining. The leader is never timed out here, and a
+stream that has started is read to the end however slow it is; the call's
+own HTTP timeouts bound both.
+"""
+import asyncio
+import contextvars
+import copy
+import hashlib
+import json
+import threading
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List
+
+from config import settings
+from utils.tracing import DURATION_BUCKETS, Histogram, register_collector, register_histogram, render_family
+
+logger = logging.getLogger(__name__)
+
+coalesced_wait = register_histogram(
+    Histogram("llm_coalesced_wait_seconds", "Time coalesced callers waited on a shared completion.", DURATION_BUCKETS, label="call"))
+
+# Every SingleFlight / AsyncSingleFlight in the process, by name, for /metrics
+_flights: Dict[str, Any] = {}
+
+
+@register_collector
+def render_flights() -> List[str]:
+    """llm_singleflight_* series, one per flight."""
+    return render_family("llm_singleflight", "flight", (
+        ("size", "gauge"), ("leaders", "counter"), ("coalesced", "counter"), ("wait_timeouts", "counter"),
+        ("shared_errors", "counter")), {name: flight.stats() for name, flight in _flights.items()})
+
+
+def request_key(payload: Dict, api_key: str, stream: bool = False) -> str:
+    """Canonical hash of a request: key order and whitespace don't matter, the API key does."""
+    canonical = json.dumps([payload, stream, hashlib.sha256(api_key.encode()).hexdigest()],
+                           sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _copy_error(error: BaseException) -> BaseException:
+    """The leader's exception for a follower to raise: same type and attributes, its own traceback."""
+    # __new__ rather than copy.copy: subclasses like LLMOverloadedError take extra __init__ arguments
+    clone = type(error).__new__(type(error), *error.args)
+    clone.__dict__.update(getattr(error, "__dict__", {}))
+    return clone
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "chunks", "cond")
+
+    def __init__(self):
+        self.done = False
+        self.result = None
+        self.error = None
+        self.chunks = []
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    def __init__(self, name: str, wait_timeout: float = settings.LLM_SINGLEFLIGHT_WAIT):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.wait_timeouts = 0
+        self.shared_errors = 0
+        _flights[name] = self
+
+    def _join(self, key: str):
+        """(call, is_leader) for key."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def _finish(self, key: str, call: _Call):
+        with self._lock:
+            self._calls.pop(key, None)
+        with call.cond:
+            call.done = True
+            call.cond.notify_all()
+
+    def _timed_out(self, key: str):
+        with self._lock:
+            self.wait_timeouts += 1
+        return TimeoutError(f"Timed out after {self.wait_timeout}s waiting for a shared {self.name} call")
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """fn() once per key among concurrent callers; the others get a deep copy of its result."""
+        call, leader = self._join(key)
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                self._finish(key, call)
+        start = time.perf_counter()
+        with call.cond:
+            if not call.cond.wait_for(lambda: call.done, self.wait_timeout):
+                raise self._timed_out(key)
+        coalesced_wait.observe(self.name, time.perf_counter() - start)
+        if call.error is not None:
+            with self._lock:
+                self.shared_errors += 1
+            raise _copy_error(call.error) from call.error
+        return copy.deepcopy(call.result)
+
+    def stream(self, key: str, fn: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """Chunks of fn() shared by every concurrent subscriber to key."""
+        call, leader = self._join(key)
+        if leader:
+            def pump():
+                try:
+                    for chunk in fn():
+                        with call.cond:
+                            call.chunks.append(chunk)
+                            call.cond.notify_all()
+                except BaseException as e:
+                    call.error = e
+                finally:
+                    self._finish(key, call)
+            threading.Thread(target=contextvars.copy_context().run, args=(pump,),
+                             name=f"{self.name}-stream", daemon=True).start()
+        return self._read(key, call, leader)
+
+    def _read(self, key: str, call: _Call, leader: bool) -> Iterator[str]:
+        start = time.perf_counter()
+        index = 0
+        while True:
+            # Only a follower waiting for the first chunk is timed out; see the module docstring
+            timeout = self.wait_timeout if index == 0 and not leader else None
+            with call.cond:
+                if not call.cond.wait_for(lambda: call.done or len(call.chunks) > index, timeout):
+                    raise self._timed_out(key)
+                chunks = call.chunks[index:]
+                done = call.done
+            if index == 0 and chunks and not leader:
+                coalesced_wait.observe(f"{self.name}.first_chunk", time.perf_counter() - start)
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if done and index == len(call.chunks):
+                if call.error is not None:
+                    if leader:
+                        raise call.error
+                    with self._lock:
+                        self.shared_errors += 1
+                    raise _copy_error(call.error) from call.error
+                return
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced,
+                    "wait_timeouts": self.wait_timeouts, "shared_errors": self.shared_errors}
+
+
+class AsyncSingleFlight:
+    """asyncio version of SingleFlight.do, with the same timeout rules; use from one event loop."""
+
+    def __init__(self, name: str, wait_timeout: float = settings.LLM_SINGLEFLIGHT_WAIT):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.wait_timeouts = 0
+        self.shared_errors = 0
+        _flights[name] = self
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            # Shielded: a leader that is cancelled doesn't cancel the call the followers share
+            return await asyncio.shield(task)
+        self.coalesced += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+        except asyncio.TimeoutError as e:
+            if not task.done():
+                self.wait_timeouts += 1
+                raise TimeoutError(f"Timed out after {self.wait_timeout}s waiting for a shared {self.name} call")
+            self.shared_errors += 1  # the shared call itself timed out
+            raise _copy_error(e) from e
+        except Exception as e:
+            self.shared_errors += 1
+            raise _copy_error(e) from e
+        coalesced_wait.observe(self.name, time.perf_counter() - start)
+        return copy.deepcopy(result)
+
+    def stats(self) -> Dict:
+        return {"size": len(self._tasks), "leaders": self.leaders, "coalesced": self.coalesced,
+                "wait_timeouts": self.wait_timeouts, "shared_errors": self.shared_errors}
@@ -1,282 +1,374 @@
-import ollama
+import asyncio
 import json
-import pytz
 import requests
 import re  # Added for style extraction in handle_general_question
 from datetime import datetime
-from typing import Dict, Callable, List
-from flask import Flask, request, jsonify
-from couchbase.cluster import Cluster
-from couchbase.auth import PasswordAuthenticator
-from couchbase.options import ClusterOptions, QueryOptions
-import os
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from couchbase.options import QueryOptions
+import couchbase.subdocument as SD
 import logging
+from config import settings
+from utils.llm_client import chat_completion, get_async_client, stream_chat_completion
+from utils.llm_limiter import LLMOverloadedError
+from utils.cache import TTLCache
+from utils.couchbase_manager import couchbase_manager, LazyCluster, LazyCollection
+from utils.sales_stats import SalesStatsStore
+from utils.recommendations import RecommendationIndex, PRODUCT_FIELDS, in_stock, in_stock_condition
+from utils.response_cache import response_cache, product_fingerprint
+from utils.fanout import Fanout
+from utils.prompts import complaint_prompt, question_prompt, shared_question_prompt, purchase_prompt, llm_prompt_tokens
+from utils.tracing import traced, span, payload_size
+from utils.logging_setup import log_payload
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def get_current_time(timezone: str = "US/Central") -> str:
+    import pytz
     try:
         tz = pytz.timezone(timezone)
     except pytz.exceptions.UnknownTimeZoneError:
         tz = pytz.timezone("US/Central")
     return datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
 
-COUCHBASE_URL = "couchbase://localhost"
-USERNAME = "Administrator"
-PASSWORD = "Administrator"
-CUSTOMERS_BUCKET_NAME = "customer_data"
-PRODUCTS_BUCKET_NAME = "products"
-SALES_STATS_BUCKET_NAME = "sales_cache"
-SALES_STATS_DOCUMENT_KEY = "total_sales_stats"
-
-# Initialize Couchbase cluster
-cluster = Cluster(COUCHBASE_URL, ClusterOptions(PasswordAuthenticator(USERNAME, PASSWORD)))
-customers_bucket = cluster.bucket(CUSTOMERS_BUCKET_NAME)
-products_bucket = cluster.bucket(PRODUCTS_BUCKET_NAME)
-sales_stats_bucket = cluster.bucket(SALES_STATS_BUCKET_NAME)
-customers_collection = customers_bucket.default_collection()
-products_collection = products_bucket.default_collection()
-sales_stats_collection = sales_stats_bucket.default_collection()
-
-# Cache for sales stats
-_sales_stats_cache = None
+CUSTOMERS_BUCKET_NAME = settings.CUSTOMERS_BUCKET
+PRODUCTS_BUCKET_NAME = settings.PRODUCTS_BUCKET
+SALES_STATS_BUCKET_NAME = settings.SALES_STATS_BUCKET
 
-def get_customer(customer_id: str) -> Dict:
+# Shared, lazily opened connection; nothing connects until the first lookup
+cluster = LazyCluster(couchbase_manager)
+customers_collection = LazyCollection(couchbase_manager, CUSTOMERS_BUCKET_NAME)
+products_collection = LazyCollection(couchbase_manager, PRODUCTS_BUCKET_NAME)
+sales_stats_collection = LazyCollection(couchbase_manager, SALES_STATS_BUCKET_NAME)
+
+# Read-through caches; cached documents are shared, so callers must copy before mutating
+product_cache = TTLCache("products", settings.PRODUCT_CACHE_SIZE, settings.PRODUCT_CACHE_TTL)
+customer_cache = TTLCache("customers", settings.CUSTOMER_CACHE_SIZE, settings.CUSTOMER_CACHE_TTL)
+sales_stats_store = SalesStatsStore(sales_stats_collection)
+
+@traced("couchbase.get_customer")
+def _fetch_customer(customer_id: str) -> Dict:
     try:
         result = customers_collection.get(customer_id)
-        logger.debug(f"Fetched customer {customer_id}: {result.content_as[dict]}")
-        return result.content_as[dict]
+        customer = result.content_as[dict]
+        log_payload(logger, f"Fetched customer {customer_id}", customer)
+        return customer
     except Exception as e:
         logger.error(f"Error fetching customer {customer_id}: {str(e)}")
         return None
 
-def get_product(style: str) -> Dict:
+@traced("couchbase.get_product")
+def _fetch_product(style: str) -> Dict:
     try:
         result = products_collection.get(style)
-        logger.debug(f"Fetched product {style}: {result.content_as[dict]}")
-        return result.content_as[dict]
+        product = result.content_as[dict]
+        log_payload(logger, f"Fetched product {style}", product)
+        return product
     except Exception as e:
         logger.error(f"Error fetching product {style}: {str(e)}")
         return None
 
+@traced("get_customer")
+def get_customer(customer_id: str) -> Dict:
+    return customer_cache.get_or_load(customer_id, lambda: _fetch_customer(customer_id))
+
+@traced("get_product")
+def get_product(style: str) -> Dict:
+    return product_cache.get_or_load(style, lambda: _fetch_product(style))
+
+@traced("get_sales_stats")
 def get_sales_stats(style: str) -> Dict:
-    global _sales_stats_cache
     try:
-        if _sales_stats_cache is None:
-            result = sales_stats_collection.get(SALES_STATS_DOCUMENT_KEY)
-            _sales_stats_cache = result.content_as[dict]
-        stats = _sales_stats_cache.get("style_status_counts", {}).get(style, {"total_count": 0, "status_counts": {}})
+        stats = sales_stats_store.get(style)
         logger.debug(f"Sales stats for {style}: {stats}")
         return stats
     except Exception as e:
         logger.error(f"Error fetching sales stats for {style}: {str(e)}")
         return {"total_count": 0, "status_counts": {}}
 
+# Ranked alternatives per category, refreshed in the background; started by the serving entry points
+recommendation_index = RecommendationIndex(cluster, PRODUCTS_BUCKET_NAME, SALES_STATS_BUCKET_NAME)
+
+def _product_summary(style: str) -> Dict:
+    """Recommendation fields of an in-stock product, or None."""
+    summary = recommendation_index.get(style)
+    if summary is not None:
+        return summary
+    # The index only holds each category's top products; anything else comes from the product cache
+    product = get_product(style)
+    if not product or not in_stock(product):
+        return None
+    return {field: product.get(field) for field in PRODUCT_FIELDS}
+
+def get_engine():
+    """The embedding similarity engine, or None; numpy and the index load only once it is enabled."""
+    if not settings.SIMILARITY_ENGINE_ENABLED:
+        return None
+    from utils.similarity import get_engine as load_engine
+    return load_engine()
+
+def _semantic_products(styles: List[str], limit: int) -> list:
+    return [p for p in map(_product_summary, styles) if p][:limit]
+
+@traced("find_products_for_question")
+def find_products_for_question(question: str, category: str, limit: int = 3) -> list:
+    """Products whose embeddings best match a free-text question; category match when the engine is off."""
+    engine = get_engine()
+    if engine is not None:
+        try:
+            products = _semantic_products(engine.search_text(question, limit * 3, category), limit)
+            if products:
+                return products
+        except Exception as e:
+            logger.error(f"Error searching products for question: {str(e)}")
+    return get_similar_products(category, None, limit)
+
+def _similar_products_query(category: str, exclude_style: Optional[str], limit: int) -> Tuple[str, list]:
+    # Fallback while the index is cold: unranked, but still skips out-of-stock products
+    query = (
+        f"SELECT style, description, price, color, accessory_type, features, usage_type FROM {PRODUCTS_BUCKET_NAME} "
+        f"WHERE category = $1 AND {in_stock_condition()}"
+    )
+    if exclude_style:
+        return query + " AND style != $2 LIMIT $3", [category, exclude_style, limit]
+    return query + " LIMIT $2", [category, limit]
+
+@traced("get_similar_products")
 def get_similar_products(category: str, exclude_style: str = None, limit: int = 3) -> list:
+    engine = get_engine()
+    if engine is not None and exclude_style in engine:
+        try:
+            # Over-fetch so out-of-stock neighbours can be dropped
+            products = _semantic_products(engine.similar_to_style(exclude_style, limit * 3, category), limit)
+            if products:
+                logger.debug(f"Served {len(products)} semantically similar products for {exclude_style}")
+                return products
+        except Exception as e:
+            logger.error(f"Error fetching semantically similar products for {exclude_style}: {str(e)}")
+    if settings.RECOMMENDATION_INDEX_ENABLED:
+        products = recommendation_index.top_k(category, exclude_style, limit)
+        if products is not None:
+            logger.debug(f"Served {len(products)} similar products for category {category} from the index")
+            return products
     try:
-        # Updated query to select fields from the new product structure
-        query = f"SELECT style, description, price, color, accessory_type, features, usage_type FROM {PRODUCTS_BUCKET_NAME} WHERE category = $1"
-        params = [category]
-        if exclude_style:
-            query += " AND style != $2 LIMIT $3"
-            params.extend([exclude_style, limit])
-        else:
-            query += " LIMIT $2"
-            params.append(limit)
-        result = cluster.query(query, QueryOptions(positional_parameters=params))
-        products = [row for row in result]
+        query, params = _similar_products_query(category, exclude_style, limit)
+        with span("couchbase.query") as current:
+            products = [row for row in cluster.query(query, QueryOptions(positional_parameters=params))]
+            if current is not None:
+                current.size = payload_size(products)
         logger.debug(f"Fetched {len(products)} similar products for category {category}")
         return products
     except Exception as e:
         logger.error(f"Error fetching similar products for category {category}: {str(e)}")
         return []
 
-def handle_complaint(customer_id: str, style: str, complaint: str, api_key: str, agent: 'SimpleAgent' = None) -> str:
-    logger.debug(f"Handling complaint for customer_id: {customer_id}, style: {style}, complaint: {complaint}")
-    
-    customer = get_customer(customer_id)
-    if not customer:
-        return f"Customer {customer_id} not found in Couchbase bucket '{CUSTOMERS_BUCKET_NAME}'."
-
-    product = get_product(style)
-    if not product:
-        return f"Product style {style} not found in Couchbase bucket '{PRODUCTS_BUCKET_NAME}'."
-
-    sales_stats = get_sales_stats(style)
-    purchase = next((p for p in customer.get("purchase_history", []) if p["style"] == style), None)
-    if not purchase:
-        return f"No purchase of {style} found for customer {customer_id}."
-
-    similar_products = get_similar_products(customer.get("preferred_category", product["category"]), style)
-    # Updated similar products text to use new fields
-    similar_products_text = "\n".join([
-        f"- {p['description']} (Style: {p['style']}, Price: ${p['price']}, Color: {p['color']}, "
-        f"Type: {p.get('accessory_type', 'N/A')}, Features: {', '.join(p.get('features', [])) or 'None'}, "
-        f"Usage: {p.get('usage_type', 'N/A')})"
-        for p in similar_products
-    ]) if similar_products else "No similar products found."
-
-    discount_offer = ""
-    if customer.get("loyalty_level") in ["Gold", "Platinum"]:
-        discount_offer = "15% off your next purchase or free shipping."
-    elif customer.get("loyalty_level") == "Silver":
-        discount_offer = "10% off a replacement or next purchase."
-    else:
-        discount_offer = "5% off your next purchase."
-
-    # Updated prompt to use new product fields
-    if complaint:
-        prompt = (
-            f"Customer {customer['name']} ({customer['loyalty_level']}) complained about {style}: {product['description']} "
-            f"(${product['price']}, {product['color']}, Type: {product.get('accessory_type', 'N/A')}, "
-            f"Features: {', '.join(product.get('features', [])) or 'None'}, Usage: {product.get('usage_type', 'N/A')}). "
-            f"Complaint: {complaint}. Preferred category: {customer['preferred_category']}. "
-            f"Alternatives: {similar_products_text}. "
-            f"Respond briefly: empathize, apologize, offer {discount_offer} or replacement, suggest alternatives, and encourage further dialogue."
-        )
-    else:
-        prompt = (
-            f"Customer {customer['name']} ({customer['loyalty_level']}) wants to cancel {style}: {product['description']} "
-            f"(${product['price']}, {product['color']}, Type: {product.get('accessory_type', 'N/A')}, "
-            f"Features: {', '.join(product.get('features', [])) or 'None'}, Usage: {product.get('usage_type', 'N/A')}). "
-            f"Preferred category: {customer['preferred_category']}. Alternatives: {similar_products_text}. "
-            f"Respond briefly: highlight product benefits, offer {discount_offer}, suggest alternatives, and note return option."
-        )
-
+def _complete_prompt(prompt: str, api_key: str, customer_id: str, agent: 'SimpleAgent', source: str,
+                     on_success: Optional[Callable[[str], None]] = None) -> str:
+    """Returns the model's answer, or an error message; on_success is called with the answer only."""
     try:
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
         payload = {
-            "model": "grok-3-mini",
+            "model": settings.GROK_MODEL,
             "messages": [{"role": "user", "content": prompt}]
         }
-        logger.debug(f"Sending Grok API request in handle_complaint: {json.dumps(payload, indent=2)}")
-        response = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        logger.debug(f"Grok API response in handle_complaint: {json.dumps(response_data, indent=2)}")
+        log_payload(logger, f"Sending Grok API request in {source}", payload)
+        response_data = chat_completion(payload, api_key)
+        log_payload(logger, f"Grok API response in {source}", response_data)
+        usage = response_data.get("usage") or {}
+        if "prompt_tokens" in usage:
+            llm_prompt_tokens.observe(source, usage["prompt_tokens"])
         message = response_data["choices"][0]["message"]["content"]
         if agent:
             agent.save_conversation_turn(customer_id, "assistant", message)
+        if on_success:
+            on_success(message)
         return f"{message}"
+    except LLMOverloadedError:
+        raise  # shed upstream: the route answers 503 + Retry-After instead of saving an error turn
     except requests.exceptions.HTTPError as e:
-        error_response = e.response.json() if e.response else {}
-        logger.error(f"HTTP error in handle_complaint: {e.response.status_code} - {json.dumps(error_response, indent=2)}")
+        error_response = e.response.json() if e.response is not None else {}
+        log_payload(logger, f"HTTP error in {source}: {e.response.status_code}", error_response, logging.ERROR)
         if agent:
             agent.save_conversation_turn(customer_id, "assistant", f"Error: HTTP {e.response.status_code}")
-        return f"Error generating message: HTTP {e.response.status_code} - {json.dumps(error_response, indent=2)}"
+        return f"Error generating message: HTTP {e.response.status_code} - {json.dumps(error_response)}"
     except Exception as e:
-        logger.error(f"Error in handle_complaint: {str(e)}")
+        logger.error(f"Error in {source}: {str(e)}")
         if agent:
             agent.save_conversation_turn(customer_id, "assistant", f"Error: {str(e)}")
         return f"Error generating message: {str(e)}"
 
-def handle_general_question(customer_id: str, style: str, question: str, api_key: str, agent: 'SimpleAgent' = None) -> str:
-    logger.debug(f"Handling general question for customer_id: {customer_id}, style: {style}, question: {question}")
-    
-    customer = get_customer(customer_id)
-    if not customer:
-        return f"Customer {customer_id} not found in Couchbase bucket '{CUSTOMERS_BUCKET_NAME}'."
-
-    # Check if question references a specific product style
-    product_style = style
-    if not product_style:
-        # Try to extract style from question (e.g., "AN201" in "tell me about product AN201")
-        style_match = re.search(r'\b[A-Z0-9]{4,5}\b', question)
-        product_style = style_match.group(0) if style_match else None
-
-    product_details = ""
-    category = customer.get("preferred_category", "General")
-    if product_style:
-        product = get_product(product_style)
-        if product:
-            category = product.get("category", category)
-            # Updated product details to use new fields
-            product_details = (
-                f"{product['description']} (Style: {product_style}, Price: ${product['price']}, "
-                f"Color: {product['color']}, Type: {product.get('accessory_type', 'N/A')}, "
-                f"Features: {', '.join(product.get('features', [])) or 'None'}, Usage: {product.get('usage_type', 'N/A')}). "
-            )
-        else:
-            product_details = f"Product style {product_style} not found. "
-
-    similar_products = get_similar_products(category, product_style)
-    # Updated similar products text to use new fields
-    similar_products_text = "\n".join([
-        f"- {p['description']} (Style: {p['style']}, Price: ${p['price']}, Color: {p['color']}, "
-        f"Type: {p.get('accessory_type', 'N/A')}, Features: {', '.join(p.get('features', [])) or 'None'}, "
-        f"Usage: {p.get('usage_type', 'N/A')})"
-        for p in similar_products
-    ]) if similar_products else "No similar products found."
-
-    discount_offer = ""
-    if customer.get("loyalty_level") in ["Gold", "Platinum"]:
-        discount_offer = "15% off your next purchase or free shipping."
-    elif customer.get("loyalty_level") == "Silver":
-        discount_offer = "10% off your next purchase."
-    else:
-        discount_offer = "5% off your next purchase."
-
-    # Updated prompt to use new product fields
-    prompt = (
-        f"Customer {customer['name']} ({customer['loyalty_level']}) asked: {question}. "
-        f"Preferred category: {category}. Purchase history: {json.dumps(customer['purchase_history'])}. "
-        f"{product_details}Recommended products: {similar_products_text}. "
-        f"Respond briefly: answer the question clearly (include product details if requested), offer {discount_offer}, suggest recommended products, and invite further questions."
-    )
+def _stream_prompt(prompt: str, api_key: str, customer_id: str, agent: 'SimpleAgent', source: str,
+                   on_success: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+    """Yield completion text as it arrives; the full text is saved to history once the stream ends.
 
+    on_success is called with the full text only when the stream completed; error text never reaches it.
+    """
+    chunks = []
     try:
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
         payload = {
-            "model": "grok-3-mini",
+            "model": settings.GROK_MODEL,
             "messages": [{"role": "user", "content": prompt}]
         }
-        logger.debug(f"Sending Grok API request in handle_general_question: {json.dumps(payload, indent=2)}")
-        response = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        logger.debug(f"Grok API response in handle_general_question: {json.dumps(response_data, indent=2)}")
-        message = response_data["choices"][0]["message"]["content"]
+        log_payload(logger, f"Sending streaming Grok API request in {source}", payload)
+        for delta in stream_chat_completion(payload, api_key):
+            chunks.append(delta)
+            yield delta
         if agent:
-            agent.save_conversation_turn(customer_id, "assistant", message)
-        return f"{message}"
+            agent.save_conversation_turn(customer_id, "assistant", "".join(chunks))
+        if on_success:
+            on_success("".join(chunks))
+    except LLMOverloadedError:
+        raise
     except requests.exceptions.HTTPError as e:
-        error_response = e.response.json() if e.response else {}
-        logger.error(f"HTTP error in handle_general_question: {e.response.status_code} - {json.dumps(error_response, indent=2)}")
+        logger.error(f"HTTP error in {source}: {e.response.status_code}")
         if agent:
             agent.save_conversation_turn(customer_id, "assistant", f"Error: HTTP {e.response.status_code}")
-        return f"Error generating message: HTTP {e.response.status_code} - {json.dumps(error_response, indent=2)}"
+        yield f"Error generating message: HTTP {e.response.status_code}"
     except Exception as e:
-        logger.error(f"Error in handle_general_question: {str(e)}")
+        logger.error(f"Error in {source}: {str(e)}")
         if agent:
             agent.save_conversation_turn(customer_id, "assistant", f"Error: {str(e)}")
-        return f"Error generating message: {str(e)}"
+        yield f"Error generating message: {str(e)}"
 
-def mock_purchase(customer_id: str, style: str, api_key: str, agent: 'SimpleAgent' = None) -> str:
-    logger.debug(f"Mocking purchase for customer_id: {customer_id}, style: {style}")
-    
-    customer = get_customer(customer_id)
+def _respond(prepared: Tuple[Optional[str], Optional[str]], api_key: str, customer_id: str,
+             agent: 'SimpleAgent', source: str, stream: bool, data_only: bool = False):
+    prompt, error = prepared
+    if data_only:
+        # The agent answers several tools in one completion; hand it the context instead
+        return error or prompt
+    if error:
+        return iter([error]) if stream else error
+    if stream:
+        return _stream_prompt(prompt, api_key, customer_id, agent, source)
+    return _complete_prompt(prompt, api_key, customer_id, agent, source)
+
+def _prepare_complaint(customer_id: str, style: str, complaint: str) -> Tuple[Optional[str], Optional[str]]:
+    """Gather complaint context and build the prompt; returns (prompt, None) or (None, error message)."""
+    logger.debug(f"Handling complaint for customer_id: {customer_id}, style: {style}, complaint: {complaint}")
+    fanout = Fanout("handle_complaint")
+    customer_future = fanout.submit("customer", get_customer, customer_id)
+    product_future = fanout.submit("product", get_product, style)
+    sales_stats_future = fanout.submit("sales_stats", get_sales_stats, style)
+
+    customer = customer_future.result()
+    # Similar products only need the category; start as soon as the customer names one
+    similar_future = None
+    if customer and customer.get("preferred_category"):
+        similar_future = fanout.submit("similar_products", get_similar_products, customer["preferred_category"], style)
+
+    product = product_future.result()
+    error = complaint_error(customer_id, style, customer, product)
+    if error:
+        return None, error
+
+    sales_stats = sales_stats_future.result()
+    if similar_future is None:
+        similar_future = fanout.submit("similar_products", get_similar_products, product["category"], style)
+    similar_products = similar_future.result()
+    fanout.log(logger, customer_id)
+    return complaint_prompt(customer, product, style, complaint, similar_products, sales_stats), None
+
+def complaint_error(customer_id: str, style: str, customer: Optional[Dict], product: Optional[Dict]) -> Optional[str]:
+    """Why a complaint can't be handled for these documents, or None."""
     if not customer:
         return f"Customer {customer_id} not found in Couchbase bucket '{CUSTOMERS_BUCKET_NAME}'."
-
-    product = get_product(style)
     if not product:
         return f"Product style {style} not found in Couchbase bucket '{PRODUCTS_BUCKET_NAME}'."
+    if not any(p["style"] == style for p in customer.get("purchase_history", [])):
+        return f"No purchase of {style} found for customer {customer_id}."
+    return None
+
+def handle_complaint(customer_id: str, style: str, complaint: str, api_key: str, agent: 'SimpleAgent' = None,
+                     stream: bool = False, data_only: bool = False):
+    """Returns the response text, or an iterator of text chunks when stream is True.
+
+    With data_only the prompt context (or error) is returned without calling the model.
+    """
+    return _respond(_prepare_complaint(customer_id, style, complaint), api_key, customer_id, agent, "handle_complaint",
+                    stream, data_only)
+
+def _resolve_question_style(style: str, question: str) -> Optional[str]:
+    if style:
+        return style
+    # Try to extract style from question (e.g., "AN201" in "tell me about product AN201")
+    style_match = re.search(r'\b[A-Z0-9]{4,5}\b', question)
+    return style_match.group(0) if style_match else None
+
+def _question_category(customer: Dict, product: Optional[Dict]) -> str:
+    category = customer.get("preferred_category", "General")
+    return product.get("category", category) if product else category
+
+def _build_question_prompt(customer: Dict, question: str, category: str, product_style: Optional[str],
+                           product: Optional[Dict], similar_products: list, shared: bool) -> str:
+    if shared:
+        return shared_question_prompt(customer.get("loyalty_level"), question, category, product_style, product,
+                                      similar_products)
+    return question_prompt(customer, question, category, product_style, product, similar_products)
+
+def _prepare_general_question(customer_id: str, style: str, question: str,
+                               shared: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    """Gather question context and build the prompt; returns (prompt, None) or (None, error message).
+
+    With shared the prompt leaves out the customer's name and purchases, so the answer can be cached for the tier.
+    """
+    logger.debug(f"Handling general question for customer_id: {customer_id}, style: {style}, question: {question}")
+    # Check if question references a specific product style
+    product_style = _resolve_question_style(style, question)
+
+    fanout = Fanout("handle_general_question")
+    customer_future = fanout.submit("customer", get_customer, customer_id)
+    product_future = fanout.submit("product", get_product, product_style) if product_style else None
+
+    customer = customer_future.result()
+    if not customer:
+        return None, f"Customer {customer_id} not found in Couchbase bucket '{CUSTOMERS_BUCKET_NAME}'."
+
+    product = product_future.result() if product_style else None
+    category = _question_category(customer, product)
+
+    if product_style:
+        similar_products = fanout.submit("similar_products", get_similar_products, category, product_style).result()
+    else:
+        similar_products = fanout.submit("similar_products", find_products_for_question, question, category).result()
+    fanout.log(logger, customer_id)
+    return _build_question_prompt(customer, question, category, product_style, product, similar_products, shared), None
+
+def handle_general_question(customer_id: str, style: str, question: str, api_key: str, agent: 'SimpleAgent' = None,
+                            stream: bool = False, data_only: bool = False):
+    """Returns the response text, or an iterator of text chunks when stream is True.
+
+    With data_only the prompt context (or error) is returned without calling the model.
+    """
+    customer = get_customer(customer_id) if settings.RESPONSE_CACHE_ENABLED and not data_only else None
+    if not customer:
+        return _respond(_prepare_general_question(customer_id, style, question), api_key, customer_id, agent,
+                        "handle_general_question", stream, data_only)
+
+    # Everything the shared prompt depends on is in the key; nothing identifying the customer is
+    product_style = _resolve_question_style(style, question)
+    product = get_product(product_style) if product_style else None
+    cache_args = (question, product_style, _question_category(customer, product), customer.get("loyalty_level"),
+                  product_fingerprint(product))
+    cached = response_cache.get(*cache_args)
+    if cached is not None:
+        logger.debug(f"Response cache hit for question from {customer_id} about {product_style}")
+        if agent:
+            agent.save_conversation_turn(customer_id, "assistant", cached)
+        return iter([cached]) if stream else cached
+
+    prompt, error = _prepare_general_question(customer_id, style, question, shared=True)
+    if error:
+        return iter([error]) if stream else error
+
+    def cache(response: str):
+        # Only answers the model actually produced are shared; error text never is
+        if response:
+            response_cache.set(*cache_args, response)
 
+    if stream:
+        return _stream_prompt(prompt, api_key, customer_id, agent, "handle_general_question", on_success=cache)
+    return _complete_prompt(prompt, api_key, customer_id, agent, "handle_general_question", on_success=cache)
+
+def _new_purchase(customer: Dict, product: Dict, style: str) -> Tuple[Dict, list]:
+    """(customer with the purchase added, sub-doc specs that record it) for a mock purchase of style."""
     # Create mock purchase details matching the customer purchase history structure
     purchase = {
         "style": style,
@@ -285,76 +377,276 @@ def mock_purchase(customer_id: str, style: str, api_key: str, agent: 'SimpleAgen
         "amount": round(product["price"], 2),
         "status": "Ordered"
     }
+    customer = dict(customer)  # don't mutate the cached document
+    customer["purchase_history"] = customer.get("purchase_history", []) + [purchase]
+    customer["total_spent"] = round(customer.get("total_spent", 0) + purchase["amount"], 2)
+    customer["num_purchases"] = customer.get("num_purchases", 0) + 1
+    customer["last_purchase_date"] = purchase["purchase_date"]
+    # Sub-doc writes so a stale cached copy can't overwrite conversation turns appended since it was read
+    return customer, [
+        SD.array_append("purchase_history", purchase, create_parents=True),
+        SD.upsert("total_spent", customer["total_spent"]),
+        SD.increment("num_purchases", 1, create_parents=True),
+        SD.upsert("last_purchase_date", purchase["purchase_date"]),
+    ]
+
+def _prepare_purchase(customer_id: str, style: str) -> Tuple[Optional[str], Optional[str]]:
+    """Record the mock purchase and build the confirmation prompt; returns (prompt, None) or (None, error message)."""
+    logger.debug(f"Mocking purchase for customer_id: {customer_id}, style: {style}")
+    fanout = Fanout("mock_purchase")
+    customer_future = fanout.submit("customer", get_customer, customer_id)
+    product_future = fanout.submit("product", get_product, style)
+
+    customer = customer_future.result()
+    if not customer:
+        return None, f"Customer {customer_id} not found in Couchbase bucket '{CUSTOMERS_BUCKET_NAME}'."
+
+    product = product_future.result()
+    if not product:
+        return None, f"Product style {style} not found in Couchbase bucket '{PRODUCTS_BUCKET_NAME}'."
+    # Recommendations don't depend on the purchase write; run them alongside it
+    similar_future = fanout.submit("similar_products", get_similar_products, product["category"], style)
 
     # Update customer's purchase history and related fields
     try:
-        customer["purchase_history"] = customer.get("purchase_history", []) + [purchase]
-        customer["total_spent"] = round(customer.get("total_spent", 0) + purchase["amount"], 2)
-        customer["num_purchases"] = customer.get("num_purchases", 0) + 1
-        customer["last_purchase_date"] = purchase["purchase_date"]
-        customers_collection.upsert(customer_id, customer)
+        customer, specs = _new_purchase(customer, product, style)
+        customers_collection.mutate_in(customer_id, specs)
+        customer_cache.invalidate(customer_id)
         logger.debug(f"Updated purchase history for customer {customer_id}")
     except Exception as e:
         logger.error(f"Error updating purchase history for {customer_id}: {str(e)}")
-        return f"Error updating purchase history: {str(e)}"
-
-    similar_products = get_similar_products(product["category"], style)
-    # Updated similar products text to use new fields
-    similar_products_text = "\n".join([
-        f"- {p['description']} (Style: {p['style']}, Price: ${p['price']}, Color: {p['color']}, "
-        f"Type: {p.get('accessory_type', 'N/A')}, Features: {', '.join(p.get('features', [])) or 'None'}, "
-        f"Usage: {p.get('usage_type', 'N/A')})"
-        for p in similar_products
-    ]) if similar_products else "No similar products found."
-
-    discount_offer = ""
-    if customer.get("loyalty_level") in ["Gold", "Platinum"]:
-        discount_offer = "15% off your next purchase or free shipping."
-    elif customer.get("loyalty_level") == "Silver":
-        discount_offer = "10% off your next purchase."
-    else:
-        discount_offer = "5% off your next purchase."
-
-    # Updated prompt to use new product fields
-    prompt = (
-        f"Customer {customer['name']} ({customer['loyalty_level']}) successfully purchased {style}: {product['description']} "
-        f"(${product['price']}, {product['color']}, Type: {product.get('accessory_type', 'N/A')}, "
-        f"Features: {', '.join(product.get('features', [])) or 'None'}, Usage: {product.get('usage_type', 'N/A')}). "
-        f"Preferred category: {customer.get('preferred_category', product['category'])}. "
-        f"Recommended products: {similar_products_text}. "
-        f"Respond briefly: confirm the purchase, highlight product benefits, offer {discount_offer}, suggest recommended products, and invite further questions."
-    )
+        return None, f"Error updating purchase history: {str(e)}"
+
+    similar_products = similar_future.result()
+    fanout.log(logger, customer_id)
+    return purchase_prompt(customer, product, style, similar_products), None
+
+def mock_purchase(customer_id: str, style: str, api_key: str, agent: 'SimpleAgent' = None,
+                  stream: bool = False, data_only: bool = False):
+    """Returns the response text, or an iterator of text chunks when stream is True.
 
+    With data_only the prompt context (or error) is returned without calling the model.
+    """
+    return _respond(_prepare_purchase(customer_id, style), api_key, customer_id, agent, "mock_purchase", stream, data_only)
+
+# asyncio versions of the handlers for the Quart app (asgi.py). They share the caches, the recommendation index
+# and the prompt builders with the handlers above, but read and write Couchbase through the acouchbase
+# collections and complete through the pooled httpx client, so a tool call never waits for a pool thread.
+
+async def _aget_document(cache: TTLCache, bucket: str, key: str, kind: str) -> Optional[Dict]:
+    document = cache.get(key)
+    if document is not None:
+        return document
+    try:
+        collection = await couchbase_manager.async_collection(bucket)
+        document = (await collection.get(key)).content_as[dict]
+        log_payload(logger, f"Fetched {kind} {key}", document)
+    except Exception as e:
+        logger.error(f"Error fetching {kind} {key}: {str(e)}")
+        return None
+    cache.set(key, document)
+    return document
+
+@traced("get_customer")
+async def aget_customer(customer_id: str) -> Optional[Dict]:
+    return await _aget_document(customer_cache, CUSTOMERS_BUCKET_NAME, customer_id, "customer")
+
+@traced("get_product")
+async def aget_product(style: str) -> Optional[Dict]:
+    return await _aget_document(product_cache, PRODUCTS_BUCKET_NAME, style, "product")
+
+@traced("get_sales_stats")
+async def aget_sales_stats(style: str) -> Dict:
+    try:
+        return await sales_stats_store.aget(style, await couchbase_manager.async_collection(SALES_STATS_BUCKET_NAME))
+    except Exception as e:
+        logger.error(f"Error fetching sales stats for {style}: {str(e)}")
+        return {"total_count": 0, "status_counts": {}}
+
+async def _aproduct_summary(style: str) -> Optional[Dict]:
+    summary = recommendation_index.get(style)
+    if summary is not None:
+        return summary
+    product = await aget_product(style)
+    if not product or not in_stock(product):
+        return None
+    return {field: product.get(field) for field in PRODUCT_FIELDS}
+
+async def _asemantic_products(styles: List[str], limit: int) -> list:
+    summaries = await asyncio.gather(*(_aproduct_summary(style) for style in styles))
+    return [p for p in summaries if p][:limit]
+
+@traced("find_products_for_question")
+async def afind_products_for_question(question: str, category: str, limit: int = 3) -> list:
+    engine = get_engine()
+    if engine is not None:
+        try:
+            products = await _asemantic_products(engine.search_text(question, limit * 3, category), limit)
+            if products:
+                return products
+        except Exception as e:
+            logger.error(f"Error searching products for question: {str(e)}")
+    return await aget_similar_products(category, None, limit)
+
+@traced("get_similar_products")
+async def aget_similar_products(category: str, exclude_style: str = None, limit: int = 3) -> list:
+    engine = get_engine()
+    if engine is not None and exclude_style in engine:
+        try:
+            products = await _asemantic_products(engine.similar_to_style(exclude_style, limit * 3, category), limit)
+            if products:
+                return products
+        except Exception as e:
+            logger.error(f"Error fetching semantically similar products for {exclude_style}: {str(e)}")
+    if settings.RECOMMENDATION_INDEX_ENABLED:
+        products = recommendation_index.top_k(category, exclude_style, limit)
+        if products is not None:
+            return products
+    try:
+        query, params = _similar_products_query(category, exclude_style, limit)
+        async_cluster = await couchbase_manager.async_cluster()
+        with span("couchbase.query") as current:
+            result = async_cluster.query(query, QueryOptions(positional_parameters=params))
+            products = [row async for row in result.rows()]
+            if current is not None:
+                current.size = payload_size(products)
+        logger.debug(f"Fetched {len(products)} similar products for category {category}")
+        return products
+    except Exception as e:
+        logger.error(f"Error fetching similar products for category {category}: {str(e)}")
+        return []
+
+async def _acomplete_prompt(prompt: str, api_key: str, customer_id: str, agent, source: str,
+                            on_success: Optional[Callable[[str], None]] = None) -> str:
+    """asyncio version of _complete_prompt; agent is an AsyncSimpleAgent."""
     try:
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
         payload = {
-            "model": "grok-3-mini",  # Changed to grok-3-mini to match other methods
+            "model": settings.GROK_MODEL,
             "messages": [{"role": "user", "content": prompt}]
         }
-        logger.debug(f"Sending Grok API request in mock_purchase: {json.dumps(payload, indent=2)}")
-        response = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        logger.debug(f"Grok API response in mock_purchase: {json.dumps(response_data, indent=2)}")
+        log_payload(logger, f"Sending Grok API request in {source}", payload)
+        response_data = await get_async_client().chat_completion(payload, api_key)
+        log_payload(logger, f"Grok API response in {source}", response_data)
+        usage = response_data.get("usage") or {}
+        if "prompt_tokens" in usage:
+            llm_prompt_tokens.observe(source, usage["prompt_tokens"])
         message = response_data["choices"][0]["message"]["content"]
         if agent:
-            agent.save_conversation_turn(customer_id, "assistant", message)
+            await agent.save_conversation_turn(customer_id, "assistant", message)
+        if on_success:
+            on_success(message)
         return f"{message}"
-    except requests.exceptions.HTTPError as e:
-        error_response = e.response.json() if e.response else {}
-        logger.error(f"HTTP error in mock_purchase: {e.response.status_code} - {json.dumps(error_response, indent=2)}")
-        if agent:
-            agent.save_conversation_turn(customer_id, "assistant", f"Error: HTTP {e.response.status_code}")
-        return f"Error generating message: HTTP {e.response.status_code} - {json.dumps(error_response, indent=2)}"
+    except LLMOverloadedError:
+        raise
     except Exception as e:
-        logger.error(f"Error in mock_purchase: {str(e)}")
+        status = getattr(getattr(e, "response", None), "status_code", None)  # httpx.HTTPStatusError
+        if status is not None:
+            logger.error(f"HTTP error in {source}: {status}")
+            error = f"HTTP {status}"
+        else:
+            logger.error(f"Error in {source}: {str(e)}")
+            error = str(e)
         if agent:
-            agent.save_conversation_turn(customer_id, "assistant", f"Error: {str(e)}")
-        return f"Error generating message: {str(e)}"
\ No newline at end of file
+            await agent.save_conversation_turn(customer_id, "assistant", f"Error: {error}")
+        return f"Error generating message: {error}"
+
+async def _arespond(prepared: Tuple[Optional[str], Optional[str]], api_key: str, customer_id: str, agent,
+                    source: str, data_only: bool = False) -> str:
+    prompt, error = prepared
+    if data_only:
+        return error or prompt
+    if error:
+        return error
+    return await _acomplete_prompt(prompt, api_key, customer_id, agent, source)
+
+async def _aprepare_complaint(customer_id: str, style: str, complaint: str) -> Tuple[Optional[str], Optional[str]]:
+    logger.debug(f"Handling complaint for customer_id: {customer_id}, style: {style}, complaint: {complaint}")
+    customer, product, sales_stats = await asyncio.gather(
+        aget_customer(customer_id), aget_product(style), aget_sales_stats(style))
+    error = complaint_error(customer_id, style, customer, product)
+    if error:
+        return None, error
+    similar_products = await aget_similar_products(customer.get("preferred_category", product["category"]), style)
+    return complaint_prompt(customer, product, style, complaint, similar_products, sales_stats), None
+
+async def ahandle_complaint(customer_id: str, style: str, complaint: str, api_key: str, agent=None,
+                            data_only: bool = False) -> str:
+    """asyncio version of handle_complaint (not streamed)."""
+    return await _arespond(await _aprepare_complaint(customer_id, style, complaint), api_key, customer_id, agent,
+                           "handle_complaint", data_only)
+
+async def _aprepare_general_question(customer_id: str, product_style: Optional[str], question: str,
+                                     shared: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    logger.debug(f"Handling general question for customer_id: {customer_id}, style: {product_style}, question: {question}")
+    if product_style:
+        customer, product = await asyncio.gather(aget_customer(customer_id), aget_product(product_style))
+    else:
+        customer, product = await aget_customer(customer_id), None
+    if not customer:
+        return None, f"Customer {customer_id} not found in Couchbase bucket '{CUSTOMERS_BUCKET_NAME}'."
+    category = _question_category(customer, product)
+    if product_style:
+        similar_products = await aget_similar_products(category, product_style)
+    else:
+        similar_products = await afind_products_for_question(question, category)
+    return _build_question_prompt(customer, question, category, product_style, product, similar_products, shared), None
+
+async def ahandle_general_question(customer_id: str, style: str, question: str, api_key: str, agent=None,
+                                   data_only: bool = False) -> str:
+    """asyncio version of handle_general_question (not streamed), with the same response cache."""
+    product_style = _resolve_question_style(style, question)
+    customer = await aget_customer(customer_id) if settings.RESPONSE_CACHE_ENABLED and not data_only else None
+    if not customer:
+        return await _arespond(await _aprepare_general_question(customer_id, product_style, question), api_key,
+                               customer_id, agent, "handle_general_question", data_only)
+
+    product = await aget_product(product_style) if product_style else None
+    cache_args = (question, product_style, _question_category(customer, product), customer.get("loyalty_level"),
+                  product_fingerprint(product))
+    cached = response_cache.get(*cache_args)
+    if cached is not None:
+        logger.debug(f"Response cache hit for question from {customer_id} about {product_style}")
+        if agent:
+            await agent.save_conversation_turn(customer_id, "assistant", cached)
+        return cached
+
+    prompt, error = await _aprepare_general_question(customer_id, product_style, question, shared=True)
+    if error:
+        return error
+
+    def cache(response: str):
+        if response:
+            response_cache.set(*cache_args, response)
+
+    return await _acomplete_prompt(prompt, api_key, customer_id, agent, "handle_general_question", on_success=cache)
+
+async def _aprepare_purchase(customer_id: str, style: str) -> Tuple[Optional[str], Optional[str]]:
+    logger.debug(f"Mocking purchase for customer_id: {customer_id}, style: {style}")
+    customer, product = await asyncio.gather(aget_customer(customer_id), aget_product(style))
+    if not customer:
+        return None, f"Customer {customer_id} not found in Couchbase bucket '{CUSTOMERS_BUCKET_NAME}'."
+    if not product:
+        return None, f"Product style {style} not found in Couchbase bucket '{PRODUCTS_BUCKET_NAME}'."
+
+    customer, specs = _new_purchase(customer, product, style)
+
+    async def record() -> Optional[str]:
+        try:
+            collection = await couchbase_manager.async_collection(CUSTOMERS_BUCKET_NAME)
+            await collection.mutate_in(customer_id, specs)
+            customer_cache.invalidate(customer_id)
+            return None
+        except Exception as e:
+            logger.error(f"Error updating purchase history for {customer_id}: {str(e)}")
+            return f"Error updating purchase history: {str(e)}"
+
+    # Recommendations don't depend on the purchase write; run them alongside it
+    error, similar_products = await asyncio.gather(record(), aget_similar_products(product["category"], style))
+    if error:
+        return None, error
+    return purchase_prompt(customer, product, style, similar_products), None
+
+async def amock_purchase(customer_id: str, style: str, api_key: str, agent=None, data_only: bool = False) -> str:
+    """asyncio version of mock_purchase (not streamed)."""
+    return await _arespond(await _aprepare_purchase(customer_id, style), api_key, customer_id, agent, "mock_purchase",
+                           data_only)
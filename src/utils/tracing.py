@@ -0,0 +1,202 @@
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+from utils.cache import cache_stats
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds / bytes; +Inf is implicit
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Spans of the traced request running in this context, or None when tracing is off
+_spans: contextvars.ContextVar = contextvars.ContextVar("trace_spans", default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram, one series per value of a single label (the span name by default)."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, label: str = "span"):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, value: float):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{key}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{key}"}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{self.label}="{key}"}} {cumulative}')
+        return lines
+
+
+span_duration = Histogram("span_duration_seconds", "Time spent in each traced span.", DURATION_BUCKETS)
+span_payload = Histogram("span_payload_bytes", "Payload size handled by each traced span.", SIZE_BUCKETS)
+
+# Always-on histograms other modules add to /metrics (recorded regardless of per-request tracing)
+_histograms: List[Histogram] = []
+
+
+def register_histogram(histogram: Histogram) -> Histogram:
+    _histograms.append(histogram)
+    return histogram
+
+
+# Other always-on metric families: callables returning exposition lines (see render_family)
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register_collector(collect: Callable[[], List[str]]) -> Callable[[], List[str]]:
+    _collectors.append(collect)
+    return collect
+
+
+def render_family(prefix: str, label: str, fields: tuple, sources: Dict[str, Dict]) -> List[str]:
+    """Gauges '<prefix>_<field>' and counters '<prefix>_<field>_total', one series per source name."""
+    lines = []
+    for field, kind in fields:
+        samples = [(name, stats[field]) for name, stats in sources.items() if field in stats]
+        if not samples:
+            continue
+        metric = f"{prefix}_{field}" if kind == "gauge" else f"{prefix}_{field}_total"
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f'{metric}{{{label}="{name}"}} {value}' for name, value in samples)
+    return lines
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "size")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration = None
+        self.size = None
+
+
+def enabled() -> bool:
+    return _spans.get() is not None
+
+
+def start_trace() -> contextvars.Token:
+    """Turn tracing on for the current request; pass the token to end_trace."""
+    return _spans.set([])
+
+
+def end_trace(token: contextvars.Token) -> List[Span]:
+    spans = _spans.get() or []
+    _spans.reset(token)
+    return spans
+
+
+def wants_trace(header_value: Optional[str]) -> bool:
+    return settings.TRACING_ALWAYS or (header_value or "").lower() in ("1", "true", "on")
+
+
+@contextmanager
+def span(name: str):
+    """Time a block when the current request is traced; yields None (and does nothing) otherwise."""
+    spans = _spans.get()
+    if spans is None:
+        yield None
+        return
+    current = Span(name)
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - current.start
+        spans.append(current)
+        span_duration.observe(name, current.duration)
+        if current.size is not None:
+            span_payload.observe(name, current.size)
+
+
+def payload_size(value) -> Optional[int]:
+    """Approximate wire size of a result; only called while tracing."""
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+def traced(name: str, size: Callable = payload_size):
+    """Wrap a function (sync or async) in a span named 'name' that also records the result's size."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _spans.get() is None:
+                    return await func(*args, **kwargs)
+                with span(name) as current:
+                    result = await func(*args, **kwargs)
+                    current.size = size(result) if size else None
+                    return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _spans.get() is None:
+                return func(*args, **kwargs)
+            with span(name) as current:
+                result = func(*args, **kwargs)
+                current.size = size(result) if size else None
+                return result
+        return wrapper
+    return decorator
+
+
+def server_timing(spans: List[Span]) -> str:
+    """Server-Timing header value: total milliseconds per span name, in first-seen order."""
+    totals = {}
+    for current in spans:
+        totals[current.name] = totals.get(current.name, 0.0) + current.duration * 1000
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in totals.items())
+
+
+def log_trace(path: str, spans: List[Span]):
+    if spans:
+        logger.info(f"Trace for {path}: " + " ".join(
+            f"{s.name}={s.duration * 1000:.1f}ms" + (f"/{s.size}B" if s.size is not None else "") for s in spans
+        ))
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of span histograms, registered histograms and collectors, and cache counters."""
+    lines = span_duration.render() + span_payload.render()
+    for histogram in _histograms:
+        lines += histogram.render()
+    for collect in _collectors:
+        lines += collect()
+    lines += render_family("cache", "cache", (
+        ("size", "gauge"), ("hits", "counter"), ("misses", "counter"), ("exact_hits", "counter"),
+        ("semantic_hits", "counter"), ("evictions", "counter"), ("expirations", "counter")), cache_stats())
+    return "\n".join(lines) + "\n"
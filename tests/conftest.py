@@ -0,0 +1,196 @@
+import copy
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import pytest
+from couchbase.exceptions import CasMismatchException, DocumentNotFoundException, PathNotFoundException
+from couchbase.subdocument import StoreSemantics, SubDocOp
+
+# Modules import each other relative to src/, as when the service runs from there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+class FakeResult:
+    """Stands in for a GetResult: content_as[dict] and cas."""
+
+    def __init__(self, value, cas):
+        self.value = value
+        self.cas = cas
+
+    @property
+    def content_as(self):
+        return {t: self.value for t in (dict, int, list, str)}
+
+
+def _path(path: str) -> list:
+    """'a.`b c`[2]' -> ['a', 'b c', 2]"""
+    parts = []
+    for name, quoted, index in re.findall(r"([^.`\[\]]+)|`((?:[^`]|``)*)`|\[(-?\d+)\]", path):
+        if index:
+            parts.append(int(index))
+        else:
+            parts.append(quoted.replace("``", "`") if quoted else name)
+    return parts
+
+
+def _resolve(doc, parts: list):
+    for part in parts:
+        try:
+            doc = doc[part]
+        except (KeyError, IndexError, TypeError):
+            raise PathNotFoundException(f"path {parts} not found")
+    return doc
+
+
+def _parent(doc, parts: list, create: bool):
+    for part in parts[:-1]:
+        if isinstance(part, str) and part not in doc:
+            if not create:
+                raise PathNotFoundException(f"path {parts} not found")
+            doc[part] = {}
+        doc = _resolve(doc, [part])
+    return doc
+
+
+class FakeSubdocResult:
+    """Stands in for a LookupInResult/MutateInResult: content_as[type](index), exists(index) and cas."""
+
+    def __init__(self, values: list, cas: int):
+        self.values = values
+        self.cas = cas
+
+    @property
+    def content_as(self):
+        def value(index):
+            if isinstance(self.values[index], PathNotFoundException):
+                raise self.values[index]
+            return self.values[index]
+        return {t: value for t in (dict, int, list, str, bool)}
+
+    def exists(self, index: int) -> bool:
+        return not isinstance(self.values[index], PathNotFoundException)
+
+
+class FakeCollection:
+    """In-memory stand-in for a Couchbase collection: documents by key, each with a CAS bumped on every write.
+
+    Sub-document lookups and mutations understand the specs the services use
+    (get, count, exists, upsert, replace, array_append, increment); a
+    mutate_in applies all of its specs or none, and honours cas and
+    StoreSemantics.UPSERT.
+    """
+
+    def __init__(self, docs=None):
+        self.docs = {}
+        self.cas = {}
+        self._next_cas = 0
+        for key, value in (docs or {}).items():
+            self.upsert(key, value)
+
+    def _bump(self, key):
+        self._next_cas += 1
+        self.cas[key] = self._next_cas
+
+    def get(self, key):
+        if key not in self.docs:
+            raise DocumentNotFoundException(f"{key} not found")
+        return FakeResult(self.docs[key], self.cas[key])
+
+    def get_multi(self, keys):
+        results, exceptions = {}, {}
+        for key in keys:
+            if key in self.docs:
+                results[key] = FakeResult(self.docs[key], self.cas[key])
+            else:
+                exceptions[key] = DocumentNotFoundException(f"{key} not found")
+        return SimpleNamespace(results=results, exceptions=exceptions, all_ok=not exceptions)
+
+    def upsert(self, key, value, *options):
+        self.docs[key] = value
+        self._bump(key)
+
+    def upsert_multi(self, docs):
+        for key, value in docs.items():
+            self.upsert(key, value)
+        return SimpleNamespace(results={}, exceptions={}, all_ok=True)
+
+    def lookup_in(self, key, specs, *options):
+        if key not in self.docs:
+            raise DocumentNotFoundException(f"{key} not found")
+        values = []
+        for op, path, *_ in specs:
+            try:
+                value = _resolve(self.docs[key], _path(path))
+            except PathNotFoundException as e:
+                if op == SubDocOp.EXISTS:
+                    values.append(False)
+                    continue
+                values.append(e)
+                continue
+            values.append(len(value) if op == SubDocOp.GET_COUNT else True if op == SubDocOp.EXISTS
+                          else copy.deepcopy(value))
+        return FakeSubdocResult(values, self.cas[key])
+
+    def mutate_in(self, key, specs, options=None):
+        options = dict(options or {})
+        if key not in self.docs and options.get("store_semantics") != StoreSemantics.UPSERT:
+            raise DocumentNotFoundException(f"{key} not found")
+        if options.get("cas") and options["cas"] != self.cas.get(key):
+            raise CasMismatchException(f"{key} changed")
+        doc = copy.deepcopy(self.docs.get(key, {}))
+        values = []
+        for op, path, create_parents, *_, value in specs:
+            parts = _path(path)
+            parent = _parent(doc, parts, create_parents)
+            name = parts[-1]
+            if op == SubDocOp.REPLACE:
+                _resolve(parent, [name])
+                parent[name] = value
+            elif op == SubDocOp.DICT_UPSERT:
+                parent[name] = value
+            elif op == SubDocOp.ARRAY_PUSH_LAST:
+                if name not in parent and create_parents:
+                    parent[name] = []
+                _resolve(parent, [name]).extend(value)
+            elif op == SubDocOp.COUNTER:
+                parent[name] = parent.get(name, 0) + value
+                values.append(parent[name])
+                continue
+            else:
+                raise NotImplementedError(f"FakeCollection.mutate_in does not support {op}")
+            values.append(None)
+        self.upsert(key, doc)
+        return FakeSubdocResult(values, self.cas[key])
+
+
+@pytest.fixture
+def fake_collection():
+    """Factory for FakeCollection, seeded with a dict of documents."""
+    return FakeCollection
+
+
+class AsyncFakeCollection:
+    """acouchbase-style wrapper around a FakeCollection: the same documents, with coroutine methods."""
+
+    def __init__(self, collection: FakeCollection):
+        self.collection = collection
+
+    async def get(self, key, *options):
+        return self.collection.get(key)
+
+    async def upsert(self, key, value, *options):
+        return self.collection.upsert(key, value, *options)
+
+    async def lookup_in(self, key, specs, *options):
+        return self.collection.lookup_in(key, specs, *options)
+
+    async def mutate_in(self, key, specs, options=None):
+        return self.collection.mutate_in(key, specs, options)
+
+
+@pytest.fixture
+def async_fake_collection():
+    """Factory for AsyncFakeCollection, wrapping a FakeCollection."""
+    return AsyncFakeCollection
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from agents import tool_executor
+from agents.tool_executor import ToolExecutor
+from config import settings
+from utils import tool_utils
+from utils.response_cache import ResponseCache
+from utils.sales_stats import style_key
+
+CUSTOMER = {"customer_id": "CUST0001", "name": "Ann", "loyalty_level": "Gold", "preferred_category": "Audio",
+            "purchase_history": [{"style": "AN201"}], "total_spent": 79.99, "num_purchases": 1}
+PRODUCTS = {
+    "AN201": {"style": "AN201", "category": "Audio", "description": "Wireless headphones", "price": 79.99},
+    "AN202": {"style": "AN202", "category": "Audio", "description": "Earbuds", "price": 49.5, "stock_quantity": 3},
+}
+
+
+class FakeAsyncCluster:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, statement, *options):
+        self.queries.append(statement)
+        rows = self.rows
+
+        class Result:
+            async def _rows(self):
+                for row in rows:
+                    yield row
+
+            def rows(self):
+                return self._rows()
+        return Result()
+
+
+class FakeAsyncLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def chat_completion(self, payload, api_key):
+        self.prompts.append(payload["messages"][0]["content"])
+        return {"choices": [{"message": {"content": f"answer {len(self.prompts)}"}}]}
+
+
+@pytest.fixture
+def couchbase(monkeypatch, fake_collection, async_fake_collection):
+    buckets = {
+        settings.CUSTOMERS_BUCKET: fake_collection({CUSTOMER["customer_id"]: CUSTOMER}),
+        settings.PRODUCTS_BUCKET: fake_collection(PRODUCTS),
+        settings.SALES_STATS_BUCKET: fake_collection({style_key("AN201"): {"total_count": 340, "status_counts": {}}}),
+    }
+    cluster = FakeAsyncCluster([{"style": "AN202", "description": "Earbuds", "price": 49.5}])
+
+    async def async_collection(bucket):
+        return async_fake_collection(buckets[bucket])
+
+    async def async_cluster():
+        return cluster
+
+    def no_sync_couchbase(*args, **kwargs):
+        raise AssertionError("the async handlers must not use the synchronous SDK")
+
+    monkeypatch.setattr(tool_utils.couchbase_manager, "async_collection", async_collection)
+    monkeypatch.setattr(tool_utils.couchbase_manager, "async_cluster", async_cluster)
+    monkeypatch.setattr(tool_utils.couchbase_manager, "collection", no_sync_couchbase)
+    monkeypatch.setattr(tool_utils.couchbase_manager, "cluster", no_sync_couchbase)
+    monkeypatch.setattr(settings, "RECOMMENDATION_INDEX_ENABLED", False)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+    for cache in (tool_utils.customer_cache, tool_utils.product_cache, tool_utils.sales_stats_store.cache):
+        cache.clear()
+    yield SimpleNamespace(customers=buckets[settings.CUSTOMERS_BUCKET], cluster=cluster)
+    for cache in (tool_utils.customer_cache, tool_utils.product_cache, tool_utils.sales_stats_store.cache):
+        cache.clear()
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    client = FakeAsyncLLM()
+    monkeypatch.setattr(tool_utils, "get_async_client", lambda: client)
+    return client
+
+
+def test_complaint_reads_through_acouchbase(couchbase, llm):
+    answer = asyncio.run(tool_utils.ahandle_complaint("CUST0001", "AN201", "too quiet", "key"))
+    assert answer == "answer 1"
+    prompt = llm.prompts[0]
+    assert "Customer Ann (Gold) complained about AN201" in prompt
+    assert "Ordered 340 times." in prompt
+    assert "AN202" in prompt
+    assert len(couchbase.cluster.queries) == 1
+    # The documents land in the caches the synchronous handlers read too
+    assert tool_utils.customer_cache.get("CUST0001")["name"] == "Ann"
+    assert tool_utils.sales_stats_store.cache.get("AN201")["total_count"] == 340
+
+
+def test_complaint_errors_and_data_only(couchbase, llm):
+    assert asyncio.run(tool_utils.ahandle_complaint("CUST0009", "AN201", "x", "key")) \
+        .startswith("Customer CUST0009 not found")
+    assert asyncio.run(tool_utils.ahandle_complaint("CUST0001", "AN202", "x", "key")) \
+        == "No purchase of AN202 found for customer CUST0001."
+    context = asyncio.run(tool_utils.ahandle_complaint("CUST0001", "AN201", "too quiet", "key", data_only=True))
+    assert "complained about AN201" in context
+    assert llm.prompts == []
+
+
+def test_purchase_is_written_with_acouchbase(couchbase, llm):
+    tool_utils.customer_cache.set("CUST0001", CUSTOMER)
+    answer = asyncio.run(tool_utils.amock_purchase("CUST0001", "AN202", "key"))
+    assert answer == "answer 1"
+    doc = couchbase.customers.docs["CUST0001"]
+    assert [p["style"] for p in doc["purchase_history"]] == ["AN201", "AN202"]
+    assert doc["num_purchases"] == 2 and doc["total_spent"] == 129.49
+    assert tool_utils.customer_cache.get("CUST0001") is None  # invalidated after the write
+
+
+def test_general_question_uses_the_response_cache(couchbase, llm, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(tool_utils, "response_cache", ResponseCache(maxsize=16, ttl=60, semantic=False))
+    first = asyncio.run(tool_utils.ahandle_general_question("CUST0001", None, "Is the AN201 waterproof?", "key"))
+    second = asyncio.run(tool_utils.ahandle_general_question("CUST0001", None, "is the AN201 waterproof", "key"))
+    assert first == second == "answer 1"
+    assert len(llm.prompts) == 1
+    assert "Ann" not in llm.prompts[0]  # the shared prompt leaves the customer out
+
+
+def test_executor_awaits_the_async_handlers_without_the_tool_pool(couchbase, llm, monkeypatch):
+    class NoPool:
+        def submit(self, *args, **kwargs):
+            raise AssertionError("coroutine tools must not go through the tool pool")
+    monkeypatch.setattr(tool_executor, "_pool", NoPool())
+    tools = {"handle_complaint": tool_utils.ahandle_complaint,
+             "handle_general_question": tool_utils.ahandle_general_question}
+    calls = [
+        {"id": "1", "function": {"name": "handle_complaint", "arguments": json.dumps(
+            {"customer_id": "CUST0001", "style": "AN201", "complaint": "too quiet"})}},
+        {"id": "2", "function": {"name": "handle_general_question", "arguments": json.dumps(
+            {"customer_id": "CUST0001", "style": "AN202", "question": "Is it in stock?"})}},
+    ]
+    executor = ToolExecutor(tools, "key", max_chars=10_000)
+    messages = asyncio.run(executor.arun(calls))
+    assert "complained about AN201" in messages[0]["content"]
+    assert "Is it in stock?" in messages[1]["content"]
+    assert asyncio.run(executor.acall(calls[0])) == "answer 1"
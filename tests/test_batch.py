@@ -0,0 +1,97 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from config import settings
+from routes import routes as routes_module
+from utils import batch
+
+JOBS = [{"customer_id": f"CUST{i:04d}", "style": "AN201", "complaint": f"complaint {i}"} for i in range(6)]
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path, fake_collection):
+    customers = {job["customer_id"]: {"customer_id": job["customer_id"], "name": f"Customer {i}",
+                                      "loyalty_level": "Gold", "preferred_category": "Audio",
+                                      "purchase_history": [{"style": "AN201"}]} for i, job in enumerate(JOBS)}
+    product = {"style": "AN201", "category": "Audio", "description": "Wireless headphones", "price": 79.99}
+    monkeypatch.setattr(batch, "customers_collection", fake_collection(customers))
+    monkeypatch.setattr(batch, "products_collection", fake_collection({"AN201": product}))
+    monkeypatch.setattr(batch, "get_similar_products", lambda category, style: [])
+    monkeypatch.setattr(settings, "BATCH_CHECKPOINT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BATCH_RATE_LIMIT_RPS", 0)
+    monkeypatch.setattr(routes_module, "agent", SimpleNamespace(api_key="key"))
+    app = Flask(__name__)
+    app.register_blueprint(routes_module.routes)
+    return app.test_client()
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    prompts = []
+
+    def complete(payload, api_key):
+        prompts.append(payload["messages"][0]["content"])
+        return {"choices": [{"message": {"content": f"message {len(prompts)}"}}]}
+    monkeypatch.setattr(batch, "chat_completion", complete)
+    return prompts
+
+
+def records(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_reposting_the_batch_id_resumes_from_the_checkpoint(client, monkeypatch, completions):
+    # The first run may only complete three jobs; a fourth one started before the client left fails
+    permits = threading.Semaphore(3)
+    complete = batch.chat_completion
+
+    def gated(payload, api_key):
+        if not permits.acquire(timeout=0.2):
+            raise RuntimeError("no permit")
+        return complete(payload, api_key)
+    monkeypatch.setattr(batch, "chat_completion", gated)
+
+    first = client.post("/retain/batch", json={"jobs": JOBS, "batch_id": "b1", "concurrency": 1}, buffered=False)
+    stream = iter(first.response)
+    received = [json.loads(next(stream)) for _ in range(2)]
+    first.close()  # the client went away: queued jobs are dropped, the running one is checkpointed
+    assert all(record["status"] == "ok" for record in received)
+    done = len(completions)
+    assert 2 <= done <= 3
+
+    monkeypatch.setattr(batch, "chat_completion", complete)
+
+    second = client.post("/retain/batch", json={"jobs": JOBS, "batch_id": "b1", "concurrency": 1})
+    assert second.headers["X-Batch-Id"] == "b1"
+    results = records(second)
+    assert sorted(record["index"] for record in results) == list(range(len(JOBS)))
+    assert sum(bool(record.get("resumed")) for record in results) == done
+    # Every job reached the model exactly once across both runs
+    assert len(completions) == len(JOBS)
+    assert sorted(completions) == sorted(set(completions))
+
+
+def test_failed_jobs_are_retried_on_resume(client, monkeypatch, completions):
+    def fail(payload, api_key):
+        raise RuntimeError("upstream went away")
+    monkeypatch.setattr(batch, "chat_completion", fail)
+    results = records(client.post("/retain/batch", json={"jobs": JOBS[:2], "batch_id": "b2"}))
+    assert {record["status"] for record in results} == {"failed"}
+
+    monkeypatch.setattr(batch, "chat_completion", lambda payload, api_key: completions.append(payload) or
+                        {"choices": [{"message": {"content": "ok"}}]})
+    results = records(client.post("/retain/batch", json={"jobs": JOBS[:2], "batch_id": "b2"}))
+    assert {record["status"] for record in results} == {"ok"}
+    assert not any(record.get("resumed") for record in results)
+
+
+@pytest.mark.parametrize("concurrency", ["many", None, 0, -2, 1.5, True, [4]])
+def test_invalid_concurrency_is_a_bad_request(client, completions, concurrency):
+    response = client.post("/retain/batch", json={"jobs": JOBS, "concurrency": concurrency})
+    assert response.status_code == 400
+    assert "concurrency" in response.get_json()["error"]
+    assert completions == []
@@ -0,0 +1,118 @@
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from utils import bulk_loader
+from utils.bulk_loader import BulkLoader, _iter_json_array, batched, iter_documents
+
+DOCUMENTS = [
+    {"customer_id": "CUST0001", "name": "Ann [\"quoted\"], with, commas", "purchase_history": [{"amount": 79.99}]},
+    {"customer_id": "CUST0002", "nested": {"deep": [[1, 2], {"k": "}]"}]}, "unicode": "café ☃"},
+    123456789,
+    -0.00125,
+    "a string with ] and , inside",
+    [1, [2, [3]]],
+    True,
+    None,
+    {"escape": "back\\\\slash \\\" quote", "empty": {}},
+]
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 5, 7, 11, 64, 1 << 20])
+def test_chunk_boundaries_anywhere(monkeypatch, chunk):
+    monkeypatch.setattr(bulk_loader, "READ_CHUNK", chunk)
+    text = json.dumps(DOCUMENTS, indent=1)
+    assert list(_iter_json_array(io.StringIO(text))) == DOCUMENTS
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 4, 6])
+def test_numbers_split_across_chunks(monkeypatch, chunk):
+    monkeypatch.setattr(bulk_loader, "READ_CHUNK", chunk)
+    # Each number could be cut short at a chunk boundary, e.g. 12345 read as 123
+    assert list(_iter_json_array(io.StringIO("[12345,678.5e2, 9]"))) == [12345, 67850.0, 9]
+
+
+@pytest.mark.parametrize("text", ["[]", "  [ ]  ", "\n[\n]\n"])
+def test_empty_array(monkeypatch, text):
+    monkeypatch.setattr(bulk_loader, "READ_CHUNK", 2)
+    assert list(_iter_json_array(io.StringIO(text))) == []
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError, match="Expected a JSON array"):
+        list(_iter_json_array(io.StringIO('{"customer_id": "CUST0001"}')))
+
+
+def test_truncated_input_raises(monkeypatch):
+    monkeypatch.setattr(bulk_loader, "READ_CHUNK", 4)
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_json_array(io.StringIO('[{"a": 1}, {"b": ')))
+
+
+def test_iter_documents_detects_the_format(tmp_path):
+    docs = [doc for doc in DOCUMENTS if isinstance(doc, dict)]
+    array = tmp_path / "customers.json"
+    array.write_text("\n  " + json.dumps(docs), encoding="utf-8")
+    lines = tmp_path / "customers.jsonl"
+    lines.write_text("\n".join(json.dumps(doc) for doc in docs) + "\n\n", encoding="utf-8")
+    assert list(iter_documents(str(array))) == docs
+    assert list(iter_documents(str(lines))) == docs
+
+
+def test_batched():
+    assert list(batched(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(batched([], 3)) == []
+
+
+class FlakyCollection:
+    """upsert_multi that raises for batches containing fail_key, or reports it as a per-key failure."""
+
+    def __init__(self, fail_key=None, per_key=False):
+        self.fail_key = fail_key
+        self.per_key = per_key
+        self.docs = {}
+        self.calls = 0
+
+    def upsert_multi(self, docs):
+        self.calls += 1
+        if self.fail_key in docs and not self.per_key:
+            raise TimeoutError("upsert_multi timed out")
+        failed = {key: TimeoutError("timed out") for key in docs if key == self.fail_key}
+        self.docs.update({key: doc for key, doc in docs.items() if key not in failed})
+        return SimpleNamespace(exceptions=failed)
+
+
+CUSTOMERS = [{"customer_id": f"CUST{i:04d}"} for i in range(50)]
+
+
+@pytest.mark.parametrize("per_key", [False, True])
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_resume_reloads_a_failed_batch(tmp_path, per_key, concurrency):
+    checkpoint = str(tmp_path / "load.ckpt")
+    flaky = FlakyCollection("CUST0023", per_key)
+    stats = BulkLoader(flaky, "customer_id", batch_size=10, concurrency=concurrency,
+                       checkpoint=checkpoint).load_documents(iter(CUSTOMERS), "customers.json")
+    assert stats.errors == (1 if per_key else 10)
+    assert "CUST0023" not in flaky.docs
+    with open(checkpoint) as f:
+        assert json.load(f)["documents"] == 20  # stops in front of the batch holding CUST0020-29
+
+    healthy = FlakyCollection()
+    resumed = BulkLoader(healthy, "customer_id", batch_size=10, concurrency=concurrency,
+                         checkpoint=checkpoint).load_documents(iter(CUSTOMERS), "customers.json")
+    assert resumed.skipped == 20
+    assert sorted(healthy.docs) == [doc["customer_id"] for doc in CUSTOMERS[20:]]
+    with open(checkpoint) as f:
+        assert json.load(f)["documents"] == 50
+
+
+def test_documents_without_a_key_do_not_block_the_checkpoint(tmp_path):
+    checkpoint = str(tmp_path / "load.ckpt")
+    documents = CUSTOMERS[:5] + [{"name": "no id"}] + CUSTOMERS[5:20]
+    stats = BulkLoader(FlakyCollection(), "customer_id", batch_size=10, concurrency=2,
+                       checkpoint=checkpoint).load_documents(iter(documents), "customers.json")
+    assert stats.errors == 1
+    with open(checkpoint) as f:
+        assert json.load(f)["documents"] == 21
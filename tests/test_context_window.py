@@ -0,0 +1,119 @@
+from agents.grok_agent import SimpleAgent
+from utils.context_window import ContextWindow
+from utils.prompts import estimate_tokens
+
+SYSTEM = "You are a sales assistant."
+
+
+def turn(i, words=20):
+    role = "user" if i % 2 == 0 else "assistant"
+    return {"role": role, "content": f"Turn {i} says hello. " + "filler " * words, "timestamp": f"{i:06d}"}
+
+
+def test_everything_fits_within_a_large_budget():
+    history = [turn(i) for i in range(4)]
+    messages, tokens, updated = ContextWindow(budget=10_000, max_messages=10).assemble(SYSTEM, history, "Hi", None)
+    assert [m["content"] for m in messages[1:-1]] == [t["content"] for t in history]
+    assert messages[0] == {"role": "system", "content": SYSTEM}
+    assert messages[-1] == {"role": "user", "content": "Hi"}
+    assert updated is None
+    assert tokens == sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def test_budget_keeps_the_newest_turns_in_order():
+    history = [turn(i) for i in range(8)]
+    per_turn = estimate_tokens(history[0]["content"])
+    budget = estimate_tokens(SYSTEM) + estimate_tokens("Hi") + 3 * per_turn + 1
+    messages, tokens, _ = ContextWindow(budget=budget, max_messages=10).assemble(SYSTEM, history, "Hi", None)
+    assert [m["content"] for m in messages[1:-1]] == [t["content"] for t in history[-3:]]
+    assert tokens <= budget
+
+
+def test_message_cap_and_truncation():
+    history = [turn(i) for i in range(6)] + [turn(6, words=1000)]
+    window = ContextWindow(budget=10_000, max_messages=3, message_max_tokens=50)
+    messages, _, _ = window.assemble(SYSTEM, history, "Hi", None)
+    kept = messages[2:-1]  # after the system prompt and the summary of the four older turns
+    assert len(kept) == 3
+    assert kept[-1]["content"].endswith("...")
+    assert len(kept[-1]["content"]) <= 50 * 4 + 3
+
+
+def test_older_turns_are_folded_into_the_summary():
+    history = [turn(i) for i in range(6)]
+    window = ContextWindow(budget=10_000, max_messages=2)
+    messages, _, updated = window.assemble(SYSTEM, history, "Hi", None)
+    assert updated["through"] == "000003"
+    assert updated["text"].split(" | ") == [f"{t['role']}: Turn {i} says hello." for i, t in enumerate(history[:4])]
+    assert messages[1] == {"role": "system", "content": f"Summary of the earlier conversation: {updated['text']}"}
+    assert [m["content"] for m in messages[2:-1]] == [t["content"] for t in history[-2:]]
+
+    # Nothing new beyond the window: the stored summary is used as is
+    _, _, again = window.assemble(SYSTEM, history, "Hi", updated)
+    assert again is None
+
+    # Two more turns push two more into the summary
+    history += [turn(6), turn(7)]
+    _, _, rolled = window.assemble(SYSTEM, history, "Hi", updated)
+    assert rolled["through"] == "000005"
+    assert rolled["text"].startswith(updated["text"] + " | ")
+
+
+def test_summary_keeps_the_most_recent_extracts_within_its_budget():
+    history = [turn(i) for i in range(40)]
+    window = ContextWindow(budget=10_000, max_messages=2, summary_max_tokens=30)
+    _, _, updated = window.assemble(SYSTEM, history, "Hi", None)
+    lines = updated["text"].split(" | ")
+    assert lines[-1] == "assistant: Turn 37 says hello."
+    assert len(lines) < 38
+    assert sum(estimate_tokens(line) + 1 for line in lines) <= 30
+
+
+class Store:
+    def __init__(self, history=None, fail_get=False, fail_set=False):
+        self.history = history or []
+        self.fail_get = fail_get
+        self.fail_set = fail_set
+        self.saved = None
+
+    def recent(self, customer_id, limit=10):
+        return self.history[-limit:]
+
+    def get(self, customer_id):
+        if self.fail_get:
+            raise ConnectionError("summary read failed")
+        return None
+
+    def set(self, customer_id, summary):
+        if self.fail_set:
+            raise ConnectionError("summary write failed")
+        self.saved = summary
+
+
+def agent_with(history, summaries):
+    agent = SimpleAgent()
+    agent.conversations = Store(history)
+    agent.summaries = summaries
+    agent.context = ContextWindow(budget=10_000, max_messages=2)
+    return agent
+
+
+def test_unreadable_summary_falls_back_to_the_window():
+    history = [turn(i) for i in range(6)]
+    messages = agent_with(history, Store(fail_get=True)).build_messages("CUST0001", "Hi")
+    # Built from the history alone; the extracts are recomputed from the turns that fell out
+    assert messages[1]["content"].startswith("Summary of the earlier conversation: user: Turn 0")
+    assert [m["content"] for m in messages[2:-1]] == [t["content"] for t in history[-2:]]
+
+
+def test_failed_summary_write_still_answers():
+    history = [turn(i) for i in range(6)]
+    messages = agent_with(history, Store(fail_set=True)).build_messages("CUST0001", "Hi")
+    assert messages[-1] == {"role": "user", "content": "Hi"}
+    assert len(messages) == 5
+
+
+def test_new_summary_is_saved():
+    summaries = Store()
+    agent_with([turn(i) for i in range(5)], summaries).build_messages("CUST0001", "Hi")
+    assert summaries.saved["through"] == "000002"
@@ -0,0 +1,102 @@
+import logging
+
+from utils.conversation_store import ARCHIVE_SEQ_PATH, HISTORY_PATH, LENGTH_PATH, ConversationStore, archive_key
+
+CUSTOMER = "CUST0001"
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def archived(collection, seq):
+    return contents(collection.docs[archive_key(CUSTOMER, seq)]["messages"])
+
+
+class RacingCollection:
+    """Wraps a FakeCollection; another turn is appended just before each of the first `races` CAS-guarded writes."""
+
+    def __init__(self, collection, races):
+        self.collection = collection
+        self.races = races
+        self.store = ConversationStore(collection, max_messages=10 ** 6)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def mutate_in(self, key, specs, options=None):
+        if options is not None and dict(options).get("cas") and self.races > 0:
+            self.races -= 1
+            self.store.append(key, "user", f"racing {self.races}")
+        return self.collection.mutate_in(key, specs, options)
+
+
+def test_append_and_recent(fake_collection):
+    store = ConversationStore(fake_collection())
+    for i in range(20):
+        store.append(CUSTOMER, "user" if i % 2 == 0 else "assistant", f"turn {i}")
+    # More than MAX_LOOKUP_SPECS entries, so the read is split across lookups
+    assert contents(store.recent(CUSTOMER, limit=18)) == [f"turn {i}" for i in range(2, 20)]
+    assert contents(store.recent(CUSTOMER, limit=50)) == [f"turn {i}" for i in range(20)]
+    assert store.collection.docs[CUSTOMER][LENGTH_PATH] == 20
+    assert store.recent("CUST9999") == []
+
+
+def test_history_is_capped_by_archiving_the_oldest_messages(fake_collection):
+    collection = fake_collection({CUSTOMER: {"customer_id": CUSTOMER, "name": "Ann"}})
+    store = ConversationStore(collection, max_messages=5, archive_batch=3)
+    for i in range(12):
+        store.append(CUSTOMER, "user", f"turn {i}")
+
+    doc = collection.docs[CUSTOMER]
+    assert doc["name"] == "Ann"
+    assert len(doc[HISTORY_PATH]) <= 5 and doc[LENGTH_PATH] == len(doc[HISTORY_PATH])
+    assert doc[ARCHIVE_SEQ_PATH] == 3
+    assert archived(collection, 0) == ["turn 0", "turn 1", "turn 2"]
+    assert archived(collection, 1) == ["turn 3", "turn 4", "turn 5"]
+    # Nothing lost or duplicated across the archives and the live array
+    assert sum((archived(collection, seq) for seq in range(3)), []) + contents(doc[HISTORY_PATH]) \
+        == [f"turn {i}" for i in range(12)]
+
+
+def test_archiving_retries_after_a_cas_mismatch(fake_collection):
+    inner = fake_collection()
+    collection = RacingCollection(inner, races=2)
+    store = ConversationStore(collection, max_messages=4, archive_batch=2, archive_retries=3)
+    for i in range(5):
+        store.append(CUSTOMER, "user", f"turn {i}")
+
+    doc = inner.docs[CUSTOMER]
+    # Two concurrent turns landed between the read and the trim; the third attempt won
+    assert collection.races == 0
+    assert doc[ARCHIVE_SEQ_PATH] == 1
+    assert archived(inner, 0) == ["turn 0", "turn 1"]
+    assert contents(doc[HISTORY_PATH]) == ["turn 2", "turn 3", "turn 4", "racing 1", "racing 0"]
+    assert doc[LENGTH_PATH] == 5
+
+
+def test_archiving_gives_up_without_losing_messages(fake_collection, caplog):
+    inner = fake_collection()
+    collection = RacingCollection(inner, races=3)
+    store = ConversationStore(collection, max_messages=4, archive_batch=2, archive_retries=3)
+    with caplog.at_level(logging.WARNING, logger="utils.conversation_store"):
+        for i in range(5):
+            store.append(CUSTOMER, "user", f"turn {i}")
+    assert "Gave up archiving" in caplog.text
+
+    doc = inner.docs[CUSTOMER]
+    assert ARCHIVE_SEQ_PATH not in doc
+    assert contents(doc[HISTORY_PATH]) == [f"turn {i}" for i in range(5)] + ["racing 2", "racing 1", "racing 0"]
+
+    # The next turn archives under the same seq, overwriting the copy written before the failed trim
+    store.append(CUSTOMER, "user", "turn 5")
+    assert inner.docs[CUSTOMER][ARCHIVE_SEQ_PATH] == 1
+    assert archived(inner, 0) == ["turn 0", "turn 1"]
+    # One batch per turn: the backlog is worked off over the following turns
+    for i in range(6, 9):
+        store.append(CUSTOMER, "user", f"turn {i}")
+    doc = inner.docs[CUSTOMER]
+    assert len(doc[HISTORY_PATH]) <= 4
+    everything = sum((archived(inner, seq) for seq in range(doc[ARCHIVE_SEQ_PATH])), []) + contents(doc[HISTORY_PATH])
+    assert sorted(everything) == sorted([f"turn {i}" for i in range(9)] + ["racing 2", "racing 1", "racing 0"])
+    assert len(everything) == len(set(everything))
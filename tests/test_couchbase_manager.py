@@ -0,0 +1,52 @@
+import time
+
+from config import settings
+from utils.couchbase_manager import CouchbaseManager
+
+
+class FakeCluster:
+    def __init__(self):
+        self.closed = False
+
+    def wait_until_ready(self, *args):
+        pass
+
+    def bucket(self, name):
+        return self
+
+    def default_collection(self):
+        return object()
+
+    def close(self):
+        self.closed = True
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def test_status_reconnects_after_close(monkeypatch):
+    monkeypatch.setattr(settings, "COUCHBASE_RETRY_INTERVAL", 0.01)
+    manager = CouchbaseManager()
+    clusters = []
+
+    def connect():
+        if manager._cluster is None:
+            manager._cluster = FakeCluster()
+            clusters.append(manager._cluster)
+        return manager._cluster
+    monkeypatch.setattr(manager, "cluster", connect)
+
+    manager.start()
+    assert wait_until(manager.ready)
+    assert manager.status()["status"] == "ready"
+
+    manager.close()
+    assert clusters[0].closed
+    assert not manager.ready() and manager.connect_seconds is None
+    # Before close() reset the connect thread, status() stayed "connecting" for good
+    assert wait_until(lambda: manager.status()["status"] == "ready")
+    assert len(clusters) == 2
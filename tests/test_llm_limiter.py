@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.llm_limiter import AdaptiveLimiter, LLMOverloadedError, parse_seconds
+
+
+def limiter(name, **kwargs):
+    options = dict(initial=1, min_limit=1, max_limit=16, backoff=0.5, queue_max=8, queue_timeout=1.0)
+    options.update(kwargs)
+    return AdaptiveLimiter(f"test_{name}", **options)
+
+
+def test_sheds_when_queue_is_full():
+    lim = limiter("queue_full", queue_max=0)
+    slot = lim.acquire()
+    with pytest.raises(LLMOverloadedError) as raised:
+        lim.acquire()
+    assert "queue full" in str(raised.value)
+    assert raised.value.retry_after >= 1
+    assert lim.stats()["shed"] == 1
+    lim.release(slot, 200)
+    lim.release(lim.acquire(), 200)
+
+
+def test_sheds_after_queue_timeout():
+    lim = limiter("timeout", queue_timeout=0.05)
+    slot = lim.acquire()
+    start = time.monotonic()
+    with pytest.raises(LLMOverloadedError, match="queue timeout"):
+        lim.acquire()
+    assert 0.04 <= time.monotonic() - start < 0.5
+    assert lim.stats()["queued"] == 0
+    lim.release(slot, 200)
+
+
+def test_waiter_gets_the_released_slot():
+    lim = limiter("handoff")
+    slot = lim.acquire()
+    threading.Timer(0.05, lim.release, args=(slot, 200)).start()
+    lim.release(lim.acquire(), 200)
+    assert lim.stats()["admitted"] == 2
+
+
+def test_429_cuts_the_limit_once_per_round():
+    lim = limiter("cut", initial=8)
+    slots = [lim.acquire() for _ in range(4)]
+    lim.release(slots[0], 429)
+    assert lim.stats()["limit"] == 4
+    # Started before the cut: the same overload, not a new one
+    lim.release(slots[1], 429)
+    assert lim.stats()["limit"] == 4
+    assert lim.stats()["rate_limited"] == 2
+    lim.release(lim.acquire(), 503)
+    assert lim.stats()["limit"] == 2
+    lim.release(slots[2], None)
+    lim.release(slots[3], 500)
+    assert lim.stats()["limit"] == 2
+
+
+def test_only_2xx_grows_the_limit():
+    lim = limiter("grow", initial=2)
+    for status in (None, 400, 500):
+        lim.release(lim.acquire(), status)
+    assert lim.limit == 2
+    lim.release(lim.acquire(), 200)
+    assert lim.limit == pytest.approx(2.5)
+
+
+def test_pauses_when_remaining_requests_reach_zero():
+    lim = limiter("pause", initial=4)
+    lim.release(lim.acquire(), 200, {"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "150ms"})
+    assert lim.stats()["paused_for"] > 0
+    start = time.monotonic()
+    lim.release(lim.acquire(), 200)
+    assert time.monotonic() - start >= 0.1
+
+
+def test_sheds_when_pause_outlasts_the_deadline():
+    lim = limiter("long_pause", initial=4, queue_timeout=0.5)
+    lim.release(lim.acquire(), 429, {"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "6m0s"})
+    with pytest.raises(LLMOverloadedError) as raised:
+        lim.acquire()
+    assert raised.value.retry_after >= 350
+
+
+def test_remaining_requests_above_zero_does_not_pause():
+    lim = limiter("no_pause", initial=4)
+    lim.release(lim.acquire(), 200, {"x-ratelimit-remaining-requests": "3", "x-ratelimit-reset-requests": "10s"})
+    assert lim.stats()["paused_for"] == 0
+
+
+def test_async_and_threads_share_slots():
+    lim = limiter("shared")
+    slot = lim.acquire()
+
+    async def main():
+        threading.Timer(0.05, lim.release, args=(slot, 200)).start()
+        started = await lim.acquire_async()
+        assert lim.stats()["in_flight"] == 1
+        lim.release(started, 429)
+
+    asyncio.run(main())
+    assert lim.stats()["rate_limited"] == 1
+    assert lim.stats()["in_flight"] == 0
+
+
+def test_async_sheds_after_queue_timeout():
+    lim = limiter("async_timeout", queue_timeout=0.05)
+    slot = lim.acquire()
+    with pytest.raises(LLMOverloadedError, match="queue timeout"):
+        asyncio.run(lim.acquire_async())
+    assert lim.stats()["queued"] == 0
+    lim.release(slot, 200)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("12", 12.0), ("1.5", 1.5), ("250ms", 0.25), ("6m0s", 360.0), ("1h2m", 3720.0),
+    (None, None), ("", None), ("Wed, 21 Oct 2015 07:28:00 GMT", None), ("5x", None),
+])
+def test_parse_seconds(value, seconds):
+    assert parse_seconds(value) == seconds
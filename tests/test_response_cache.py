@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from config import settings
+import utils.tool_utils as tool_utils
+from utils.response_cache import ResponseCache, product_fingerprint
+
+
+CUSTOMER = {"customer_id": "CUST0001", "loyalty_level": "Gold", "preferred_category": "Audio"}
+
+
+@pytest.fixture
+def general_question(monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(tool_utils, "get_customer", lambda customer_id: CUSTOMER)
+    monkeypatch.setattr(tool_utils, "get_product", lambda style: None)
+    monkeypatch.setattr(tool_utils, "_prepare_general_question", lambda *args, **kwargs: ("prompt", None))
+    monkeypatch.setattr(tool_utils, "response_cache", ResponseCache(maxsize=16, ttl=60, semantic=False))
+
+
+def cached(question):
+    return tool_utils.response_cache.get(question, None, "Audio", "Gold", product_fingerprint(None))
+
+
+def reply(text):
+    return lambda payload, api_key: {"choices": [{"message": {"content": text}}]}
+
+
+def test_failed_completion_is_not_cached(general_question, monkeypatch):
+    def fail(payload, api_key):
+        raise RuntimeError("upstream went away")
+    monkeypatch.setattr(tool_utils, "chat_completion", fail)
+    assert tool_utils.handle_general_question("CUST0001", None, "what is new?", "key").startswith("Error")
+    assert cached("what is new?") is None
+
+
+def test_answer_starting_with_error_is_still_cached(general_question, monkeypatch):
+    monkeypatch.setattr(tool_utils, "chat_completion", reply("Error codes are listed in the manual."))
+    assert tool_utils.handle_general_question("CUST0001", None, "what do the codes mean?", "key") \
+        == "Error codes are listed in the manual."
+    assert cached("what do the codes mean?") == "Error codes are listed in the manual."
+
+
+def test_interrupted_stream_is_not_cached(general_question, monkeypatch):
+    def stream(payload, api_key):
+        yield "The AN201 "
+        raise RuntimeError("connection reset")
+    monkeypatch.setattr(tool_utils, "stream_chat_completion", stream)
+    chunks = list(tool_utils.handle_general_question("CUST0001", None, "is it loud?", "key", stream=True))
+    assert chunks[0] == "The AN201 " and chunks[-1].startswith("Error")
+    assert cached("is it loud?") is None
+
+
+def test_completed_stream_is_cached(general_question, monkeypatch):
+    monkeypatch.setattr(tool_utils, "stream_chat_completion", lambda payload, api_key: iter(["Very ", "loud."]))
+    assert "".join(tool_utils.handle_general_question("CUST0001", None, "is it loud?", "key", stream=True)) \
+        == "Very loud."
+    assert cached("is it loud?") == "Very loud."
+    monkeypatch.setattr(tool_utils, "stream_chat_completion", None)
+    assert list(tool_utils.handle_general_question("CUST0001", None, "is it loud?", "key", stream=True)) \
+        == ["Very loud."]
+
+
+class WordEncoder:
+    """Unit vectors from a hash of each word, so questions sharing words are similar."""
+
+    def encode(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.zeros(64)
+            for word in text.split():
+                vector[hash(word) % 64] += 1.0
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors
+
+
+def semantic_cache(**kwargs):
+    options = dict(maxsize=4, ttl=60, semantic=True, threshold=0.99, bucket_size=4)
+    options.update(kwargs)
+    cache = ResponseCache(**options)
+    cache._encoder = WordEncoder()
+    return cache
+
+
+def test_semantic_vectors_are_bounded_by_the_cache_size():
+    cache = semantic_cache()
+    for tier in range(10):
+        cache.set("is it waterproof", "AN201", "Audio", f"tier{tier}", None, "Yes.")
+    stats = cache.stats()
+    assert stats["semantic_vectors"] == 4 and stats["semantic_buckets"] == 4
+    # The least recently written buckets went first
+    assert cache.get("is it waterproof?", "AN201", "Audio", "tier9", None) == "Yes."
+    assert cache._vectors.get(("AN201", "Audio", "tier0")) is None
+
+
+def test_semantic_bucket_is_dropped_when_its_answer_expires():
+    cache = semantic_cache(ttl=0)
+    cache.set("is it waterproof", "AN201", "Audio", "Gold", None, "Yes.")
+    assert cache.stats()["semantic_buckets"] == 1
+    assert cache.get("Is it waterproof?!", "AN201", "Audio", "Gold", None) is None
+    assert cache.stats()["semantic_buckets"] == 0 and cache.stats()["semantic_vectors"] == 0
+
+
+def test_semantic_hit_for_a_paraphrase():
+    cache = semantic_cache(threshold=0.5)
+    cache.set("is the AN201 waterproof", "AN201", "Audio", "Gold", None, "Yes.")
+    assert cache.get("is AN201 waterproof", "AN201", "Audio", "Gold", None) == "Yes."
+    assert cache.semantic_hits == 1
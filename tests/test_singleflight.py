@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.llm_limiter import LLMOverloadedError
+from utils.singleflight import AsyncSingleFlight, SingleFlight, render_flights, request_key
+
+CALLERS = 8
+
+
+def wait_for_followers(flight, count):
+    deadline = time.monotonic() + 5
+    while flight.stats()["coalesced"] < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test_do")
+    release = threading.Event()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        release.wait(5)
+        return {"choices": [{"message": {"content": "hi"}}]}
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(flight.do, "key", upstream) for _ in range(CALLERS)]
+        wait_for_followers(flight, CALLERS - 1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert all(result == results[0] for result in results)
+    # Followers get copies, so one caller mutating its result can't affect another
+    assert len({id(result) for result in results}) == CALLERS
+    assert flight.stats() == {"size": 0, "leaders": 1, "coalesced": CALLERS - 1, "wait_timeouts": 0, "shared_errors": 0}
+
+
+def test_error_is_shared_with_every_caller():
+    flight = SingleFlight("test_error")
+    release = threading.Event()
+
+    def upstream():
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(flight.do, "key", upstream) for _ in range(CALLERS)]
+        wait_for_followers(flight, CALLERS - 1)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="upstream failed"):
+                future.result()
+    assert flight.stats()["shared_errors"] == CALLERS - 1
+    # Nothing is cached: the next call goes upstream again
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_follower_times_out():
+    flight = SingleFlight("test_timeout", wait_timeout=0.05)
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("key", lambda: release.wait(5)))
+    leader.start()
+    wait_deadline = time.monotonic() + 5
+    while flight.stats()["size"] == 0 and time.monotonic() < wait_deadline:
+        time.sleep(0.005)
+    with pytest.raises(TimeoutError):
+        flight.do("key", lambda: "unused")
+    release.set()
+    leader.join()
+    assert flight.stats()["wait_timeouts"] == 1
+
+
+def test_followers_get_their_own_copy_of_the_error():
+    flight = SingleFlight("test_error_copy")
+    release = threading.Event()
+
+    def upstream():
+        release.wait(5)
+        raise LLMOverloadedError("upstream saturated", retry_after=7)
+
+    def call():
+        try:
+            flight.do("key", upstream)
+        except LLMOverloadedError as e:
+            return e
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(call) for _ in range(3)]
+        wait_for_followers(flight, 2)
+        release.set()
+        errors = [future.result() for future in futures]
+
+    assert len({id(error) for error in errors}) == 3
+    assert all(error.retry_after == 7 and str(error) == "upstream saturated" for error in errors)
+    original = [error for error in errors if error.__cause__ is None]
+    assert len(original) == 1
+    assert all(error.__cause__ is original[0] for error in errors if error is not original[0])
+
+
+def test_leader_is_not_timed_out():
+    flight = SingleFlight("test_leader_timeout", wait_timeout=0.02)
+    assert flight.do("key", lambda: time.sleep(0.1) or "slow") == "slow"
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "slow"
+    assert asyncio.run(AsyncSingleFlight("test_async_leader_timeout", wait_timeout=0.02).do("key", slow)) == "slow"
+
+
+def test_async_follower_times_out():
+    flight = AsyncSingleFlight("test_async_timeout", wait_timeout=0.02)
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "slow"
+
+    async def main():
+        return await asyncio.gather(flight.do("key", slow), flight.do("key", slow), return_exceptions=True)
+
+    leader, follower = asyncio.run(main())
+    assert leader == "slow"
+    assert isinstance(follower, TimeoutError)
+    assert flight.stats()["wait_timeouts"] == 1
+
+
+def test_stream_follower_waits_for_slow_chunks_once_started():
+    flight = SingleFlight("test_stream_gap", wait_timeout=0.05)
+
+    def upstream():
+        yield "first"
+        time.sleep(0.15)  # longer than wait_timeout between chunks
+        yield " second"
+
+    streams = [flight.stream("key", upstream) for _ in range(2)]
+    assert ["".join(stream) for stream in streams] == ["first second"] * 2
+    assert flight.stats()["wait_timeouts"] == 0
+
+
+def test_stream_follower_times_out_waiting_for_the_first_chunk():
+    flight = SingleFlight("test_stream_first_chunk", wait_timeout=0.05)
+    release = threading.Event()
+
+    def upstream():
+        release.wait(5)
+        yield "late"
+
+    leader = flight.stream("key", upstream)
+    with pytest.raises(TimeoutError):
+        list(flight.stream("key", upstream))
+    release.set()
+    assert list(leader) == ["late"]
+
+
+def test_stream_fans_out_every_chunk():
+    flight = SingleFlight("test_stream")
+    release = threading.Event()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        yield "Hel"
+        release.wait(5)
+        yield "lo"
+        yield "!"
+
+    streams = [flight.stream("key", upstream) for _ in range(3)]
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(lambda s: "".join(s), stream) for stream in streams]
+        release.set()
+        assert [future.result() for future in futures] == ["Hello!"] * 3
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 2
+
+
+def test_stream_error_reaches_subscribers_after_the_chunks():
+    flight = SingleFlight("test_stream_error")
+
+    def upstream():
+        yield "partial"
+        raise ConnectionError("dropped")
+
+    streams = [flight.stream("key", upstream) for _ in range(2)]
+    for stream in streams:
+        received = []
+        with pytest.raises(ConnectionError):
+            for chunk in stream:
+                received.append(chunk)
+        assert received == ["partial"]
+
+
+def test_async_callers_share_one_call():
+    flight = AsyncSingleFlight("test_async")
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"content": "hi"}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", upstream) for _ in range(CALLERS)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [{"content": "hi"}] * CALLERS
+    assert flight.stats()["coalesced"] == CALLERS - 1
+
+
+def test_async_error_is_shared():
+    flight = AsyncSingleFlight("test_async_error")
+
+    async def upstream():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", upstream) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+    assert flight.stats()["shared_errors"] == 2
+
+
+def test_request_key_ignores_key_order_but_not_the_api_key():
+    payload = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    reordered = {"messages": [{"content": "hi", "role": "user"}], "model": "m"}
+    assert request_key(payload, "key-a") == request_key(reordered, "key-a")
+    assert request_key(payload, "key-a") != request_key(payload, "key-b")
+    assert request_key(payload, "key-a") != request_key(payload, "key-a", stream=True)
+
+
+def test_metrics_family():
+    SingleFlight("test_metrics").do("key", lambda: 1)
+    lines = render_flights()
+    assert 'llm_singleflight_leaders_total{flight="test_metrics"} 1' in lines
+    assert 'llm_singleflight_size{flight="test_metrics"} 0' in lines
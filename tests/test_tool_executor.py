@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from agents.tool_executor import ToolExecutor
+
+
+def tool_call(name, call_id=None, **arguments):
+    return {"id": call_id or f"call_{name}", "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()  # let timed-out tools still parked in the pool finish
+
+
+@pytest.fixture
+def purchases():
+    return []
+
+
+@pytest.fixture
+def tools(release, purchases):
+
+    def lookup(style: str, api_key: str, data_only: bool = False):
+        return {"style": style, "api_key": api_key, "data_only": data_only}
+
+    def slow_lookup(style: str):
+        release.wait(5)
+        return f"late {style}"
+
+    def mock_purchase(customer_id: str, style: str):
+        time.sleep(0.15)
+        purchases.append((customer_id, style))
+        return f"Purchased {style}"
+
+    def chatty():
+        return "x" * 100
+
+    async def async_lookup(style: str, data_only: bool = False):
+        await asyncio.sleep(0)
+        return f"async {style} data_only={data_only}"
+
+    async def async_slow(style: str):
+        await asyncio.sleep(5)
+
+    async def async_purchase(style: str):
+        await asyncio.sleep(0.15)
+        purchases.append(("async", style))
+        return f"Purchased {style}"
+
+    return {f.__name__: f for f in (lookup, slow_lookup, mock_purchase, chatty, async_lookup, async_slow, async_purchase)}
+
+
+def executor(tools, **kwargs):
+    options = dict(timeout=0.05, max_chars=40, no_timeout=("mock_purchase", "async_purchase"))
+    options.update(kwargs)
+    return ToolExecutor(tools, "secret", **options)
+
+
+def test_run_keeps_call_order_and_passes_api_key_and_data_only(tools):
+    messages = executor(tools, max_chars=1000).run([tool_call("lookup", style="AN201"), tool_call("chatty")])
+    assert [m["tool_call_id"] for m in messages] == ["call_lookup", "call_chatty"]
+    assert json.loads(messages[0]["content"]) == {"style": "AN201", "api_key": "secret", "data_only": True}
+    assert messages[1]["content"] == "x" * 100
+
+
+def test_run_times_out_a_slow_tool_without_holding_the_others(tools):
+    start = time.perf_counter()
+    calls = [tool_call("slow_lookup", style="AN201"), tool_call("lookup", style="AN202")]
+    messages = executor(tools, max_chars=1000).run(calls)
+    assert time.perf_counter() - start < 1
+    assert messages[0]["content"] == "Error: tool slow_lookup timed out after 0.05s"
+    assert json.loads(messages[1]["content"])["style"] == "AN202"
+
+
+def test_run_always_waits_for_tools_that_write(tools, purchases):
+    messages = executor(tools).run([tool_call("mock_purchase", customer_id="CUST0001", style="AN201")])
+    assert messages[0]["content"] == "Purchased AN201"
+    assert purchases == [("CUST0001", "AN201")]
+
+
+def test_results_are_truncated(tools):
+    content = executor(tools).run([tool_call("chatty")])[0]["content"]
+    assert content == "x" * 40 + "... [truncated]"
+    # Structured results are JSON-encoded before the cap
+    content = executor(tools, max_chars=10).run([tool_call("lookup", style="AN201")])[0]["content"]
+    assert content == json.dumps({"style": "AN201"})[:10] + "... [truncated]"
+
+
+def test_bad_calls_become_error_messages(tools):
+    broken = {"id": "call_bad", "function": {"name": "lookup", "arguments": "{not json"}}
+    messages = executor(tools).run([broken, tool_call("missing")])
+    assert messages[0]["content"] == "Error: tool arguments are not valid JSON"
+    assert messages[1]["content"] == "Error: unknown tool missing"
+
+
+def test_arun_times_out_sync_and_async_tools(tools):
+    calls = [tool_call("slow_lookup", style="AN201"), tool_call("async_slow", style="AN202"),
+             tool_call("async_lookup", style="AN203"), tool_call("chatty")]
+    messages = asyncio.run(executor(tools).arun(calls))
+    assert messages[0]["content"] == "Error: tool slow_lookup timed out after 0.05s"
+    assert messages[1]["content"] == "Error: tool async_slow timed out after 0.05s"
+    assert messages[2]["content"] == "async AN203 data_only=True"
+    assert messages[3]["content"] == "x" * 40 + "... [truncated]"
+
+
+def test_arun_always_waits_for_tools_that_write(tools, purchases):
+    calls = [tool_call("async_purchase", style="AN201"), tool_call("mock_purchase", customer_id="CUST0001", style="AN202")]
+    messages = asyncio.run(executor(tools).arun(calls))
+    assert [m["content"] for m in messages] == ["Purchased AN201", "Purchased AN202"]
+    assert sorted(purchases) == [("CUST0001", "AN202"), ("async", "AN201")]
+
+
+def test_single_calls_make_their_own_completion(tools):
+    ex = executor(tools)
+    assert ex.call(tool_call("lookup", style="AN201"))["data_only"] is False
+    assert list(ex.call(tool_call("chatty"), stream=True)) == ["x" * 100]  # single calls aren't truncated
+    assert asyncio.run(ex.acall(tool_call("async_lookup", style="AN201"))) == "async AN201 data_only=False"